@@ -144,6 +144,27 @@ DATABASES = {
 # }
 
 
+"""
+    Cache, shared by every process: the version stamps of Core.caching and what is built against them
+    (search index, question graphs, bundles, representations, display names) only reach the other
+    gunicorn workers and the management commands through it. Set CACHE_LOCATION to a memcached server,
+    "memcached:11211" in docker-compose; without it each process has a private in-memory cache.
+"""
+CACHE_LOCATION = os.environ.get('CACHE_LOCATION')
+if CACHE_LOCATION:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+            'LOCATION': CACHE_LOCATION,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -172,6 +193,11 @@ REST_FRAMEWORK = {
         # 'rest_framework.authentication.SessionAuthentication',
         # 'rest_framework.authentication.BasicAuthentication',
     ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'Core.api.renderers.OrjsonRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+        'Core.api.renderers.MessagePackRenderer',
+    ),
     # 'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
     # 'DEFAULT_PAGINATION_CLASS': 'hedju.HeaderPageNumberPagination',
     # 'PAGE_SIZE': 10,
@@ -5,7 +5,7 @@ from .models import Clinic, Checkup, ClinicGroup, QuestionOption, QuestionOption
     ClinicInfo, PatientProfile, Doctor, Supervisor, Organ, Alert, User, QuestionShareMedia, QuestionAnswer, \
     MediaCategory, MedicalRecord, PatientBiography, Job, Illness, PatientIllness, PatientJob, PatientFamilyIllness, \
     Drug, DrugInstruction, DrugAmount, PatientDrug, ClinicCheckup, CheckupFlowchart, Interpretation, Suggestion, \
-    RealClinic, RealDoctor, CheckupAnalyze
+    RealClinic, RealDoctor, CheckupAnalyze, CheckupResult, ClinicCheckupVersion
 
 
 admin.site.register(Organ, DraggableMPTTAdmin)
@@ -21,6 +21,15 @@ admin.site.register(CheckupFlowchart)
 admin.site.register(CheckupAnalyze)
 admin.site.register(Interpretation)
 admin.site.register(Suggestion)
+admin.site.register(CheckupResult)
+
+
+@admin.register(ClinicCheckupVersion)
+class ClinicCheckupVersionAdmin(admin.ModelAdmin):
+    list_display = ("clinic_checkup", "number", "etag", "created_on")
+    readonly_fields = ("clinic_checkup", "number", "etag", "created_on")
+    exclude = ("blob",)
+
 
 # @admin.register(Person)
 # class PersonAdmin(admin.ModelAdmin):
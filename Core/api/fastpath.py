@@ -0,0 +1,111 @@
+from django.core.exceptions import ValidationError
+from django.http import Http404
+from rest_framework import ISO_8601, permissions, serializers
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from Core.api.fieldsets import SparseFieldsetMixin
+
+# Fields whose to_representation returns database values of these columns unchanged.
+IDENTITY_FIELDS = (
+    serializers.IntegerField, serializers.CharField, serializers.BooleanField, serializers.FloatField,
+    serializers.PrimaryKeyRelatedField, serializers.ReadOnlyField, serializers.SerializerMethodField,
+)
+
+
+def _datetime_converter(field):
+    """
+    DateTimeField.to_representation of aware ISO 8601 values with the timezone looked up once.
+    """
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    field_timezone = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+    if output_format is None or output_format.lower() != ISO_8601 or field_timezone is None:
+        return field.to_representation
+
+    def convert(value):
+        if value.tzinfo is None:
+            return field.to_representation(value)
+        value = value.astimezone(field_timezone).isoformat()
+        return value[:-6] + 'Z' if value.endswith('+00:00') else value
+    return convert
+
+
+class ValuesListMixin(SparseFieldsetMixin):
+    """
+    Read-only fast path for list and retrieve of flat reference data: rows are read with values_list
+    and handed to the renderer as dicts, without model instances or per-field serializer calls.
+
+    ``values_fields`` maps every output field to a column lookup or expression, by default the
+    serializer ``Meta.fields`` read as columns, less the fields a sparse fieldset drops. Retrieve
+    takes the regular path on viewsets with object level permissions, which need the instance.
+    """
+    values_fields = None
+
+    def has_object_permissions(self):
+        return any(
+            type(permission).has_object_permission is not permissions.BasePermission.has_object_permission
+            for permission in self.get_permissions()
+        )
+
+    def get_values_fields(self):
+        if self.values_fields is not None:
+            return self.values_fields
+        return {name: name for name in self.get_serializer_class().Meta.fields}
+
+    def get_values_converters(self, names):
+        fields = self.get_serializer().fields
+        converters = []
+        for i, name in enumerate(names):
+            field = fields.get(name)
+            if isinstance(field, serializers.DateTimeField):
+                converters.append((i, _datetime_converter(field)))
+            elif field is not None and not isinstance(field, IDENTITY_FIELDS):
+                converters.append((i, field.to_representation))
+        return converters
+
+    def values_rows(self, queryset):
+        fields = self.get_values_fields()
+        if self.sparse_fieldset is not None:
+            serialized = self.get_serializer().fields
+            fields = {name: lookup for name, lookup in fields.items() if name in serialized}
+        names = list(fields)
+        converters = self.get_values_converters(names)
+        rows = queryset.select_related(None).prefetch_related(None).values_list(*fields.values())
+        return names, converters, rows
+
+    @staticmethod
+    def values_data(names, converters, rows):
+        if not converters:
+            return [dict(zip(names, row)) for row in rows]
+        data = []
+        for row in rows:
+            row = list(row)
+            for i, convert in converters:
+                if row[i] is not None:
+                    row[i] = convert(row[i])
+            data.append(dict(zip(names, row)))
+        return data
+
+    def list(self, request, *args, **kwargs):
+        names, converters, rows = self.values_rows(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(self.values_data(names, converters, page))
+        return Response(self.values_data(names, converters, rows))
+
+    def retrieve(self, request, *args, **kwargs):
+        if self.has_object_permissions():
+            return super().retrieve(request, *args, **kwargs)
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            # as rest_framework.generics.get_object_or_404, a malformed lookup value is not found
+            queryset = self.filter_queryset(self.get_queryset()).filter(
+                **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+            )
+        except (TypeError, ValueError, ValidationError):
+            raise Http404
+        names, converters, rows = self.values_rows(queryset)
+        data = self.values_data(names, converters, rows[:1])
+        if not data:
+            raise Http404
+        return Response(data[0])
@@ -0,0 +1,118 @@
+from rest_framework import permissions, serializers
+
+FIELDS_PARAM = 'fields'
+OMIT_PARAM = 'omit'
+EXPAND_PARAM = 'expand'
+
+
+def parse_fieldset(value):
+    """
+    Parses "id,title,options.title" into the tree {"id": {}, "title": {}, "options": {"title": {}}}.
+    """
+    tree = {}
+    for name in value.split(','):
+        name = name.strip()
+        if not name:
+            continue
+        node = tree
+        for part in name.split('.'):
+            node = node.setdefault(part, {})
+    return tree
+
+
+def _serializer_fields(serializer, path):
+    if isinstance(serializer, serializers.ListSerializer):
+        serializer = serializer.child
+    if not isinstance(serializer, serializers.Serializer):
+        raise serializers.ValidationError({'fields': f'{path} has no nested fields'})
+    return serializer.fields
+
+
+def _unknown(fields, tree, param, prefix):
+    unknown = [prefix + name for name in tree if name not in fields]
+    if unknown:
+        raise serializers.ValidationError({param: 'Unknown fields: ' + ', '.join(unknown)})
+
+
+def keep_fields(serializer, tree, prefix=''):
+    """
+    Drops every field of ``serializer`` not in ``tree``, recursing into nested serializers named with
+    a sub-tree.
+    """
+    fields = _serializer_fields(serializer, prefix.rstrip('.'))
+    _unknown(fields, tree, FIELDS_PARAM, prefix)
+    for name in list(fields):
+        if name not in tree:
+            fields.pop(name)
+        elif tree[name]:
+            keep_fields(fields[name], tree[name], f'{prefix}{name}.')
+
+
+def omit_fields(serializer, tree, prefix=''):
+    """
+    Drops the leaves of ``tree`` from ``serializer``.
+    """
+    fields = _serializer_fields(serializer, prefix.rstrip('.'))
+    _unknown(fields, tree, OMIT_PARAM, prefix)
+    for name, subtree in tree.items():
+        if subtree:
+            omit_fields(fields[name], subtree, f'{prefix}{name}.')
+        else:
+            fields.pop(name)
+
+
+def expand_fields(serializer, tree, prefix=''):
+    """
+    Replaces the related fields named in ``tree`` by the serializers of the related objects, from
+    ``expanded_field`` of the serializer, expanding them in turn with their sub-tree.
+    """
+    fields = _serializer_fields(serializer, prefix.rstrip('.'))
+    child = serializer.child if isinstance(serializer, serializers.ListSerializer) else serializer
+    for name, subtree in tree.items():
+        nested = child.expanded_field(name) if hasattr(child, 'expanded_field') else None
+        if nested is None:
+            raise serializers.ValidationError({EXPAND_PARAM: f'{prefix}{name} cannot be expanded'})
+        fields[name] = nested
+        if subtree:
+            expand_fields(nested, subtree, f'{prefix}{name}.')
+
+
+class SparseFieldsetMixin:
+    """
+    Viewset mixin for ``?fields=id,title`` and ``?omit=questionOptions_questionShare`` on reads, with
+    dots for nested fields (``?fields=id,questionOptions_questionShare.title``). The serializer drops
+    the other fields, and since querysets are planned from the serializer fields their joins,
+    prefetches and columns are dropped too.
+
+    ``?expand=questionOption,checkup.clinic`` embeds related objects of ExpandableMixin serializers
+    the same way: the planner joins or prefetches them for the whole page.
+    """
+
+    @property
+    def sparse_fieldset(self):
+        """
+        The (fields, omit, expand) trees of a read request, or None when it asks for the default fields.
+        """
+        if not hasattr(self, '_sparse_fieldset'):
+            request = getattr(self, 'request', None)
+            fieldset = None
+            if request is not None and request.method in permissions.SAFE_METHODS:
+                params = request.query_params
+                if params.get(FIELDS_PARAM) or params.get(OMIT_PARAM) or params.get(EXPAND_PARAM):
+                    fieldset = (parse_fieldset(params.get(FIELDS_PARAM, '')),
+                                parse_fieldset(params.get(OMIT_PARAM, '')),
+                                parse_fieldset(params.get(EXPAND_PARAM, '')))
+            self._sparse_fieldset = fieldset
+        return self._sparse_fieldset
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        if self.sparse_fieldset is not None:
+            fields, omit, expand = self.sparse_fieldset
+            if expand:
+                expand_fields(serializer, expand)
+            if fields:
+                keep_fields(serializer, fields)
+            if omit:
+                omit_fields(serializer, omit)
+        return serializer
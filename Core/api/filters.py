@@ -0,0 +1,61 @@
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Exists, OuterRef, Q
+from django.db.models.constants import LOOKUP_SEP
+
+
+def relation_filter(model, lookup, value):
+    """
+    ``Q(lookup=value)`` that can not duplicate rows: the first multi-valued relation on the path of
+    ``lookup`` becomes an EXISTS subquery on the related model, filtered the same way for the rest
+    of the path, so no DISTINCT is needed. Single-valued relations stay joins.
+    """
+    parts = lookup.split(LOOKUP_SEP)
+    current = model
+    for i, name in enumerate(parts):
+        try:
+            field = current._meta.get_field(name)
+        except FieldDoesNotExist:
+            break  # a transform or lookup, e.g. "exact" or "in"
+        if not field.is_relation:
+            break
+        if field.many_to_many or field.one_to_many:
+            outer = LOOKUP_SEP.join(parts[:i] + ['pk'])
+            back = field.field.name if field.auto_created and not field.concrete else field.related_query_name()
+            related = field.related_model
+            return Q(Exists(related._default_manager.filter(
+                relation_filter(related, LOOKUP_SEP.join(parts[i + 1:]), value), **{back: OuterRef(outer)}
+            )))
+        current = field.related_model
+    return Q(**{lookup: value})
+
+
+class QueryFilter:
+    """
+    A ``?param=`` filter of a viewset, the parameter value given to ``lookup`` through
+    relation_filter. ``__in`` lookups take space separated values.
+    """
+
+    def __init__(self, param, lookup):
+        self.param = param
+        self.lookup = lookup
+
+    def filter(self, queryset, params):
+        value = params.get(self.param)
+        if value is None:
+            return queryset
+        if self.lookup.endswith('__in'):
+            value = value.split(' ')
+        return queryset.filter(relation_filter(queryset.model, self.lookup, value))
+
+
+class FilterMixin:
+    """
+    Viewset mixin applying the ``query_filters`` of the request parameters to the queryset.
+    """
+    query_filters = ()
+
+    def get_queryset(self):
+        qs = super().get_queryset()
+        for query_filter in self.query_filters:
+            qs = query_filter.filter(qs, self.request.GET)
+        return qs
@@ -20,7 +20,7 @@ class IsPatientSupervisor(permissions.BasePermission):
 
     def has_object_permission(self, request, view, obj):
         try:
-            return obj.user == request.user or obj.supervisor_patient.user == request.user
+            return obj.user_id == request.user.id or obj.supervisor_patient.user_id == request.user.id
         except Supervisor.DoesNotExist:
             return obj == request.user
 
@@ -0,0 +1,274 @@
+import ast
+import inspect
+import textwrap
+from functools import lru_cache
+
+from django.db.models import Prefetch
+from rest_framework import serializers
+
+from Core.api.fieldsets import SparseFieldsetMixin
+
+
+@lru_cache(maxsize=None)
+def _accessors(model):
+    """
+    Relations of ``model`` by the attribute name they are reached with, as (related model, kind) where
+    kind is "select" for a single object and "prefetch" for a related manager.
+    """
+    relations = {}
+    for field in model._meta.get_fields():
+        if not field.is_relation or field.related_model is None:
+            continue
+        if field.auto_created and not field.concrete:
+            name = field.get_accessor_name()
+        else:
+            name = field.name
+        single = field.many_to_one or field.one_to_one
+        relations[name] = (field.related_model, 'select' if single else 'prefetch')
+    return relations
+
+
+@lru_cache(maxsize=None)
+def _columns(model):
+    """
+    The concrete fields of ``model`` by name and by column attribute, e.g. both "clinic" and "clinic_id".
+    """
+    columns = {}
+    for field in model._meta.concrete_fields:
+        columns[field.name] = columns[field.attname] = field.name
+    return columns
+
+
+@lru_cache(maxsize=None)
+def _reverse_column(model, accessor):
+    """
+    The foreign key of the related model a reverse one-to-many ``accessor`` of ``model`` joins on.
+    """
+    for field in model._meta.get_fields():
+        if field.one_to_many and field.auto_created and field.get_accessor_name() == accessor:
+            return field.field.name
+    return None
+
+
+def _method_definition(function):
+    """
+    The parsed definition of a serializer method and the name of its ``obj`` argument.
+    """
+    try:
+        tree = ast.parse(textwrap.dedent(inspect.getsource(function)))
+    except (OSError, TypeError, SyntaxError):
+        return None, None
+    definition = tree.body[0]
+    arguments = [argument.arg for argument in definition.args.args]
+    if len(arguments) < 2:
+        return None, None
+    return definition, arguments[1]
+
+
+def _attribute_chains(node, root):
+    """
+    Every attribute chain ``root.a.b.c`` in ``node`` as a list of names.
+    """
+    chains = []
+    for child in ast.walk(node):
+        names = []
+        while isinstance(child, ast.Attribute):
+            names.append(child.attr)
+            child = child.value
+        if isinstance(child, ast.Name) and child.id == root and names:
+            chains.append(names[::-1])
+    return chains
+
+
+@lru_cache(maxsize=None)
+def method_paths(function, model):
+    """
+    Relation paths a SerializerMethodField method walks on its ``obj`` argument, read from its source.
+    """
+    definition, root = _method_definition(function)
+    if definition is None:
+        return ()
+    paths = set()
+    for chain in _attribute_chains(definition, root):
+        current, path = model, []
+        for name in chain:
+            relation = _accessors(current).get(name)
+            if relation is None:
+                break
+            current, kind = relation
+            path.append(name)
+            if kind == 'prefetch':
+                break
+        if path:
+            paths.add('__'.join(path))
+    return tuple(sorted(paths))
+
+
+@lru_cache(maxsize=None)
+def method_columns(function, model):
+    """
+    The columns of ``model`` a SerializerMethodField method reads from its ``obj`` argument, or None
+    when it passes ``obj`` on or reads attributes that are not fields.
+    """
+    definition, root = _method_definition(function)
+    if definition is None:
+        return None
+    parents = {child: node for node in ast.walk(definition) for child in ast.iter_child_nodes(node)}
+    columns = set()
+    for node in ast.walk(definition):
+        if not isinstance(node, ast.Name) or node.id != root:
+            continue
+        parent = parents.get(node)
+        if not isinstance(parent, ast.Attribute):
+            return None
+        if parent.attr in _columns(model):
+            columns.add(_columns(model)[parent.attr])
+        elif parent.attr not in _accessors(model):
+            return None
+    return tuple(sorted(columns))
+
+
+class QueryPlan:
+    """
+    The select_related paths and prefetches needed to serialize a queryset without further queries,
+    and with ``columns`` the only() columns they read, None when they cannot be told.
+    """
+
+    def __init__(self, model, columns=False):
+        self.model = model
+        self.select = set()
+        self.prefetch = {}
+        self.columns = set() if columns else None
+
+    def add_column(self, name):
+        """
+        Adds the column an attribute of ``model`` is read from. Relations need none; any other
+        attribute may read every column.
+        """
+        if self.columns is None:
+            return
+        if name in _columns(self.model):
+            self.columns.add(_columns(self.model)[name])
+        elif name not in _accessors(self.model):
+            self.columns = None
+
+    def add_path(self, path):
+        """
+        Adds a relation path of ``model``, joined up to the first to-many relation and prefetched from there.
+        """
+        current, walked = self.model, []
+        if path.split('__')[0] in _accessors(self.model):
+            self.add_column(path.split('__')[0])
+        for name in path.split('__'):
+            relation = _accessors(current).get(name)
+            if relation is None:
+                return
+            current, kind = relation
+            walked.append(name)
+            if kind == 'prefetch':
+                self.prefetch.setdefault('__'.join(walked), None)
+                return
+        path = '__'.join(walked)
+        if any(selected == path or selected.startswith(path + '__') for selected in self.select):
+            return
+        self.select = {selected for selected in self.select if not path.startswith(selected + '__')}
+        self.select.add(path)
+
+    def apply(self, queryset):
+        if self.columns is not None:
+            queryset = queryset.only(*sorted(self.columns))
+        if self.select:
+            queryset = queryset.select_related(*sorted(self.select))
+        lookups = [
+            Prefetch(path, queryset=plan.apply(plan.model._default_manager.all())) if plan else path
+            for path, plan in sorted(self.prefetch.items())
+        ]
+        if lookups:
+            queryset = queryset.prefetch_related(*lookups)
+        return queryset
+
+
+def _plan_fields(plan, fields, prefix=''):
+    for field in fields.values():
+        if field.write_only:
+            continue
+        source = prefix + field.source.replace('.', '__') if field.source != '*' else prefix.rstrip('_')
+        if not prefix and field.source == '*' and not isinstance(field, serializers.SerializerMethodField):
+            plan.columns = None
+        if isinstance(field, serializers.ListSerializer) and isinstance(field.child, serializers.ModelSerializer):
+            relation = _accessors(plan.model).get(source)
+            if relation is not None and relation[1] == 'prefetch':
+                child = plan_serializer(field.child, columns=plan.columns is not None)
+                if child.columns is not None:
+                    column = _reverse_column(plan.model, source)
+                    if column is not None:
+                        child.columns.add(column)
+                plan.prefetch[source] = child
+            else:
+                plan.add_path(source)
+        elif isinstance(field, serializers.ModelSerializer):
+            plan.add_path(source)
+            _plan_fields(plan, field.fields, source + '__')
+        elif isinstance(field, serializers.SerializerMethodField):
+            declared = getattr(field.parent.Meta, 'method_field_paths', {})
+            if field.field_name in declared:
+                paths = declared[field.field_name]
+            else:
+                method = getattr(field.parent, field.method_name, None)
+                paths = method_paths(getattr(method, '__func__', method), field.parent.Meta.model)
+            for path in paths:
+                plan.add_path(prefix + path)
+            if not prefix:
+                declared = getattr(field.parent.Meta, 'method_field_columns', {})
+                if field.field_name in declared:
+                    columns = declared[field.field_name]
+                else:
+                    method = getattr(field.parent, field.method_name, None)
+                    columns = method_columns(getattr(method, '__func__', method), field.parent.Meta.model)
+                if columns is None:
+                    plan.columns = None
+                for column in columns or ():
+                    plan.add_column(column)
+        elif isinstance(field, serializers.ManyRelatedField):
+            plan.add_path(source)
+        elif isinstance(field, serializers.RelatedField) and not isinstance(field, serializers.PrimaryKeyRelatedField):
+            plan.add_path(source)
+        elif not prefix and field.source != '*':
+            plan.add_column(field.source.split('.')[0])
+
+
+def plan_serializer(serializer, columns=False):
+    """
+    Builds the QueryPlan of a ModelSerializer instance from its fields: nested serializers, related
+    fields and the relations walked by its SerializerMethodField methods. Methods the source reading
+    cannot follow declare their paths in ``Meta.method_field_paths``, e.g. {"agentName": ["clinic__agent__user"]},
+    and the columns they read in ``Meta.method_field_columns``.
+
+    With ``columns`` the plan also restricts the queryset to the columns the fields read, when they
+    can all be told.
+    """
+    if isinstance(serializer, serializers.ListSerializer):
+        serializer = serializer.child
+    plan = QueryPlan(serializer.Meta.model, columns)
+    if (type(serializer).to_representation is not serializers.Serializer.to_representation
+            and not getattr(serializer, 'plain_representation', False)):
+        plan.columns = None
+    _plan_fields(plan, serializer.fields)
+    return plan
+
+
+class QueryPlanMixin(SparseFieldsetMixin):
+    """
+    Viewset mixin that adds the select_related and prefetch_related calls its serializer needs, so a
+    page costs the same number of queries whatever its size. Sparse fieldsets also restrict the
+    columns read.
+    """
+
+    def get_queryset(self):
+        return self.plan_queryset(super().get_queryset())
+
+    def plan_queryset(self, queryset):
+        """
+        Hook for viewsets with a hand written prefetch tree.
+        """
+        return plan_serializer(self.get_serializer(), columns=self.sparse_fieldset is not None).apply(queryset)
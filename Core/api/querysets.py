@@ -0,0 +1,96 @@
+from django.db.models import Prefetch, Q
+
+from Core import models
+from Core.search.normalize import normalize, normalized_column
+
+USER_NAME = ['first_name', 'last_name']
+BAND_COLUMNS = ['id', 'questionOption', 'upper_band', 'lower_band']
+
+
+def normalized_lookup(query, *fields):
+    """
+    Matches ``query``, normalized, as the prefix of the normalized shadow column of any of ``fields``
+    or any of its words as the whole column, both of which the column indexes serve.
+    """
+    query = normalize(query)
+    words = query.split()
+    lookup = Q()
+    for field in fields:
+        column = normalized_column(field)
+        lookup |= Q(**{f'{column}__startswith': query}) | Q(**{f'{column}__in': words})
+    return lookup
+
+
+def model_columns(serializer):
+    """
+    The concrete columns of the serializer model among the fields of ``serializer``, which sparse
+    fieldsets may have pruned.
+    """
+    concrete = {field.name for field in serializer.Meta.model._meta.concrete_fields}
+    return [name for name in serializer.fields if name in concrete]
+
+
+def _related(path, columns):
+    return [path.split('__')[0], *(f'{path}__{column}' for column in columns)]
+
+
+def _apply_related(queryset, fields, related, columns):
+    """
+    Joins the ``related`` {method field: (path, columns)} still in ``fields`` and restricts the query
+    to ``columns`` and theirs.
+    """
+    joined = [related[name] for name in related if name in fields]
+    if joined:
+        queryset = queryset.select_related(*(path for path, _ in joined))
+    return queryset.only(*columns, *(column for path, names in joined for column in _related(path, names)))
+
+
+def question_option_queryset(serializer):
+    """
+    QuestionOptions for QuestionOptionSerializer / LightQuestionOptionSerializer: the named doctor,
+    clinic and alert joined and the three band tables prefetched, each with only the serialized columns.
+    """
+    fields = serializer.fields
+    queryset = _apply_related(models.QuestionOption.objects.order_by('id'), fields, {
+        'suggestedDoctorName': ('suggestedDoctor__user', USER_NAME),
+        'suggestedClinicName': ('suggestedClinic', ['title']),
+        'alertTitle': ('alert', ['title']),
+    }, ['questionShare', *model_columns(serializer)])
+    bands = [
+        Prefetch(lookup, queryset=model.objects.only(*BAND_COLUMNS).order_by('id'))
+        for lookup, model in [
+            ('questionOptionEquations', models.QuestionOptionEquation),
+            ('questionOptionNumbers', models.QuestionOptionNumber),
+            ('questionOptionDates', models.QuestionOptionDate),
+        ]
+        if lookup in fields
+    ]
+    return queryset.prefetch_related(*bands)
+
+
+def question_share_queryset(queryset, serializer):
+    """
+    Adds the Prefetch tree of the nested QuestionShare serializers to ``queryset``: one query per
+    table whatever the page size, each reading only the serialized columns. Relations dropped from
+    ``serializer`` by a sparse fieldset are neither joined nor prefetched.
+    """
+    fields = serializer.fields
+    queryset = _apply_related(queryset, fields, {
+        'doctorName': ('doctor__user', USER_NAME),
+        'clinicName': ('clinic', ['title']),
+    }, model_columns(serializer))
+    prefetches = []
+    if 'questionOptions_questionShare' in fields:
+        prefetches.append(Prefetch('questionOptions_questionShare', queryset=question_option_queryset(
+            fields['questionOptions_questionShare'].child
+        )))
+    if 'questionOrgans_questionShare' in fields:
+        prefetches.append(Prefetch('questionOrgans_questionShare', queryset=models.QuestionOrgan.objects.select_related(
+            'organ'
+        ).only('id', 'organ', 'questionShare', 'organ__name').order_by('id')))
+    if 'QuestionShareMedia_questionShares' in fields:
+        prefetches.append(Prefetch(
+            'QuestionShareMedia_questionShares',
+            queryset=models.QuestionShareMedia.objects.select_related('media').order_by('id')
+        ))
+    return queryset.prefetch_related(*prefetches)
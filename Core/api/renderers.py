@@ -0,0 +1,75 @@
+import math
+from decimal import Decimal
+
+import msgpack
+import orjson
+from rest_framework import renderers
+from rest_framework.utils import encoders
+
+_encoder = encoders.JSONEncoder()
+
+ORJSON_OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+
+
+def _has_non_finite(data):
+    """
+    Whether ``data`` holds a NaN or infinite number, which orjson renders as null.
+    """
+    stack = [data]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, float):
+            if not math.isfinite(value):
+                return True
+        elif isinstance(value, dict):
+            stack.extend(value.values())
+        elif isinstance(value, (list, tuple)):
+            stack.extend(value)
+        elif isinstance(value, Decimal) and not value.is_finite():
+            return True
+    return False
+
+
+class OrjsonRenderer(renderers.JSONRenderer):
+    """
+    JSONRenderer output, byte for byte, from the C encoder of orjson. Types orjson does not know, such
+    as Decimal and lazy strings, are converted by the DRF encoder; indented output, integers beyond
+    64 bits and NaN or infinite numbers (an error in strict mode) are left to DRF.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if (self.get_indent(accepted_media_type, renderer_context or {}) is not None
+                or self.ensure_ascii or not self.compact):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            content = orjson.dumps(data, default=_encoder.default, option=ORJSON_OPTIONS)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # null is also what orjson makes of NaN and infinities
+        if b'null' in content and _has_non_finite(data):
+            return super().render(data, accepted_media_type, renderer_context)
+        # escaped by JSONRenderer for embedding in javascript
+        return content.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+
+def _msgpack_default(obj):
+    if isinstance(obj, (tuple, set)):
+        return list(obj)
+    return _encoder.default(obj)
+
+
+class MessagePackRenderer(renderers.BaseRenderer):
+    """
+    The JSON document in MessagePack for clients sending ``Accept: application/msgpack``.
+    """
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=_msgpack_default, use_bin_type=True, datetime=False)
@@ -0,0 +1,22 @@
+from Core.search.ngrams import register, search_filter
+
+
+class SearchMixin:
+    """
+    Viewset mixin resolving ``?q=`` through the n-gram search index: the objects with every word of
+    the query in one of ``search_fields``, which may follow forward relations ("clinic__title").
+    Declaring the fields registers them with the index, which signals keep up to date.
+    """
+    search_fields = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if cls.search_fields:
+            register(cls.queryset.model, cls.search_fields)
+
+    def get_queryset(self):
+        qs = super().get_queryset()
+        query = self.request.GET.get("q")
+        if query is not None and self.search_fields:
+            qs = qs.filter(search_filter(qs.model, self.search_fields, query))
+        return qs
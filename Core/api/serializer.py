@@ -1,11 +1,224 @@
+import hashlib
+from operator import attrgetter
+
 from rest_framework import serializers
 from django.contrib.auth import get_user_model  # If used custom user model
+from django.core.cache import cache
+from django.core.exceptions import ObjectDoesNotExist
+from django.db.models import Manager
+from django.utils.functional import cached_property
 from Core import models
+from Core.caching import get_versions
+from Core.displayNames import resolve as resolve_display_names
+from Core.representations import REPRESENTATION_TIMEOUT, representation_version_key
+from Core.questionGraph.equation import compile_equation, EquationError
 from drf_writable_nested.serializers import WritableNestedModelSerializer
 
 UserModel = get_user_model()
 
 
+def _nested_instances(field, instances):
+    related = []
+    for obj in instances:
+        try:
+            value = field.get_attribute(obj)
+        except (AttributeError, ObjectDoesNotExist):
+            continue
+        if isinstance(field, serializers.ListSerializer):
+            related.extend(value.all() if isinstance(value, Manager) else value)
+        elif value is not None:
+            related.append(value)
+    return related
+
+
+def _nested_serializers(serializer):
+    for field in serializer.fields.values():
+        nested = field.child if isinstance(field, serializers.ListSerializer) else field
+        if isinstance(nested, serializers.Serializer) and not field.write_only:
+            yield field, nested
+
+
+def _uses_display_names(serializer):
+    return isinstance(serializer, DisplayNameMixin) or any(
+        _uses_display_names(nested) for _, nested in _nested_serializers(serializer)
+    )
+
+
+def display_name_keys(serializer, instances):
+    """
+    The display name keys of ``instances`` for ``serializer`` and the serializers nested in it.
+    """
+    keys = serializer.own_display_name_keys(instances) if isinstance(serializer, DisplayNameMixin) else set()
+    for field, nested in _nested_serializers(serializer):
+        if _uses_display_names(nested):
+            keys |= display_name_keys(nested, _nested_instances(field, instances))
+    return keys
+
+
+def prime_display_names(serializer, names):
+    if isinstance(serializer, DisplayNameMixin):
+        serializer.display_names = names
+    for _, nested in _nested_serializers(serializer):
+        prime_display_names(nested, names)
+
+
+class DisplayNameListSerializer(serializers.ListSerializer):
+    """
+    Resolves the display names of all rows, nested serializers included, with one batched lookup
+    before serializing them.
+    """
+
+    def prime(self, items):
+        names = getattr(self.child, 'display_names', None) or {}
+        missing = display_name_keys(self.child, items) - names.keys()
+        if missing:
+            prime_display_names(self.child, {**names, **resolve_display_names(missing)})
+
+    def to_representation(self, data):
+        items = list(data.all() if isinstance(data, Manager) else data)
+        self.prime(items)
+        return super().to_representation(items)
+
+
+class RepresentationCacheListSerializer(DisplayNameListSerializer):
+    """
+    Assembles the page from the cached representations of its rows and serializes only the misses.
+    """
+
+    def to_representation(self, data):
+        items = list(data.all() if isinstance(data, Manager) else data)
+        keys = self.child.representation_keys(items)
+        if keys is None:
+            return super().to_representation(items)
+        cached = cache.get_many(keys)
+        misses = [(key, item) for key, item in zip(keys, items) if key not in cached]
+        if misses:
+            self.prime([item for _, item in misses])
+            fresh = {key: self.child.serialize(item) for key, item in misses}
+            cache.set_many(fresh, REPRESENTATION_TIMEOUT)
+            cached.update(fresh)
+        return [cached[key] for key in keys]
+
+
+class DisplayNameMixin:
+    """
+    Serializes the method fields of ``Meta.display_names``, {field: (kind, attribute path of the pk)},
+    from the display name cache of Core.displayNames instead of walking foreign keys.
+    """
+    display_names = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        meta = cls.Meta
+        if not hasattr(meta, 'list_serializer_class'):
+            meta.list_serializer_class = DisplayNameListSerializer
+        paths = dict(getattr(meta, 'method_field_paths', {}))
+        columns = dict(getattr(meta, 'method_field_columns', {}))
+        for field_name, (kind, attribute) in meta.display_names.items():
+            relations = attribute.split('.')[:-1]
+            paths.setdefault(field_name, ['__'.join(relations)] if relations else [])
+            columns.setdefault(field_name, [attribute.split('.')[0]])
+        meta.method_field_paths = paths
+        meta.method_field_columns = columns
+
+    def _display_name_key(self, obj, field_name):
+        kind, attribute = self.Meta.display_names[field_name]
+        try:
+            return kind, attrgetter(attribute)(obj)
+        except AttributeError:
+            return kind, None
+
+    def own_display_name_keys(self, instances):
+        field_names = [field_name for field_name in self.Meta.display_names if field_name in self.fields]
+        return {self._display_name_key(obj, field_name) for obj in instances for field_name in field_names}
+
+    def display_name(self, obj, field_name):
+        key = self._display_name_key(obj, field_name)
+        if self.display_names is None or key not in self.display_names:
+            self.display_names = {**(self.display_names or {}), **resolve_display_names([key])}
+        return self.display_names.get(key, "")
+
+
+class ExpandableMixin:
+    """
+    Serializer whose related fields in ``Meta.expandable``, {field: serializer class name in this
+    module}, embed the related objects instead of their ids when a read asks for ``?expand=field``.
+    """
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if not hasattr(cls.Meta, 'list_serializer_class'):
+            cls.Meta.list_serializer_class = DisplayNameListSerializer
+
+    def expanded_field(self, field_name):
+        """
+        A read-only serializer of the related objects of ``field_name``, None if it cannot be expanded.
+        """
+        serializer_name = getattr(self.Meta, 'expandable', {}).get(field_name)
+        field = self.fields.get(field_name)
+        if serializer_name is None or field is None:
+            return None
+        kwargs = {'read_only': True, 'many': isinstance(field, serializers.ManyRelatedField)}
+        if field.source != field_name:
+            kwargs['source'] = field.source
+        return globals()[serializer_name](**kwargs)
+
+
+class RepresentationCacheMixin:
+    """
+    Caches the representation of each object under (serializer, pk, version), the version being
+    bumped by the signals of Core.representations whenever the object or anything it renders is
+    written. Sparse fieldsets, expansions and the request host are part of the key.
+    """
+    # to_representation only caches the output of Serializer.to_representation, see plan_serializer.
+    plain_representation = True
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if getattr(cls.Meta, 'list_serializer_class', DisplayNameListSerializer) is DisplayNameListSerializer:
+            cls.Meta.list_serializer_class = RepresentationCacheListSerializer
+
+    @staticmethod
+    def _signature(serializer):
+        signature = []
+        for name, field in serializer.fields.items():
+            nested = field.child if isinstance(field, serializers.ListSerializer) else field
+            signature.append((name, type(field).__name__))
+            if isinstance(nested, serializers.Serializer):
+                signature.append(RepresentationCacheMixin._signature(nested))
+        return signature
+
+    @cached_property
+    def representation_prefix(self):
+        request = self.context.get('request')
+        signature = repr((self._signature(self), request.build_absolute_uri('/') if request else ''))
+        return f'representation:{type(self).__name__}:{hashlib.md5(signature.encode()).hexdigest()}'
+
+    def representation_keys(self, instances):
+        """
+        The cache keys of the current representations of ``instances``, None if one is not saved.
+        """
+        if any(obj.pk is None for obj in instances):
+            return None
+        model = self.Meta.model
+        version_keys = [representation_version_key(model, obj.pk) for obj in instances]
+        versions = get_versions(version_keys)
+        return [f'{self.representation_prefix}:{obj.pk}:{versions[key]}' for obj, key in zip(instances, version_keys)]
+
+    def serialize(self, instance):
+        return super().to_representation(instance)
+
+    def to_representation(self, instance):
+        keys = self.representation_keys([instance])
+        if keys is None:
+            return self.serialize(instance)
+        data = cache.get(keys[0])
+        if data is None:
+            data = self.serialize(instance)
+            cache.set(keys[0], data, REPRESENTATION_TIMEOUT)
+        return data
+
+
 class UserSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True)
 
@@ -47,7 +260,7 @@ class RelativeTypeSerializer(serializers.ModelSerializer):
         ]
 
 
-class PatientProfileSerializer(serializers.ModelSerializer):
+class PatientProfileSerializer(DisplayNameMixin, serializers.ModelSerializer):
     full_name = serializers.SerializerMethodField(read_only=True)
     supervisor = serializers.SerializerMethodField(read_only=True)
     supervisor_full_name = serializers.SerializerMethodField(read_only=True)
@@ -64,33 +277,43 @@ class PatientProfileSerializer(serializers.ModelSerializer):
             'supervisor_relativeType',
             'created_on'
         ]
+        display_names = {'full_name': ('user', 'user_id')}
+        method_field_paths = {
+            'supervisor': ['supervisor_patient'],
+            'supervisor_full_name': ['supervisor_patient__user'],
+            'supervisor_relativeType': ['supervisor_patient__relativeType'],
+        }
+        method_field_columns = {'supervisor': [], 'supervisor_full_name': [], 'supervisor_relativeType': []}
 
     def get_full_name(self, obj):
-        return obj.user.get_full_name()
+        return self.display_name(obj, 'full_name')
+
+    def _supervisor(self, obj):
+        """
+        The supervisor of the profile or None, from the row joined by the planned queryset when there
+        is one, without raising DoesNotExist for profiles that have none.
+        """
+        related = models.PatientProfile.supervisor_patient.related
+        if not related.is_cached(obj):
+            related.set_cached_value(obj, models.Supervisor.objects.select_related(
+                'user', 'relativeType'
+            ).filter(patient=obj).first())
+        return related.get_cached_value(obj)
 
     def get_supervisor(self, obj):
-        try:
-            sup = obj.supervisor_patient.user.id
-            return sup
-        except models.Supervisor.DoesNotExist:
-            return ""
+        supervisor = self._supervisor(obj)
+        return supervisor.user_id if supervisor else ""
 
     def get_supervisor_full_name(self, obj):
-        try:
-            sup_name = obj.supervisor_patient.user.get_full_name()
-            return sup_name
-        except models.Supervisor.DoesNotExist:
-            return ""
+        supervisor = self._supervisor(obj)
+        return supervisor.user.get_full_name() if supervisor else ""
 
     def get_supervisor_relativeType(self, obj):
-        try:
-            sup_rel = obj.supervisor_patient.relativeType.title
-            return sup_rel
-        except models.Supervisor.DoesNotExist:
-            return ""
+        supervisor = self._supervisor(obj)
+        return supervisor.relativeType.title if supervisor else ""
 
 
-class SupervisorSerializer(serializers.ModelSerializer):
+class SupervisorSerializer(DisplayNameMixin, serializers.ModelSerializer):
     name = serializers.SerializerMethodField(read_only=True)
     relativeType_name = serializers.SerializerMethodField(read_only=True)
     patient_name = serializers.SerializerMethodField(read_only=True)
@@ -112,15 +335,16 @@ class SupervisorSerializer(serializers.ModelSerializer):
             'patient_name',
             'patient_number'
         ]
+        display_names = {'name': ('user', 'user_id'), 'patient_name': ('patient', 'patient_id')}
 
     def get_name(self, obj):
-        return obj.user.get_full_name()
+        return self.display_name(obj, 'name')
 
     def get_relativeType_name(self, obj):
         return obj.relativeType.title
 
     def get_patient_name(self, obj):
-        return obj.patient.user.get_full_name()
+        return self.display_name(obj, 'patient_name')
 
 
 class SupervisorRegisterSerializer(serializers.ModelSerializer):
@@ -130,7 +354,7 @@ class SupervisorRegisterSerializer(serializers.ModelSerializer):
         fields = ('phone_number', 'generated_token')
 
 
-class DoctorSerializer(serializers.ModelSerializer):
+class DoctorSerializer(RepresentationCacheMixin, DisplayNameMixin, serializers.ModelSerializer):
     name = serializers.SerializerMethodField(read_only=True)
     userPicture = serializers.SerializerMethodField(read_only=True)
 
@@ -145,9 +369,10 @@ class DoctorSerializer(serializers.ModelSerializer):
             'userPicture',
             'description'
         ]
+        display_names = {'name': ('doctor', 'id')}
 
     def get_name(self, obj):
-        return obj.user.get_full_name()
+        return self.display_name(obj, 'name')
 
     def get_userPicture(self, obj):
         if obj.user.picture:
@@ -185,7 +410,7 @@ class OrganSerializer(serializers.ModelSerializer):
 
     def get_parent_name(self, obj):
         if obj.parent:
-            return models.Organ.objects.get(id=obj.parent.id).name
+            return obj.parent.name
         return ""
 
 
@@ -199,7 +424,7 @@ class ClinicGroupSerializer(serializers.ModelSerializer):
         ]
 
 
-class ClinicSerializer(serializers.ModelSerializer):
+class ClinicSerializer(RepresentationCacheMixin, DisplayNameMixin, ExpandableMixin, serializers.ModelSerializer):
     clinicGroupName = serializers.SerializerMethodField(read_only=True)
     agentName = serializers.SerializerMethodField(read_only=True)
 
@@ -219,15 +444,17 @@ class ClinicSerializer(serializers.ModelSerializer):
             'long',
             'lat',
         ]
+        display_names = {'clinicGroupName': ('clinicGroup', 'clinicGroup_id'), 'agentName': ('doctor', 'agent_id')}
+        expandable = {'clinicGroup': 'ClinicGroupSerializer', 'agent': 'DoctorSerializer'}
 
     def get_clinicGroupName(self, obj):
-        return obj.clinicGroup.title
+        return self.display_name(obj, 'clinicGroupName')
 
     def get_agentName(self, obj):
-        return obj.agent.user.get_full_name()
+        return self.display_name(obj, 'agentName')
 
 
-class RealClinicSerializer(serializers.ModelSerializer):
+class RealClinicSerializer(RepresentationCacheMixin, serializers.ModelSerializer):
 
     class Meta:
         model = models.RealClinic
@@ -245,7 +472,7 @@ class RealClinicSerializer(serializers.ModelSerializer):
         ]
 
 
-class RealDoctorSerializer(serializers.ModelSerializer):
+class RealDoctorSerializer(RepresentationCacheMixin, serializers.ModelSerializer):
 
     class Meta:
         model = models.RealDoctor
@@ -278,7 +505,7 @@ class MediaSerializer(serializers.ModelSerializer):
         ]
 
 
-class ClinicMediaSerializer(WritableNestedModelSerializer):
+class ClinicMediaSerializer(DisplayNameMixin, WritableNestedModelSerializer):
     clinicAgentName = serializers.SerializerMethodField(read_only=True)
     clinicName = serializers.SerializerMethodField(read_only=True)
     media = MediaSerializer(many=False)
@@ -293,12 +520,13 @@ class ClinicMediaSerializer(WritableNestedModelSerializer):
             'clinicAgentName',
             'created_on',
         ]
+        display_names = {'clinicAgentName': ('doctor', 'clinic.agent_id'), 'clinicName': ('clinic', 'clinic_id')}
 
     def get_clinicAgentName(self, obj):
-        return obj.clinic.agent.user.get_full_name()
+        return self.display_name(obj, 'clinicAgentName')
 
     def get_clinicName(self, obj):
-        return obj.clinic.title
+        return self.display_name(obj, 'clinicName')
 
 
 class QuestionShareMediaSerializer(serializers.ModelSerializer):
@@ -335,7 +563,7 @@ class QuestionShareMediaSerializer(serializers.ModelSerializer):
     #     return obj.questionShare.clinic.title
 
 
-class CheckupSerializer(serializers.ModelSerializer):
+class CheckupSerializer(DisplayNameMixin, ExpandableMixin, serializers.ModelSerializer):
 
     def create(self, validated_data):
         user = None
@@ -376,28 +604,43 @@ class CheckupSerializer(serializers.ModelSerializer):
             'title',
             'description',
             'executionDate',
+            'graph_version',
         ]
+        display_names = {
+            'clinicGroupName': ('clinicGroup', 'clinic.clinicGroup_id'),
+            'clinicName': ('clinic', 'clinic_id'),
+            'patientName': ('patient', 'patientProfile_id'),
+            'agentName': ('doctor', 'clinic.agent_id'),
+        }
+        expandable = {
+            'patientProfile': 'PatientProfileSerializer',
+            'clinic_checkup': 'ClinicCheckupSerializer',
+            'clinic': 'ClinicSerializer',
+        }
 
     def get_clinicGroupName(self, obj):
-        return obj.clinic.clinicGroup.title
+        return self.display_name(obj, 'clinicGroupName')
 
     def get_clinicName(self, obj):
-        return obj.clinic.title
+        return self.display_name(obj, 'clinicName')
 
-    # def get_clinicCheckupTitle(self, obj):
-    #     return obj.clinic_checkup.title
+    def get_clinicCheckupTitle(self, obj):
+        if obj.clinic_checkup:
+            return obj.clinic_checkup.title
+        return ""
 
     # def get_patientProfile(self, obj):
     #     return obj.patientProfile.pk
 
     def get_patientName(self, obj):
-        return obj.patientProfile.user.get_full_name()
+        return self.display_name(obj, 'patientName')
 
     def get_agentName(self, obj):
-        return obj.clinic.agent.user.get_full_name()
+        return self.display_name(obj, 'agentName')
 
 
-class ClinicCheckupSerializer(serializers.ModelSerializer):
+class ClinicCheckupSerializer(RepresentationCacheMixin, DisplayNameMixin, ExpandableMixin,
+                              serializers.ModelSerializer):
     clinicName = serializers.SerializerMethodField(read_only=True)
     agentName = serializers.SerializerMethodField(read_only=True)
     question_short_title = serializers.SerializerMethodField(read_only=True)
@@ -416,13 +659,22 @@ class ClinicCheckupSerializer(serializers.ModelSerializer):
             'approvers',
             'starting_question',
             'question_short_title',
+            'reachable_count',
+            'longest_path',
+            'expected_question_count',
+            'graph_issues',
+            'analyzed_on',
         ]
+        read_only_fields = ['reachable_count', 'longest_path', 'expected_question_count', 'graph_issues',
+                            'analyzed_on']
+        display_names = {'agentName': ('doctor', 'clinic.agent_id'), 'clinicName': ('clinic', 'clinic_id')}
+        expandable = {'clinic': 'ClinicSerializer'}
 
     def get_agentName(self, obj):
-        return obj.clinic.agent.user.get_full_name()
+        return self.display_name(obj, 'agentName')
 
     def get_clinicName(self, obj):
-        return obj.clinic.title
+        return self.display_name(obj, 'clinicName')
 
     def get_question_short_title(self, obj):
         return obj.starting_question.short_title
@@ -529,7 +781,7 @@ class DrugInstructionSerializer(serializers.ModelSerializer):
         ]
 
 
-class PatientIllnessSerializer(serializers.ModelSerializer):
+class PatientIllnessSerializer(ExpandableMixin, serializers.ModelSerializer):
 
     class Meta:
         model = models.PatientIllness
@@ -538,9 +790,10 @@ class PatientIllnessSerializer(serializers.ModelSerializer):
             'illness',
             'patient',
         ]
+        expandable = {'illness': 'IllnessSerializer', 'patient': 'PatientProfileSerializer'}
 
 
-class PatientFamilyIllnessSerializer(serializers.ModelSerializer):
+class PatientFamilyIllnessSerializer(ExpandableMixin, serializers.ModelSerializer):
 
     class Meta:
         model = models.PatientFamilyIllness
@@ -550,9 +803,10 @@ class PatientFamilyIllnessSerializer(serializers.ModelSerializer):
             'patient',
             'family_member',
         ]
+        expandable = {'illness': 'IllnessSerializer', 'patient': 'PatientProfileSerializer'}
 
 
-class PatientDrugSerializer(serializers.ModelSerializer):
+class PatientDrugSerializer(ExpandableMixin, serializers.ModelSerializer):
 
     class Meta:
         model = models.PatientDrug
@@ -563,9 +817,15 @@ class PatientDrugSerializer(serializers.ModelSerializer):
             'amount',
             'instruction',
         ]
+        expandable = {
+            'patient': 'PatientProfileSerializer',
+            'drug': 'DrugSerializer',
+            'amount': 'DrugAmountSerializer',
+            'instruction': 'DrugInstructionSerializer',
+        }
 
 
-class PatientJobSerializer(serializers.ModelSerializer):
+class PatientJobSerializer(ExpandableMixin, serializers.ModelSerializer):
 
     class Meta:
         model = models.PatientJob
@@ -574,6 +834,7 @@ class PatientJobSerializer(serializers.ModelSerializer):
             'job',
             'patient',
         ]
+        expandable = {'job': 'JobSerializer', 'patient': 'PatientProfileSerializer'}
 
 
 class PatientBiographySerializer(serializers.ModelSerializer):
@@ -761,6 +1022,14 @@ class QuestionShareSerializer(WritableNestedModelSerializer):
             'questionOptions_questionShare',
         ]
 
+    def validate(self, attrs):
+        if attrs.get('is_equation') and attrs.get('equation'):
+            try:
+                compile_equation(attrs['equation'])
+            except EquationError as e:
+                raise serializers.ValidationError({'equation': str(e)})
+        return super().validate(attrs)
+
     def get_doctorName(self, obj):
         return obj.doctor.user.get_full_name()
 
@@ -895,7 +1164,7 @@ class CompressedQuestionShareSerializer(serializers.ModelSerializer):
     #         return ""
 
 
-class QuestionAnswerSerializer(serializers.ModelSerializer):
+class QuestionAnswerSerializer(ExpandableMixin, serializers.ModelSerializer):
     # checkup = CheckupSerializer(many=True)
     # questionShare = LightQuestionShareSerializer(many=True)
     # questionOption = LightQuestionOptionSerializer(many=True)
@@ -909,3 +1178,8 @@ class QuestionAnswerSerializer(serializers.ModelSerializer):
             'questionShare',
             'questionOption',
         ]
+        expandable = {
+            'checkup': 'CheckupSerializer',
+            'questionShare': 'LightQuestionShareSerializer',
+            'questionOption': 'LightQuestionOptionSerializer',
+        }
@@ -69,6 +69,7 @@ urlpatterns = [
     url(r'^flowchart2$', myapp_views.flowchart, name='flowchart2'),
     url(r'^register$', myapp_views.create_auth, name='create_auth'),
     url(r'^search$', myapp_views.search, name='search'),
+    url(r'^autocomplete$', myapp_views.autocomplete, name='autocomplete'),
     url(r'^checkup_result$', myapp_views.checkup_result, name='checkup_result'),
     # url(r'^clinic-toturials$', myapp_views.clinic_search, name='clinic-toturials'),
     # path('flowchart2/', myapp_views.flowchart, name='flowchart2'),
@@ -3,10 +3,13 @@ import random
 from django.views.decorators.csrf import csrf_exempt
 import json
 import requests
-from django.http import HttpResponse
+from django.http import Http404, HttpResponse, HttpResponseNotModified, JsonResponse
+from django.utils.http import parse_etags
 from rest_framework import viewsets, permissions, status
-from django.db.models import Q
-from rest_framework.decorators import api_view
+from django.db import transaction
+from django.db.models import Q, Value
+from django.db.models.functions import Coalesce
+from rest_framework.decorators import api_view, action
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
 from rest_framework.views import APIView
@@ -16,8 +19,25 @@ from kavenegar import KavenegarAPI, APIException, HTTPException
 from CheckupServer.settings import KAVENEGAR_APIKEY
 from rest_framework_simplejwt.tokens import RefreshToken
 from Core import models
+from Core.signals import checkup_results_suspended, bump_clinic_graph
+from Core.organTree import get_organ_tree
+from Core.search.autocomplete import CATALOGS, TOP_K, get_catalog_trie
+from Core.search.index import get_search_index
+from Core.search.normalize import normalize
+from Core.questionGraph.engine import get_compiled_graph, UnknownNode
+from Core.questionGraph.bands import get_band_index
+from Core.questionGraph.bundle import get_bundle
+from Core.questionGraph.equation import answer_variables, evaluate_question_equation, EquationError, parse_variables
+from Core.questionGraph.layout import save_layout, LayoutSaveError
+from Core.questionGraph.clone import clone_clinic_checkup, CloneError
+from Core.questionGraph.versions import get_checkup_graph, get_version_bundle, publish_version
 from django.shortcuts import get_object_or_404
 from . import serializer
+from Core.api.fastpath import ValuesListMixin
+from Core.api.filters import FilterMixin, QueryFilter
+from Core.api.planner import QueryPlanMixin, plan_serializer
+from Core.api.search import SearchMixin
+from Core.api.querysets import normalized_lookup, question_share_queryset
 from Core.api.permissions import IsCreationOrIsAuthenticated, IsOwner, IsUserOwnerOrSupervisor, IsClinicOwner,\
     IsClinicMediaAndInfoOwner, IsCheckupOwner, IsQuestionShareOwner, IsQuestionOptionAndOrganOwner,\
     IsQuestionOptionNumEqDatOwner, IsQuestionAnswerOwner, IsPatientSupervisor, IsSupervisorOwner
@@ -48,23 +68,15 @@ def password_generator():
     return password
 
 
-class ClinicGroupViewset(viewsets.ModelViewSet):
+class ClinicGroupViewset(SearchMixin, ValuesListMixin, viewsets.ModelViewSet):
     queryset = models.ClinicGroup.objects.all()
     serializer_class = serializer.ClinicGroupSerializer
     pagination_class = StandardResultsSetPagination
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, ]
-
-    def get_queryset(self):
-        qs = super().get_queryset()
-        query = self.request.GET.get("q")
-        if query is not None:
-            qs = qs.filter(
-                Q(title__icontains=query)
-            ).distinct()
-        return qs
+    search_fields = ('title',)
 
 
-class UserViewset(viewsets.ModelViewSet):
+class UserViewset(QueryPlanMixin, viewsets.ModelViewSet):
     queryset = models.User.objects.all()
     serializer_class = serializer.UserSerializer
     pagination_class = StandardResultsSetPagination
@@ -74,16 +86,13 @@ class UserViewset(viewsets.ModelViewSet):
         qs = super().get_queryset().order_by('-date_joined')
         query = self.request.GET.get("q")
         if query is not None:
-            list = query.split(" ")
+            normalized = normalize(query)
             qs = qs.filter(
-                Q(phone_number__icontains=query)
-                | Q(first_name__icontains=query)
-                | Q(last_name__icontains=query)
-                | Q(first_name__in=list)
-                | Q(last_name__in=list)
-                | Q(email__icontains=query)
-                | Q(national_code__icontains=query)
-            ).distinct()
+                Q(phone_number__icontains=normalized)
+                | normalized_lookup(query, 'first_name', 'last_name')
+                | Q(email__icontains=normalized)
+                | Q(national_code__icontains=normalized)
+            )
 
         query_user_patients = self.request.GET.get("user_patients")
         if query_user_patients is not None:
@@ -102,55 +111,44 @@ class UserViewset(viewsets.ModelViewSet):
 
             qs = qs.filter(
                 Q(pk__in=user_patients)
-            ).distinct()
+            )
 
         return qs
 
 
-class RelativeTypeViewset(viewsets.ModelViewSet):
+class RelativeTypeViewset(SearchMixin, ValuesListMixin, viewsets.ModelViewSet):
     queryset = models.RelativeType.objects.all()
     serializer_class = serializer.RelativeTypeSerializer
     pagination_class = StandardResultsSetPagination
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, ]
+    search_fields = ('title',)
 
     def get_queryset(self):
-        qs = super().get_queryset().order_by('-created_on')
-        query = self.request.GET.get("q")
-        if query is not None:
-            qs = qs.filter(
-                Q(title__icontains=query)
-            ).distinct()
-        return qs
+        return super().get_queryset().order_by('-created_on')
 
 
-class PatientProfileViewset(viewsets.ModelViewSet):
+class PatientProfileViewset(FilterMixin, QueryPlanMixin, viewsets.ModelViewSet):
     queryset = models.PatientProfile.objects.all()
     serializer_class = serializer.PatientProfileSerializer
     pagination_class = StandardResultsSetPagination
     # permission_classes = [permissions.IsAuthenticatedOrReadOnly, ]
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsPatientSupervisor, ]
+    query_filters = [
+        QueryFilter('undercare', 'supervisor_patient__user__id__exact'),
+    ]
 
     def get_queryset(self):
         qs = super().get_queryset().order_by('-created_on')
         query = self.request.GET.get("q")
         if query is not None:
-            list = query.split(" ")
             qs = qs.filter(
-                Q(user__first_name__icontains=query)
-                | Q(user__last_name__icontains=query)
-                | Q(user__first_name__in=list)
-                | Q(user__last_name__in=list)
-            ).distinct()
-
-        query_undercare = self.request.GET.get("undercare")
-        if query_undercare is not None:
-            qs = qs.filter(
-                Q(supervisor_patient__user__id__exact=query_undercare)
-            ).distinct()
+                normalized_lookup(query, 'user__first_name', 'user__last_name')
+            )
+
         return qs
 
 
-class SupervisorViewset(viewsets.ModelViewSet):
+class SupervisorViewset(QueryPlanMixin, viewsets.ModelViewSet):
     queryset = models.Supervisor.objects.all()
     serializer_class = serializer.SupervisorSerializer
     pagination_class = StandardResultsSetPagination
@@ -161,13 +159,9 @@ class SupervisorViewset(viewsets.ModelViewSet):
         qs = super().get_queryset().order_by('-id')
         query = self.request.GET.get("q")
         if query is not None:
-            list = query.split(" ")
             qs = qs.filter(
-                Q(user__first_name__icontains=query)
-                | Q(user__last_name__icontains=query)
-                | Q(user__first_name__in=list)
-                | Q(user__last_name__in=list)
-            ).distinct()
+                normalized_lookup(query, 'user__first_name', 'user__last_name')
+            )
         return qs
 
 
@@ -339,7 +333,7 @@ class SupervisorRegisterAPIView(APIView):
                 return Response(serializerr.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class DoctorViewset(viewsets.ModelViewSet):
+class DoctorViewset(QueryPlanMixin, viewsets.ModelViewSet):
     queryset = models.Doctor.objects.all()
     serializer_class = serializer.DoctorSerializer
     pagination_class = StandardResultsSetPagination
@@ -349,336 +343,388 @@ class DoctorViewset(viewsets.ModelViewSet):
         qs = super().get_queryset().order_by('-id')
         query = self.request.GET.get("q")
         if query is not None:
-            list = query.split(" ")
             qs = qs.filter(
-                Q(specialyTitle__icontains=query)
-                | Q(user__phone_number=query)
-                | Q(user__first_name__icontains=query)
-                | Q(user__last_name__icontains=query)
-                | Q(specialyTitle__in=list)
-                | Q(user__first_name__in=list)
-                | Q(user__last_name__in=list)
-            ).distinct()
+                Q(user__phone_number=normalize(query))
+                | normalized_lookup(query, 'specialyTitle', 'user__first_name', 'user__last_name')
+            )
         return qs
 
 
-class ClinicViewset(viewsets.ModelViewSet):
+class ClinicViewset(FilterMixin, SearchMixin, QueryPlanMixin, viewsets.ModelViewSet):
     queryset = models.Clinic.objects.all()
     serializer_class = serializer.ClinicSerializer
     pagination_class = StandardResultsSetPagination
     # permission_classes = [permissions.IsAuthenticatedOrReadOnly, ]
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsClinicOwner, ]
+    search_fields = ('title', 'clinicGroup__title')
+    query_filters = [
+        QueryFilter('organsClinic', 'questionShares_clinic__questionOrgans_questionShare__organ__name__in'),
+    ]
 
     def get_queryset(self):
-        qs = super().get_queryset().order_by('-id')
-        query = self.request.GET.get("q")
-        if query is not None:
-            qs = qs.filter(
-                Q(clinicGroup__title__icontains=query)
-                | Q(title__icontains=query)
-            ).distinct()
-
-        query_oc = self.request.GET.get("organsClinic")
-        if query_oc is not None:
-
-            list = query_oc.split(" ")
-            question_share = models.QuestionShare.objects.filter(
-                Q(questionOrgans_questionShare__organ__name__in=list)
-            ).distinct()
-            a_key = "clinic"
-            list_of_dicts = question_share.values('clinic')
-            values_of_key = [a_dict[a_key] for a_dict in list_of_dicts]
-            qs = qs.filter(
-                Q(pk__in=values_of_key)
-            ).distinct()
-
-        return qs
+        return super().get_queryset().order_by('-id')
 
 
-class RealClinicViewset(viewsets.ModelViewSet):
+class RealClinicViewset(SearchMixin, QueryPlanMixin, viewsets.ModelViewSet):
     queryset = models.RealClinic.objects.all()
     serializer_class = serializer.RealClinicSerializer
     pagination_class = StandardResultsSetPagination
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, ]
+    search_fields = ('name', 'description', 'address')
 
     def get_queryset(self):
-        qs = super().get_queryset().order_by('-id')
-        query = self.request.GET.get("q")
-        if query is not None:
-            list = query.split(" ")
-            qs = qs.filter(
-                Q(name__icontains=query)
-                | Q(description__icontains=query)
-                | Q(address__icontains=query)
-                | Q(name__in=list)
-                | Q(description__in=list)
-                | Q(address__in=list)
-            ).distinct()
-        return qs
+        return super().get_queryset().order_by('-id')
 
 
-class RealDoctorViewset(viewsets.ModelViewSet):
+class RealDoctorViewset(SearchMixin, QueryPlanMixin, viewsets.ModelViewSet):
     queryset = models.RealDoctor.objects.all()
     serializer_class = serializer.RealDoctorSerializer
     pagination_class = StandardResultsSetPagination
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, ]
+    search_fields = ('name', 'specialyTitle', 'description', 'address')
 
     def get_queryset(self):
-        qs = super().get_queryset().order_by('-id')
-        query = self.request.GET.get("q")
-        if query is not None:
-            list = query.split(" ")
-            qs = qs.filter(
-                Q(name__icontains=query)
-                | Q(specialyTitle__icontains=query)
-                | Q(description__icontains=query)
-                | Q(address__icontains=query)
-                | Q(name__in=list)
-                | Q(specialyTitle__in=list)
-                | Q(description__in=list)
-                | Q(address__in=list)
-            ).distinct()
-        return qs
+        return super().get_queryset().order_by('-id')
 
 
-class MediaViewset(viewsets.ModelViewSet):
+class MediaViewset(SearchMixin, QueryPlanMixin, viewsets.ModelViewSet):
     queryset = models.Media.objects.all()
     serializer_class = serializer.MediaSerializer
     pagination_class = StandardResultsSetPagination
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, ]
+    search_fields = ('name',)
 
     def get_queryset(self):
-        qs = super().get_queryset().order_by('-id')
-        query = self.request.GET.get("q")
-        if query is not None:
-            list = query.split(" ")
-            qs = qs.filter(
-                Q(name__icontains=query)
-                | Q(name__in=list)
-            ).distinct()
-
-        return qs
+        return super().get_queryset().order_by('-id')
 
 
-class ClinicMediaViewset(viewsets.ModelViewSet):
+class ClinicMediaViewset(FilterMixin, SearchMixin, QueryPlanMixin, viewsets.ModelViewSet):
     queryset = models.ClinicMedia.objects.all()
     serializer_class = serializer.ClinicMediaSerializer
     pagination_class = StandardResultsSetPagination
     # permission_classes = [permissions.IsAuthenticatedOrReadOnly, ]
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsClinicMediaAndInfoOwner, ]
+    search_fields = ('clinic__title', 'media__name')
+    query_filters = [
+        QueryFilter('category', 'media__category__exact'),
+        QueryFilter('clinic', 'clinic__id__exact'),
+        QueryFilter('doctor', 'clinic__agent__id__exact'),
+    ]
 
     def get_queryset(self):
-        qs = super().get_queryset().order_by('-id')
-        query = self.request.GET.get("q")
-        if query is not None:
-            list = query.split(" ")
-            qs = qs.filter(
-                Q(clinic__title__icontains=query)
-                | Q(media__name__icontains=query)
-                | Q(clinic__title__in=list)
-                | Q(media__name__in=list)
-            ).distinct()
-
-        query_category = self.request.GET.get("category")
-        if query_category is not None:
-            qs = qs.filter(
-                Q(media__category__exact=query_category)
-            ).distinct()
+        return super().get_queryset().order_by('-id')
 
-        query_clinic = self.request.GET.get("clinic")
-        if query_clinic is not None:
-            qs = qs.filter(
-                Q(clinic__id__exact=query_clinic)
-            ).distinct()
 
-        query_doctor = self.request.GET.get("doctor")
-        if query_doctor is not None:
-            qs = qs.filter(
-                Q(clinic__agent__id__exact=query_doctor)
-            ).distinct()
-        return qs
-
-
-class QuestionShareMediaViewset(viewsets.ModelViewSet):
+class QuestionShareMediaViewset(SearchMixin, QueryPlanMixin, viewsets.ModelViewSet):
     queryset = models.QuestionShareMedia.objects.all()
     serializer_class = serializer.QuestionShareMediaSerializer
     pagination_class = StandardResultsSetPagination
     # permission_classes = [permissions.IsAuthenticatedOrReadOnly, ]
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsQuestionOptionAndOrganOwner, ]
+    search_fields = ('media__name',)
 
     def get_queryset(self):
-        qs = super().get_queryset().order_by('-id')
-        query = self.request.GET.get("q")
-        if query is not None:
-            list = query.split(" ")
-            qs = qs.filter(
-                Q(media__name__icontains=query)
-                | Q(media__name__in=list)
-            ).distinct()
-
-        return qs
+        return super().get_queryset().order_by('-id')
 
 
-class CheckupViewset(viewsets.ModelViewSet):
+class CheckupViewset(FilterMixin, SearchMixin, QueryPlanMixin, viewsets.ModelViewSet):
     queryset = models.Checkup.objects.all()
     serializer_class = serializer.CheckupSerializer
     pagination_class = StandardResultsSetPagination
     # permission_classes = [permissions.IsAuthenticatedOrReadOnly, ]
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsCheckupOwner, ]
+    search_fields = ('title', 'clinic__title')
+    query_filters = [
+        QueryFilter('patient', 'patientProfile__user__id__exact'),
+    ]
 
     def get_queryset(self):
-        qs = super().get_queryset().order_by('-id')
-        query = self.request.GET.get("q")
-        if query is not None:
-            qs = qs.filter(
-                Q(clinic__title__icontains=query)
-                | Q(title__icontains=query)
-            ).distinct()
-        query_patient = self.request.GET.get("patient")
-        if query_patient is not None:
-            # list = query_patient.split(" ")
-            qs = qs.filter(
-                Q(patientProfile__user__id__exact=query_patient)
-                # Q(patientProfile__user__first_name__icontains=query_patient)
-                # | Q(patientProfile__user__last_name__icontains=query_patient)
-                # | Q(patientProfile__user__first_name__in=list)
-                # | Q(patientProfile__user__last_name__in=list)
-            ).distinct()
-        return qs
-
-
-class ClinicCheckupViewset(viewsets.ModelViewSet):
+        return super().get_queryset().order_by('-id')
+
+    @action(detail=True, methods=['post'])
+    def evaluate(self, request, pk=None):
+        """
+        Evaluates the equation of a question against the answers given in this checkup.
+        Variables posted in "variables" (e.g. {"q12": 70}) take precedence over stored answers.
+        """
+        checkup = self.get_object()
+        question = get_object_or_404(
+            models.QuestionShare.objects.only('id', 'clinic_id', 'equation'), id=request.data.get('question')
+        )
+        if not question.equation:
+            return Response({'error': 'Question has no equation'}, status=status.HTTP_400_BAD_REQUEST)
+        variables = answer_variables(checkup.id)
+        try:
+            variables.update(parse_variables(request.data.get('variables') or {}))
+            value = evaluate_question_equation(question.id, question.equation, variables)
+        except EquationError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            'question': question.id,
+            'value': value,
+            'questionOption': get_band_index(question, 'equation').resolve(value),
+        })
+
+    @action(detail=True, methods=['post'])
+    def answers(self, request, pk=None):
+        """
+        Replaces all answers of the checkup in one transaction and returns the computed result.
+        Body: {"answers": [{"questionShare": 1, "questionOption": 2}, ...]}
+        """
+        checkup = self.get_object()
+        answers = request.data.get('answers') if isinstance(request.data, dict) else request.data
+        if not isinstance(answers, list):
+            return Response({'answers': 'A list of answers is required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        pairs = []
+        errors = {}
+        for i, answer in enumerate(answers):
+            try:
+                pairs.append((int(answer['questionShare']), int(answer['questionOption'])))
+            except (TypeError, KeyError, ValueError):
+                errors[i] = 'questionShare and questionOption ids are required'
+        if not errors:
+            errors = self._invalid_answers(checkup, pairs)
+        if errors:
+            return Response({'answers': errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        with transaction.atomic(), checkup_results_suspended():
+            models.QuestionAnswer.objects.filter(checkup=checkup).delete()
+            models.QuestionAnswer.objects.bulk_create([
+                models.QuestionAnswer(checkup=checkup, questionShare_id=question_id, questionOption_id=option_id)
+                for question_id, option_id in pairs
+            ])
+            result = models.CheckupResult.rebuild(checkup.id)
+        return Response({'answers': len(pairs), 'result': serialize_checkup_result(result)},
+                        status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=['get'])
+    def graph(self, request, pk=None):
+        """
+        The question graph this checkup is answered against, its pinned version when one was published.
+        """
+        checkup = self.get_object()
+        if checkup.graph_version_id is not None:
+            return bundle_response(request, get_version_bundle(checkup.graph_version_id), immutable=True)
+        return bundle_response(request, get_bundle(checkup.clinic_checkup))
+
+    @action(detail=True, methods=['get'], url_path='nextQuestion')
+    def next_question(self, request, pk=None):
+        """
+        Next question of this checkup for the given question and chosen option, answered from the
+        question graph it is pinned to, so publishing mid-checkup does not change the patient's path.
+        """
+        checkup = self.get_object()
+        if not checkup.clinic_checkup_id:
+            return Response({'error': 'Checkup has no clinic checkup'}, status=status.HTTP_400_BAD_REQUEST)
+        return next_question_response(request, get_checkup_graph(checkup))
+
+    @staticmethod
+    def _invalid_answers(checkup, pairs):
+        """
+        Checks every (question, option) pair against the question graph of the checkup at once.
+        """
+        errors = {}
+        seen = set()
+        if checkup.clinic_checkup_id:
+            graph = get_checkup_graph(checkup)
+            options = {question_id: set(graph.options_of(question_id)) for question_id, _ in pairs
+                       if question_id in graph}
+        else:
+            options = {}
+            rows = models.QuestionOption.objects.filter(
+                pk__in={option_id for _, option_id in pairs}
+            ).values_list('questionShare_id', 'id')
+            for question_id, option_id in rows:
+                options.setdefault(question_id, set()).add(option_id)
+        for i, pair in enumerate(pairs):
+            question_id, option_id = pair
+            if question_id not in options:
+                errors[i] = f'Question {question_id} is not part of this checkup'
+            elif option_id not in options[question_id]:
+                errors[i] = f'Option {option_id} does not belong to question {question_id}'
+            elif pair in seen:
+                errors[i] = 'Duplicated answer'
+            seen.add(pair)
+        return errors
+
+
+class ClinicCheckupViewset(FilterMixin, SearchMixin, QueryPlanMixin, viewsets.ModelViewSet):
     queryset = models.ClinicCheckup.objects.all()
     serializer_class = serializer.ClinicCheckupSerializer
     pagination_class = StandardResultsSetPagination
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, ]
+    search_fields = ('title', 'clinic__title')
+    query_filters = [
+        QueryFilter('clinic', 'clinic__id__exact'),
+    ]
 
     def get_queryset(self):
-        qs = super().get_queryset().order_by('-id')
-        query = self.request.GET.get("q")
-        if query is not None:
-            qs = qs.filter(
-                Q(clinic__title__icontains=query)
-                | Q(title__icontains=query)
-            ).distinct()
-        query_clinic = self.request.GET.get("clinic")
-        if query_clinic is not None:
-            # list = query_patient.split(" ")
-            qs = qs.filter(
-                Q(clinic__id__exact=query_clinic)
-                # Q(patientProfile__user__first_name__icontains=query_patient)
-                # | Q(patientProfile__user__last_name__icontains=query_patient)
-                # | Q(patientProfile__user__first_name__in=list)
-                # | Q(patientProfile__user__last_name__in=list)
-            ).distinct()
-        return qs
+        return super().get_queryset().order_by('-id')
+
+    @action(detail=True, methods=['get'], url_path='nextQuestion')
+    def next_question(self, request, pk=None):
+        """
+        Next question of the checkup for the given question and chosen option,
+        answered from the compiled question graph.
+        """
+        return next_question_response(request, get_compiled_graph(self.get_object()))
+
+    @action(detail=True, methods=['get'])
+    def bundle(self, request, pk=None):
+        """
+        The whole reachable question graph of the checkup in one precompressed document.
+        """
+        return bundle_response(request, get_bundle(self.get_object()))
+
+    @action(detail=True, methods=['post'], permission_classes=[permissions.IsAuthenticated])
+    def publish(self, request, pk=None):
+        """
+        Publishes the current question graph as a new immutable version. Checkups started from now on
+        are answered against it.
+        """
+        version, created = publish_version(self.get_object())
+        return Response({'id': version.id, 'number': version.number, 'etag': version.etag},
+                        status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+
+    @action(detail=True, methods=['post'], permission_classes=[permissions.IsAuthenticated])
+    def clone(self, request, pk=None):
+        """
+        Copies the checkup and its whole question graph, optionally into another clinic of the user.
+        Body: {"title": "...", "clinic": 1}
+        """
+        clinic_checkup = self.get_object()
+        clinic = get_object_or_404(
+            models.Clinic.objects.select_related('agent__user'),
+            pk=request.data.get('clinic') or clinic_checkup.clinic_id
+        )
+        if clinic.agent.user != request.user:
+            return Response({'error': 'Only the agent of the clinic can clone into it'},
+                            status=status.HTTP_403_FORBIDDEN)
+        try:
+            clone = clone_clinic_checkup(clinic_checkup, clinic, request.data.get('title'))
+        except CloneError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(self.get_serializer(clone).data, status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=['get'], url_path=r'versions/(?P<number>\d+)')
+    def version(self, request, pk=None, number=None):
+        """
+        The document of a published version, cacheable forever.
+        """
+        version_id = get_object_or_404(
+            models.ClinicCheckupVersion.objects.values_list('id', flat=True), clinic_checkup_id=pk, number=number
+        )
+        return bundle_response(request, get_version_bundle(version_id), immutable=True)
 
 
-class CheckupFlowchartViewset(viewsets.ModelViewSet):
+def bundle_response(request, bundle, immutable=False):
+    """
+    Serves a precompressed Bundle in the best accepted content coding, answering 304 to a matching
+    If-None-Match.
+    """
+    accepted = request.META.get('HTTP_ACCEPT_ENCODING', '')
+    encoding = next((encoding for encoding in bundle.encoded if encoding in accepted), None)
+    etag = f'"{bundle.etag}-{encoding}"' if encoding else f'"{bundle.etag}"'
+
+    if_none_match = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+    if '*' in if_none_match or any(tag.strip('"').split('-')[0] == bundle.etag for tag in if_none_match):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(bundle.encoded[encoding] if encoding else bundle.content,
+                                content_type='application/json')
+        if encoding:
+            response['Content-Encoding'] = encoding
+    response['ETag'] = etag
+    response['Vary'] = 'Accept-Encoding'
+    if immutable:
+        response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+
+def next_question_response(request, graph):
+    """
+    The question after the "question" and chosen "option" parameters in ``graph``, the starting
+    question without them.
+    """
+    question = request.GET.get("question")
+    option = request.GET.get("option")
+    try:
+        if question is None:
+            next_id = graph.start if graph.start in graph else None
+        else:
+            next_id = graph.next_question(int(question), int(option) if option else None)
+    except ValueError:
+        return Response({'error': 'question and option must be ids'}, status=status.HTTP_400_BAD_REQUEST)
+    except UnknownNode as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({'question': next_id, 'end': next_id is None})
+
+
+class CheckupFlowchartViewset(FilterMixin, SearchMixin, QueryPlanMixin, viewsets.ModelViewSet):
     queryset = models.CheckupFlowchart.objects.all()
     serializer_class = serializer.CheckupFlowchartSerializer
     pagination_class = StandardResultsSetPagination
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, ]
+    search_fields = ('title',)
+    query_filters = [
+        QueryFilter('clinic', 'clinic_checkup__clinic__id__exact'),
+        QueryFilter('clinicCheckup', 'clinic_checkup__id__exact'),
+    ]
 
     def get_queryset(self):
-        qs = super().get_queryset().order_by('-id')
-        query = self.request.GET.get("q")
-        if query is not None:
-            qs = qs.filter(
-                Q(title__icontains=query)
-            ).distinct()
+        return super().get_queryset().order_by('-id')
 
-        query_clinic = self.request.GET.get("clinic")
-        if query_clinic is not None:
-            qs = qs.filter(
-                Q(clinic_checkup__clinic__id__exact=query_clinic)
-            ).distinct()
 
-        query_clinicCheckup = self.request.GET.get("clinicCheckup")
-        if query_clinicCheckup is not None:
-            qs = qs.filter(
-                Q(clinic_checkup__id__exact=query_clinicCheckup)
-            ).distinct()
-        return qs
-
-
-class CheckupAnalyzeViewset(viewsets.ModelViewSet):
+class CheckupAnalyzeViewset(FilterMixin, SearchMixin, QueryPlanMixin, viewsets.ModelViewSet):
     queryset = models.CheckupAnalyze.objects.all()
     serializer_class = serializer.CheckupAnalyzeSerializer
     pagination_class = StandardResultsSetPagination
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, ]
+    search_fields = ('title',)
+    query_filters = [
+        QueryFilter('clinic', 'clinic_checkup__clinic__id__exact'),
+        QueryFilter('clinicCheckup', 'clinic_checkup__id__exact'),
+    ]
 
     def get_queryset(self):
-        qs = super().get_queryset().order_by('-id')
-        query = self.request.GET.get("q")
-        if query is not None:
-            qs = qs.filter(
-                Q(title__icontains=query)
-            ).distinct()
-
-        query_clinic = self.request.GET.get("clinic")
-        if query_clinic is not None:
-            qs = qs.filter(
-                Q(clinic_checkup__clinic__id__exact=query_clinic)
-            ).distinct()
-
-        query_clinicCheckup = self.request.GET.get("clinicCheckup")
-        if query_clinicCheckup is not None:
-            qs = qs.filter(
-                Q(clinic_checkup__id__exact=query_clinicCheckup)
-            ).distinct()
-        return qs
+        return super().get_queryset().order_by('-id')
 
 
-class InterpretationViewset(viewsets.ModelViewSet):
+class InterpretationViewset(SearchMixin, QueryPlanMixin, viewsets.ModelViewSet):
     queryset = models.Interpretation.objects.all()
     serializer_class = serializer.InterpretationSerializer
     pagination_class = StandardResultsSetPagination
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, ]
+    search_fields = ('text',)
 
     def get_queryset(self):
-        qs = super().get_queryset().order_by('-id')
-        query = self.request.GET.get("q")
-        if query is not None:
-            qs = qs.filter(
-                Q(text__icontains=query)
-            ).distinct()
-        return qs
+        return super().get_queryset().order_by('-id')
 
 
-class SuggestionViewset(viewsets.ModelViewSet):
+class SuggestionViewset(SearchMixin, QueryPlanMixin, viewsets.ModelViewSet):
     queryset = models.Suggestion.objects.all()
     serializer_class = serializer.SuggestionSerializer
     pagination_class = StandardResultsSetPagination
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, ]
+    search_fields = ('interpretation__text',)
 
     def get_queryset(self):
-        qs = super().get_queryset().order_by('-id')
-        query = self.request.GET.get("q")
-        if query is not None:
-            qs = qs.filter(
-                Q(interpretation__text__icontains=query)
-            ).distinct()
-        return qs
+        return super().get_queryset().order_by('-id')
 
 
-class JobViewset(viewsets.ModelViewSet):
+class JobViewset(SearchMixin, ValuesListMixin, viewsets.ModelViewSet):
     queryset = models.Job.objects.all()
     serializer_class = serializer.JobSerializer
     pagination_class = StandardResultsSetPagination
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, ]
+    search_fields = ('title',)
 
     def get_queryset(self):
-        qs = super().get_queryset().order_by('-id')
-        query = self.request.GET.get("q")
-        if query is not None:
-            qs = qs.filter(
-                Q(title__icontains=query)
-            ).distinct()
-        return qs
+        return super().get_queryset().order_by('-id')
 
 
-class IllnessViewset(viewsets.ModelViewSet):
+class IllnessViewset(ValuesListMixin, viewsets.ModelViewSet):
     queryset = models.Illness.objects.all()
     serializer_class = serializer.IllnessSerializer
     pagination_class = StandardResultsSetPagination
@@ -689,12 +735,12 @@ class IllnessViewset(viewsets.ModelViewSet):
         query = self.request.GET.get("q")
         if query is not None:
             qs = qs.filter(
-                Q(title__icontains=query)
-            ).distinct()
+                normalized_lookup(query, 'title')
+            )
         return qs
 
 
-class DrugViewset(viewsets.ModelViewSet):
+class DrugViewset(ValuesListMixin, viewsets.ModelViewSet):
     queryset = models.Drug.objects.all()
     serializer_class = serializer.DrugSerializer
     pagination_class = StandardResultsSetPagination
@@ -705,76 +751,56 @@ class DrugViewset(viewsets.ModelViewSet):
         query = self.request.GET.get("q")
         if query is not None:
             qs = qs.filter(
-                Q(title__icontains=query)
-            ).distinct()
+                normalized_lookup(query, 'title')
+            )
         return qs
 
 
-class DrugAmountViewset(viewsets.ModelViewSet):
+class DrugAmountViewset(SearchMixin, ValuesListMixin, viewsets.ModelViewSet):
     queryset = models.DrugAmount.objects.all()
     serializer_class = serializer.DrugAmountSerializer
     pagination_class = StandardResultsSetPagination
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, ]
+    search_fields = ('title',)
 
     def get_queryset(self):
-        qs = super().get_queryset().order_by('-id')
-        query = self.request.GET.get("q")
-        if query is not None:
-            qs = qs.filter(
-                Q(title__icontains=query)
-            ).distinct()
-        return qs
+        return super().get_queryset().order_by('-id')
 
 
-class DrugInstructionViewset(viewsets.ModelViewSet):
+class DrugInstructionViewset(SearchMixin, ValuesListMixin, viewsets.ModelViewSet):
     queryset = models.DrugInstruction.objects.all()
     serializer_class = serializer.DrugInstructionSerializer
     pagination_class = StandardResultsSetPagination
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, ]
+    search_fields = ('title',)
 
     def get_queryset(self):
-        qs = super().get_queryset().order_by('-id')
-        query = self.request.GET.get("q")
-        if query is not None:
-            qs = qs.filter(
-                Q(title__icontains=query)
-            ).distinct()
-        return qs
+        return super().get_queryset().order_by('-id')
 
 
-class PatientIllnessViewset(viewsets.ModelViewSet):
+class PatientIllnessViewset(SearchMixin, QueryPlanMixin, viewsets.ModelViewSet):
     queryset = models.PatientIllness.objects.all()
     serializer_class = serializer.PatientIllnessSerializer
     pagination_class = StandardResultsSetPagination
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, ]
+    search_fields = ('illness__title',)
 
     def get_queryset(self):
-        qs = super().get_queryset().order_by('-id')
-        query = self.request.GET.get("q")
-        if query is not None:
-            qs = qs.filter(
-                Q(illness__title__icontains=query)
-            ).distinct()
-        return qs
+        return super().get_queryset().order_by('-id')
 
 
-class PatientFamilyIllnessViewset(viewsets.ModelViewSet):
+class PatientFamilyIllnessViewset(SearchMixin, QueryPlanMixin, viewsets.ModelViewSet):
     queryset = models.PatientFamilyIllness.objects.all()
     serializer_class = serializer.PatientFamilyIllnessSerializer
     pagination_class = StandardResultsSetPagination
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, ]
+    search_fields = ('illness__title',)
 
     def get_queryset(self):
-        qs = super().get_queryset().order_by('-id')
-        query = self.request.GET.get("q")
-        if query is not None:
-            qs = qs.filter(
-                Q(illness__title__icontains=query)
-            ).distinct()
-        return qs
+        return super().get_queryset().order_by('-id')
 
 
-class PatientDrugViewset(viewsets.ModelViewSet):
+class PatientDrugViewset(QueryPlanMixin, viewsets.ModelViewSet):
     queryset = models.PatientDrug.objects.all()
     serializer_class = serializer.PatientDrugSerializer
     pagination_class = StandardResultsSetPagination
@@ -786,11 +812,11 @@ class PatientDrugViewset(viewsets.ModelViewSet):
         if query is not None:
             qs = qs.filter(
                 Q(illness__title__icontains=query)
-            ).distinct()
+            )
         return qs
 
 
-class PatientJobViewset(viewsets.ModelViewSet):
+class PatientJobViewset(QueryPlanMixin, viewsets.ModelViewSet):
     queryset = models.PatientJob.objects.all()
     serializer_class = serializer.PatientJobSerializer
     pagination_class = StandardResultsSetPagination
@@ -802,11 +828,11 @@ class PatientJobViewset(viewsets.ModelViewSet):
         if query is not None:
             qs = qs.filter(
                 Q(illness__title__icontains=query)
-            ).distinct()
+            )
         return qs
 
 
-class PatientBiographyViewset(viewsets.ModelViewSet):
+class PatientBiographyViewset(QueryPlanMixin, viewsets.ModelViewSet):
     queryset = models.PatientBiography.objects.all()
     serializer_class = serializer.PatientBiographySerializer
     pagination_class = StandardResultsSetPagination
@@ -818,11 +844,11 @@ class PatientBiographyViewset(viewsets.ModelViewSet):
         if query is not None:
             qs = qs.filter(
                 Q(illness__title__icontains=query)
-            ).distinct()
+            )
         return qs
 
 
-class MedicalRecordViewset(viewsets.ModelViewSet):
+class MedicalRecordViewset(QueryPlanMixin, viewsets.ModelViewSet):
     queryset = models.MedicalRecord.objects.all()
     serializer_class = serializer.MedicalRecordSerializer
     pagination_class = StandardResultsSetPagination
@@ -834,27 +860,52 @@ class MedicalRecordViewset(viewsets.ModelViewSet):
         if query is not None:
             qs = qs.filter(
                 Q(illness__title__icontains=query)
-            ).distinct()
+            )
         return qs
 
 
-class OrganViewset(viewsets.ModelViewSet):
+class OrganViewset(SearchMixin, ValuesListMixin, QueryPlanMixin, viewsets.ModelViewSet):
     queryset = models.Organ.objects.all()
     serializer_class = serializer.OrganSerializer
     pagination_class = StandardResultsSetPagination
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, ]
+    search_fields = ('name',)
+    values_fields = {
+        'id': 'id',
+        'name': 'name',
+        'parent': 'parent_id',
+        'parent_name': Coalesce('parent__name', Value('')),
+    }
 
     def get_queryset(self):
-        qs = super().get_queryset().order_by('-id')
-        query = self.request.GET.get("q")
-        if query is not None:
-            qs = qs.filter(
-                Q(name__icontains=query)
-            ).distinct()
-        return qs
-
-
-class QuestionOptionEquationViewset(viewsets.ModelViewSet):
+        return super().get_queryset().order_by('-id')
+
+    @action(detail=False, methods=['get'])
+    def tree(self, request):
+        """
+        The whole organ tree in one response, or the subtree of ?root=<id>, from the cached tree.
+        """
+        tree = get_organ_tree()
+        root = request.GET.get('root')
+        if root is None:
+            return Response(tree.nested())
+        try:
+            return Response(tree.subtree(int(root)))
+        except (KeyError, ValueError):
+            raise Http404
+
+    @action(detail=True, methods=['get'])
+    def ancestors(self, request, pk=None):
+        """
+        The path from the root organ down to this organ.
+        """
+        try:
+            return Response(get_organ_tree().ancestors(int(pk)))
+        except (KeyError, ValueError):
+            raise Http404
+
+
+class QuestionOptionEquationViewset(QueryPlanMixin, viewsets.ModelViewSet):
     queryset = models.QuestionOptionEquation.objects.all()
     serializer_class = serializer.QuestionOptionEquationSerializer
     pagination_class = StandardResultsSetPagination
@@ -862,7 +913,7 @@ class QuestionOptionEquationViewset(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsQuestionOptionNumEqDatOwner, ]
 
 
-class QuestionOptionNumberViewset(viewsets.ModelViewSet):
+class QuestionOptionNumberViewset(QueryPlanMixin, viewsets.ModelViewSet):
     queryset = models.QuestionOptionNumber.objects.all()
     serializer_class = serializer.QuestionOptionNumberSerializer
     pagination_class = StandardResultsSetPagination
@@ -870,7 +921,7 @@ class QuestionOptionNumberViewset(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsQuestionOptionNumEqDatOwner, ]
 
 
-class QuestionOptionDateViewset(viewsets.ModelViewSet):
+class QuestionOptionDateViewset(QueryPlanMixin, viewsets.ModelViewSet):
     queryset = models.QuestionOptionDate.objects.all()
     serializer_class = serializer.QuestionOptionDateSerializer
     pagination_class = StandardResultsSetPagination
@@ -878,7 +929,7 @@ class QuestionOptionDateViewset(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsQuestionOptionNumEqDatOwner, ]
 
 
-class QuestionOrganViewset(viewsets.ModelViewSet):
+class QuestionOrganViewset(QueryPlanMixin, viewsets.ModelViewSet):
     queryset = models.QuestionOrgan.objects.all()
     serializer_class = serializer.QuestionOrganSerializer
     pagination_class = StandardResultsSetPagination
@@ -886,12 +937,15 @@ class QuestionOrganViewset(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsQuestionOptionAndOrganOwner, ]
 
 
-class QuestionAnswerViewset(viewsets.ModelViewSet):
+class QuestionAnswerViewset(FilterMixin, QueryPlanMixin, viewsets.ModelViewSet):
     queryset = models.QuestionAnswer.objects.all()
     serializer_class = serializer.QuestionAnswerSerializer
     pagination_class = StandardResultsSetPagination
     # permission_classes = [permissions.IsAuthenticatedOrReadOnly, ]
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsQuestionAnswerOwner, ]
+    query_filters = [
+        QueryFilter('q', 'checkup__clinic__id__exact'),
+    ]
 
     def get_queryset(self):
         qs = super().get_queryset().order_by('-id')
@@ -904,13 +958,7 @@ class QuestionAnswerViewset(viewsets.ModelViewSet):
                 is_get_all = True
         if is_get_all is False:
             user = self.request.user
-            qs = qs.filter(Q(checkup__clinic__id=user.id)).distinct()
-
-        query = self.request.GET.get("q")
-        if query is not None:
-            qs = qs.filter(
-                Q(checkup__clinic__id__exact=query)
-            ).distinct()
+            qs = qs.filter(Q(checkup__clinic__id=user.id))
 
         query_patient = self.request.GET.get("patient")
         if query_patient is not None:
@@ -920,34 +968,41 @@ class QuestionAnswerViewset(viewsets.ModelViewSet):
                 | Q(checkup__patientProfile__user__last_name__icontains=query_patient)
                 | Q(checkup__patientProfile__user__first_name__in=list)
                 | Q(checkup__patientProfile__user__last_name__in=list)
-            ).distinct()
+            )
 
         return qs
 
 
-class QuestionOptionViewset(viewsets.ModelViewSet):
+class QuestionOptionViewset(FilterMixin, QueryPlanMixin, viewsets.ModelViewSet):
     queryset = models.QuestionOption.objects.all()
     serializer_class = serializer.QuestionOptionSerializer
     pagination_class = StandardResultsSetPagination
     # permission_classes = [permissions.IsAuthenticatedOrReadOnly, ]
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsQuestionOptionAndOrganOwner, ]
+    query_filters = [
+        QueryFilter('q', 'title__icontains'),
+    ]
 
     def get_queryset(self):
-        qs = super().get_queryset().order_by('-id')
-        query = self.request.GET.get("q")
-        if query is not None:
-            qs = qs.filter(
-                Q(title__icontains=query)
-            ).distinct()
-        return qs
+        return super().get_queryset().order_by('-id')
 
 
-class QuestionShareViewset(viewsets.ModelViewSet):
+class QuestionShareViewset(FilterMixin, QueryPlanMixin, viewsets.ModelViewSet):
     queryset = models.QuestionShare.objects.all()
     serializer_class = serializer.QuestionShareSerializer
     pagination_class = StandardResultsSetPagination
     # permission_classes = [permissions.IsAuthenticatedOrReadOnly, ]
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsQuestionShareOwner, ]
+    query_filters = [
+        QueryFilter('clinic', 'clinic__id__exact'),
+        QueryFilter('expert_level', 'expert_level__exact'),
+        QueryFilter('organs', 'questionOrgans_questionShare__organ__name__in'),
+    ]
+
+    def plan_queryset(self, queryset):
+        if self.request.method not in permissions.SAFE_METHODS:
+            return super().plan_queryset(queryset)
+        return question_share_queryset(queryset, self.get_serializer())
 
     def get_queryset(self):
         qs = super().get_queryset().order_by('-id')
@@ -962,36 +1017,41 @@ class QuestionShareViewset(viewsets.ModelViewSet):
         if is_get_all is False:
             user = self.request.user
             # print(f"filter {user}")
-            qs = qs.filter(Q(doctor__user=user.id)).distinct()
+            qs = qs.filter(Q(doctor__user=user.id))
             # print(qs)
 
-        query_clinic = self.request.GET.get("clinic")
-        if query_clinic is not None:
-            qs = qs.filter(
-                Q(clinic__id__exact=query_clinic)
-            ).distinct()
-
-        query_qlevel = self.request.GET.get('expert_level')
-        if query_qlevel is not None:
-            qs = qs.filter(
-                Q(expert_level__exact=query_qlevel)
-            ).distinct()
-
         query = self.request.GET.get("q")
         if query is not None:
             qs = qs.filter(
                 Q(title__icontains=query)
                 | Q(short_title__icontains=query)
-            ).distinct()
+            )
 
-        query_organs = self.request.GET.get("organs")
-        if query_organs is not None:
-            list = query_organs.split(" ")
-            qs = qs.filter(
-                Q(questionOrgans_questionShare__organ__name__in=list)
-            ).distinct()
         return qs
 
+    @action(detail=True, methods=['get', 'post'], permission_classes=[permissions.IsAuthenticated])
+    def bands(self, request, pk=None):
+        """
+        Resolves answer values to options through the band index of the question.
+        GET ?kind=number&value=12 resolves one value, without "value" it reports overlapping and
+        gapped bands. POST {"kind": "number", "values": [...]} resolves a batch of values.
+        """
+        question = get_object_or_404(models.QuestionShare.objects.only('id', 'clinic_id'), id=pk)
+        data = request.data if request.method == 'POST' else request.GET
+        try:
+            index = get_band_index(question, data.get('kind', 'number'))
+            if request.method == 'POST':
+                values = [float(value) for value in data.get('values', [])]
+                return Response({'questionOptions': index.resolve_many(values)})
+            value = data.get('value')
+            if value is None:
+                return Response(index.report())
+            return Response({'questionOption': index.resolve(float(value))})
+        except KeyError as e:
+            return Response({'error': e.args[0]}, status=status.HTTP_400_BAD_REQUEST)
+        except (TypeError, ValueError):
+            return Response({'error': 'values must be numbers'}, status=status.HTTP_400_BAD_REQUEST)
+
 
 # class LightQuestionShareViewset(viewsets.ModelViewSet):
 #     queryset = models.QuestionShare.objects.all()
@@ -1015,12 +1075,21 @@ class QuestionShareViewset(viewsets.ModelViewSet):
 #         return qs
 
 
-class CompressedQuestionShareViewset(viewsets.ModelViewSet):
+class CompressedQuestionShareViewset(FilterMixin, QueryPlanMixin, viewsets.ModelViewSet):
     queryset = models.QuestionShare.objects.all()
     serializer_class = serializer.CompressedQuestionShareSerializer
     pagination_class = StandardResultsSetPagination
     # permission_classes = [permissions.IsAuthenticatedOrReadOnly, ]
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsQuestionShareOwner, ]
+    query_filters = [
+        QueryFilter('clinic', 'clinic__id__exact'),
+        QueryFilter('organs', 'questionOrgans_questionShare__organ__name__in'),
+    ]
+
+    def plan_queryset(self, queryset):
+        if self.request.method not in permissions.SAFE_METHODS:
+            return super().plan_queryset(queryset)
+        return question_share_queryset(queryset, self.get_serializer())
 
     def get_queryset(self):
         qs = super().get_queryset().order_by('-id')
@@ -1033,46 +1102,29 @@ class CompressedQuestionShareViewset(viewsets.ModelViewSet):
                 is_get_all = True
         if is_get_all is False:
             user = self.request.user
-            qs = qs.filter(Q(doctor__user=user.id)).distinct()
-
-        query_clinic = self.request.GET.get("clinic")
-        if query_clinic is not None:
-            qs = qs.filter(
-                Q(clinic__id__exact=query_clinic)
-            ).distinct()
+            qs = qs.filter(Q(doctor__user=user.id))
 
         query = self.request.GET.get("q")
         if query is not None:
             qs = qs.filter(
                 Q(title__icontains=query)
                 | Q(short_title__icontains=query)
-            ).distinct()
+            )
 
-        query_organs = self.request.GET.get("organs")
-        if query_organs is not None:
-            list = query_organs.split(" ")
-            qs = qs.filter(
-                Q(questionOrgans_questionShare__organ__name__in=list)
-            ).distinct()
         return qs
 
 
-class AlertsViewset(viewsets.ModelViewSet):
+class AlertsViewset(FilterMixin, QueryPlanMixin, viewsets.ModelViewSet):
     queryset = models.Alert.objects.all()
     serializer_class = serializer.AlertSerializer
     pagination_class = StandardResultsSetPagination
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, ]
+    query_filters = [
+        QueryFilter('q', 'title__icontains'),
+    ]
 
     def get_queryset(self):
-        qs = super().get_queryset().order_by('-id')
-
-        query = self.request.GET.get("q")
-        if query is not None:
-            qs = qs.filter(
-                Q(title__icontains=query)
-            ).distinct()
-
-        return qs
+        return super().get_queryset().order_by('-id')
 
 
 class FlowchartViewSet(viewsets.ViewSet):
@@ -1089,44 +1141,19 @@ class FlowchartViewSet(viewsets.ViewSet):
 @csrf_exempt
 def flowchart(request):
     if request.method == 'POST':
-        print(f"in post {request.body}")
-        json_data = json.loads(request.body)
-        print(json_data)
-        print(len(json_data))
-        print(json_data[0]['id'])
-
-        for qstShare in json_data:
-            print(qstShare)
-            try:
-                objQstShare = models.QuestionShare.objects.get(id=qstShare['id'])
-
-                objQstShare.chart_is_visible = qstShare['chart_is_visible']
-                objQstShare.chart_global_src_ = qstShare['chart_global_src_x']
-                objQstShare.chart_global_src_y = qstShare['chart_global_src_y']
-                objQstShare.chart_global_des_x = qstShare['chart_global_des_x']
-                objQstShare.chart_global_des_y = qstShare['chart_global_des_y']
-                objQstShare.is_starter = qstShare['is_starter']
-                temp = qstShare['chart_connectQstId']
-                if temp != "null" and temp != "":
-                    obj = models.QuestionShare.objects.get(id=temp)
-                    objQstShare.chart_connectQstId = obj
-                objQstShare.chart_branchCount = qstShare['chart_branchCount']
-                objQstShare.save()
-
-                for qstOption in qstShare['questionOptions_questionShare']:
-                    objQstOption = models.QuestionOption.objects.get(id=qstOption['id'])
-
-                    objQstOption.chart_global_x = qstOption['chart_global_x']
-                    objQstOption.chart_global_y = qstOption['chart_global_y']
-                    temp = qstOption['chart_connectQstId']
-                    if temp != "null" and temp != "":
-                        obj = models.QuestionShare.objects.get(id=temp)
-                        objQstOption.chart_connectQstId = obj
-                    objQstOption.save()
-            except:
-                print("exception rise")
-
-        return HttpResponse("operation done successfully")
+        try:
+            json_data = json.loads(request.body)
+        except ValueError:
+            return JsonResponse({'errors': [{'error': 'Invalid JSON body'}]}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            clinic_ids = save_layout(json_data)
+        except LayoutSaveError as e:
+            return JsonResponse({'errors': e.errors}, status=status.HTTP_400_BAD_REQUEST)
+        for clinic_id in clinic_ids:
+            bump_clinic_graph(clinic_id)
+
+        return JsonResponse({'message': 'operation done successfully', 'errors': []})
     return HttpResponse("operation failed")
     # return Response({"resp": "ok2"})
 
@@ -1144,70 +1171,105 @@ def create_auth(request):
         return Response(serialized._errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+SEARCH_PAGE_SIZE = 20
+
+# kind, results key and serializer of the searched documents
+SEARCH_KINDS = [
+    ('doctor', 'doctors', serializer.DoctorSerializer),
+    ('clinic', 'clinics', serializer.ClinicSerializer),
+]
+
+
+def _positive_int(value, default, maximum=None):
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return default
+    if value < 1:
+        return default
+    return min(value, maximum) if maximum else value
+
+
 @api_view(['GET'])
 # @permission_classes((IsAuthenticated, ))
 def search(request):
+    """
+    Ranked doctors and clinics matching every word of ``q``, from the in-memory search index.
+    ``page`` and ``page_size`` page each kind, the ``*_count`` keys give their total matches.
+    """
     query = request.GET.get("q")
     results = []
     if query:
-        list = query.split(" ")
-        doctors = models.Doctor.objects.filter(Q(specialyTitle__icontains=query)
-                                               | Q(user__first_name__icontains=query)
-                                               | Q(user__last_name__icontains=query)
-                                               | Q(user__first_name__in=list)
-                                               | Q(user__last_name__in=list))
-        clinics = models.Clinic.objects.filter(Q(title__icontains=query))
-        ser_doctor = serializer.DoctorSerializer(instance=doctors, many=True)
-        ser_clinics = serializer.ClinicSerializer(instance=clinics, many=True)
-        results = {
-            'doctors': ser_doctor.data,
-            'clinics': ser_clinics.data,
-        }
+        index = get_search_index()
+        page_size = _positive_int(request.GET.get('page_size'), SEARCH_PAGE_SIZE,
+                                  StandardResultsSetPagination.max_page_size)
+        start = (_positive_int(request.GET.get('page'), 1) - 1) * page_size
+        results = {}
+        for kind, key, serializer_class in SEARCH_KINDS:
+            count, ranked = index.search(query, kind, limit=start + page_size)
+            ids = ranked[start:]
+            model = serializer_class.Meta.model
+            found = plan_serializer(serializer_class()).apply(model.objects.all()).in_bulk(ids)
+            results[key] = serializer_class(instance=[found[pk] for pk in ids if pk in found], many=True).data
+            results[f'{key}_count'] = count
 
     return Response({"resp": results})
 
 
+@api_view(['GET'])
+def autocomplete(request):
+    """
+    Titles of the ``catalog`` (drug, illness, job, drugAmount or drugInstruction) completing ``q``,
+    best first, from the in-memory catalog trie. ``limit`` caps them at CatalogTrie's TOP_K.
+    """
+    catalog = request.GET.get("catalog")
+    if catalog not in CATALOGS:
+        return Response({'catalog': f'Unknown catalog: {catalog}'}, status=status.HTTP_400_BAD_REQUEST)
+    limit = _positive_int(request.GET.get('limit'), TOP_K, TOP_K)
+    completions = get_catalog_trie(catalog).complete(request.GET.get("q") or '', limit)
+    return Response({"resp": [{'id': object_id, 'title': title} for object_id, title in completions]})
+
+
+def serialize_checkup_result(result):
+    """
+    Hydrates a materialized CheckupResult with one query per referenced model.
+    """
+    alert = models.Alert.objects.filter(Q(pk__in=result.alerts))
+    ser_alert = serializer.AlertSerializer(instance=alert, many=True)
+    doctors = models.Doctor.objects.filter(Q(pk__in=result.suggestedDoctors)).select_related('user')
+    ser_doctors = serializer.DoctorSerializer(instance=doctors, many=True)
+    clinics = models.Clinic.objects.filter(Q(pk__in=result.suggestedClinics))
+    ser_clinics = serializer.ClinicSerializer(instance=clinics, many=True)
+    return {
+        'alerts': ser_alert.data,
+        'interpretations': result.interpretations,
+        'suggestedDoctors': ser_doctors.data,
+        'suggestedClinics': ser_clinics.data,
+    }
+
+
 @api_view(['GET'])
 # @permission_classes((IsAuthenticated, ))
 def checkup_result(request):
     query = request.GET.get("q")
     results = []
-    interpretations = []
-    alerts = []
-    suggested_doctors = []
-    suggested_clinics = []
 
     if query:
 
-        checkup = get_object_or_404(models.Checkup, id=query)
-
-        if checkup.patientProfile.user == request.user:
-
-            question_answers = models.QuestionAnswer.objects.filter(Q(checkup_id=query))
-
-            if question_answers:
-                for question_answer in question_answers:
-                    if question_answer.questionOption.interpretation:
-                        interpretations.append(question_answer.questionOption.interpretation)
-                    if question_answer.questionOption.alert:
-                        alerts.append(question_answer.questionOption.alert.id)
-                    if question_answer.questionOption.suggestedDoctor:
-                        suggested_doctors.append(question_answer.questionOption.suggestedDoctor.id)
-                    if question_answer.questionOption.suggestedClinic:
-                        suggested_clinics.append(question_answer.questionOption.suggestedClinic.id)
-
-                alert = models.Alert.objects.filter(Q(pk__in=alerts))
-                ser_alert = serializer.AlertSerializer(instance=alert, many=True)
-                doctors = models.Doctor.objects.filter(Q(pk__in=suggested_doctors))
-                ser_doctors = serializer.DoctorSerializer(instance=doctors, many=True)
-                clinics = models.Clinic.objects.filter(Q(pk__in=suggested_clinics))
-                ser_clinics = serializer.ClinicSerializer(instance=clinics, many=True)
-                results = {
-                    'alerts': ser_alert.data,
-                    'interpretations': interpretations,
-                    'suggestedDoctors': ser_doctors.data,
-                    'suggestedClinics': ser_clinics.data,
-                }
+        checkup = get_object_or_404(
+            models.Checkup.objects.select_related('patientProfile', 'checkupResult_checkup'), id=query
+        )
+
+        if checkup.patientProfile.user_id == request.user.id:
+
+            try:
+                result = checkup.checkupResult_checkup
+            except models.CheckupResult.DoesNotExist:
+                # checkups answered before results were materialized
+                result = models.CheckupResult.rebuild(checkup.id)
+
+            if result.answers:
+                results = serialize_checkup_result(result)
 
             else:
                 results = {
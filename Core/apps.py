@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'Core'
+
+    def ready(self):
+        from Core import signals  # noqa: F401
+        # the viewsets register the fields of the n-gram search index
+        from Core.api import views  # noqa: F401
@@ -0,0 +1,37 @@
+import time
+
+from django.core.cache import cache
+
+
+def get_version(key):
+    """
+    Returns the current version stamp stored under ``key``, creating it when missing.
+    """
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def get_versions(keys):
+    """
+    Batched variant of ``get_version``, one cache round trip for the common case.
+    """
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            versions[key] = get_version(key)
+    return versions
+
+
+def bump_version(key):
+    """
+    Invalidates everything built against the previous version of ``key``.
+    """
+    try:
+        return cache.incr(key)
+    except ValueError:
+        version = time.time_ns()
+        cache.set(key, version, None)
+        return version
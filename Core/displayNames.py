@@ -0,0 +1,72 @@
+from django.core.cache import cache
+
+from Core import models
+
+DISPLAY_NAME_TIMEOUT = 60 * 60 * 24
+
+
+def _full_names(model, prefix):
+    def load(pks):
+        rows = model.objects.filter(pk__in=pks).values_list('id', f'{prefix}first_name', f'{prefix}last_name')
+        return {pk: ('%s %s' % (first_name, last_name)).strip() for pk, first_name, last_name in rows}
+    return load
+
+
+def _titles(model):
+    def load(pks):
+        return dict(model.objects.filter(pk__in=pks).values_list('id', 'title'))
+    return load
+
+
+# kind: loader of {pk: display name} for a set of primary keys, one query per call.
+LOADERS = {
+    'user': _full_names(models.User, ''),
+    'doctor': _full_names(models.Doctor, 'user__'),
+    'patient': _full_names(models.PatientProfile, 'user__'),
+    'supervisor': _full_names(models.Supervisor, 'user__'),
+    'clinic': _titles(models.Clinic),
+    'clinicGroup': _titles(models.ClinicGroup),
+}
+
+
+def display_name_key(kind, pk):
+    return f'displayName:{kind}:{pk}'
+
+
+def resolve(keys):
+    """
+    Display names of ``keys``, an iterable of (kind, pk), from the cache with one query per kind
+    for the missing ones. Unknown pks resolve to "".
+    """
+    keys = {(kind, pk) for kind, pk in keys if pk is not None}
+    cached = cache.get_many([display_name_key(kind, pk) for kind, pk in keys])
+    names = {}
+    missing = {}
+    for kind, pk in keys:
+        name = cached.get(display_name_key(kind, pk))
+        if name is None:
+            missing.setdefault(kind, set()).add(pk)
+        else:
+            names[kind, pk] = name
+    loaded = {}
+    for kind, pks in missing.items():
+        found = LOADERS[kind](pks)
+        for pk in pks:
+            names[kind, pk] = loaded[display_name_key(kind, pk)] = found.get(pk, "")
+    if loaded:
+        cache.set_many(loaded, DISPLAY_NAME_TIMEOUT)
+    return names
+
+
+def invalidate(kind, pks):
+    cache.delete_many([display_name_key(kind, pk) for pk in pks])
+
+
+def invalidate_user(user_id):
+    """
+    Drops the names derived from a user: the user itself and its doctor, patient and supervisor rows.
+    """
+    invalidate('user', [user_id])
+    invalidate('doctor', models.Doctor.objects.filter(user_id=user_id).values_list('id', flat=True))
+    invalidate('patient', models.PatientProfile.objects.filter(user_id=user_id).values_list('id', flat=True))
+    invalidate('supervisor', models.Supervisor.objects.filter(user_id=user_id).values_list('id', flat=True))
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from Core import models
+from Core.search.normalize import normalized_column
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = 'Fills the normalized shadow columns the q filters look names up in, for rows saved before them.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--missing', action='store_true',
+                            help='Only fill the rows with an empty shadow column for a non empty field.')
+
+    def handle(self, *args, **options):
+        for model in (models.User, models.Doctor, models.Clinic, models.RealClinic, models.RealDoctor,
+                      models.Drug, models.Illness):
+            fields = model.normalized_fields
+            columns = [normalized_column(field) for field in fields]
+            queryset = model.objects.only('pk', *fields).order_by('pk')
+            if options['missing']:
+                missing = Q()
+                for field, column in zip(fields, columns):
+                    missing |= Q(**{column: ''}) & ~Q(**{field: ''})
+                queryset = queryset.filter(missing)
+            count = 0
+            rows = queryset.iterator(chunk_size=BATCH_SIZE)
+            while True:
+                objs = [obj for _, obj in zip(range(BATCH_SIZE), rows)]
+                if not objs:
+                    break
+                for obj in objs:
+                    obj.normalize_fields()
+                model.objects.bulk_update(objs, columns)
+                count += len(objs)
+            self.stdout.write(f'{model._meta.verbose_name_plural}: {count}')
+        self.stdout.write(self.style.SUCCESS('Normalized search columns'))
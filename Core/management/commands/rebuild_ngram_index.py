@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from Core import models
+from Core.search.ngrams import SEARCH_FIELDS, get_search_backend
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the n-gram index the q filters of the viewsets search through.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--setup', action='store_true', help='Create the database index of the backend first.')
+        parser.add_argument('--if-empty', action='store_true', help='Only rebuild when nothing is indexed yet.')
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        if options['setup']:
+            backend.setup()
+            backend = get_search_backend()
+        if options['if_empty'] and models.SearchDocument.objects.exists():
+            self.stdout.write('The n-gram index is not empty, not rebuilt')
+            return
+        for model, fields in SEARCH_FIELDS.items():
+            count = backend.rebuild(model, fields)
+            self.stdout.write(f'{model._meta.label}: {count} objects, {", ".join(fields)}')
+        self.stdout.write(self.style.SUCCESS('Rebuilt the n-gram index'))
@@ -0,0 +1,18 @@
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+
+from Core.search.index import rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the in-memory search index of doctors and clinics from the database.'
+
+    def handle(self, *args, **options):
+        index = rebuild_search_index()
+        self.stdout.write(self.style.SUCCESS(f'Indexed {len(index)} documents, version {index.version}'))
+        if isinstance(caches['default'], LocMemCache):
+            self.stderr.write(self.style.WARNING(
+                'The cache is private to this process, the running server does not see the new index. '
+                'Set CACHE_LOCATION to the shared memcached server.'
+            ))
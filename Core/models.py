@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from rest_framework.serializers import ValidationError as SValidationError
 from django.utils import timezone
 from mptt.models import MPTTModel, TreeForeignKey
@@ -9,10 +9,37 @@ from django.core.exceptions import ValidationError, NON_FIELD_ERRORS
 from django.utils.translation import gettext_lazy as _
 
 from CheckupServer.settings import STATIC_URL
+from .search.normalize import normalize, normalized_column
 from .userModel.userModel import UserManager, validate_phone_number, validate_image, validate_landline
 
 
-class User(AbstractBaseUser, PermissionsMixin):
+class NormalizedFieldsMixin:
+    """
+    Keeps an indexed ``<field>_normalized`` shadow column of each of ``normalized_fields`` in step with
+    it, for the ``q`` filters to look names up by equality or prefix.
+    """
+    normalized_fields = ()
+
+    def normalize_fields(self):
+        for field in self.normalized_fields:
+            column = normalized_column(field)
+            setattr(self, column, normalize(getattr(self, field))[:self._meta.get_field(column).max_length])
+
+    def save(self, *args, **kwargs):
+        self.normalize_fields()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, *(
+                normalized_column(field) for field in self.normalized_fields if field in update_fields
+            )}
+        super().save(*args, **kwargs)
+
+
+def normalized_field(max_length):
+    return models.CharField(max_length=max_length, blank=True, editable=False, db_index=True)
+
+
+class User(NormalizedFieldsMixin, AbstractBaseUser, PermissionsMixin):
     """
     Custom user model that support phone number instead of username
     """
@@ -30,6 +57,10 @@ class User(AbstractBaseUser, PermissionsMixin):
     date_joined = models.DateTimeField(_('date joined'), auto_now_add=True)
     is_active = models.BooleanField(_('active'), default=True)
     is_staff = models.BooleanField(_('staff'), default=False)
+    first_name_normalized = normalized_field(30)
+    last_name_normalized = normalized_field(30)
+
+    normalized_fields = ('first_name', 'last_name')
 
     def save(self, *args, **kwargs):
         if not self.picture:
@@ -125,17 +156,20 @@ class Supervisor(models.Model):
         return f'{self.user} is {self.relativeType} of {self.patient}'
 
 
-class Doctor(models.Model):
+class Doctor(NormalizedFieldsMixin, models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='doctor_user', help_text='کاربر')
     systemCode = models.CharField(max_length=120, blank=True, help_text='کد سیستم')
     specialyTitle = models.CharField(max_length=120, blank=True, help_text='عنوان شخص')
     description = models.TextField(blank=True, help_text='توضیحات')
+    specialyTitle_normalized = normalized_field(120)
+
+    normalized_fields = ('specialyTitle',)
 
     def __str__(self):
         return f'{self.user}'
 
 
-class RealDoctor(models.Model):
+class RealDoctor(NormalizedFieldsMixin, models.Model):
     name = models.CharField(max_length=200, help_text='نام پزشک')
     specialyTitle = models.CharField(max_length=120, blank=True, help_text='تخصص')
     description = models.TextField(blank=True, help_text='توضیحات')
@@ -146,6 +180,10 @@ class RealDoctor(models.Model):
     long = models.DecimalField(max_digits=9, null=True, blank=True, decimal_places=6, help_text='مختصات عرض جغرافیایی')
     lat = models.DecimalField(max_digits=9, null=True, blank=True, decimal_places=6, help_text='مختصات طول جغرافیاییک')
     created_on = models.DateTimeField(auto_now_add=True)
+    name_normalized = normalized_field(200)
+    specialyTitle_normalized = normalized_field(120)
+
+    normalized_fields = ('name', 'specialyTitle')
 
     def save(self, *args, **kwargs):
         if not self.icon:
@@ -164,7 +202,7 @@ class ClinicGroup(models.Model):
         return f'{self.title}'
 
 
-class Clinic(models.Model):
+class Clinic(NormalizedFieldsMixin, models.Model):
     clinicGroup = models.ForeignKey(to=ClinicGroup, related_name='clinics_clinicGroup', on_delete=models.CASCADE,
                                     help_text='گروه کلینیک')
     agent = models.ForeignKey(to=Doctor, related_name='clinics_agent', on_delete=models.CASCADE, help_text='دکتر مسئول')
@@ -175,6 +213,9 @@ class Clinic(models.Model):
     created_on = models.DateTimeField(auto_now=timezone.now())
     long = models.DecimalField(max_digits=9, null=True, blank=True, decimal_places=6, help_text='مختصات عرض جغرافیایی')
     lat = models.DecimalField(max_digits=9, null=True, blank=True, decimal_places=6, help_text='مختصات طول جغرافیاییک')
+    title_normalized = normalized_field(300)
+
+    normalized_fields = ('title',)
 
     def save(self, *args, **kwargs):
         if not self.icon:
@@ -271,7 +312,7 @@ class ClinicInfo(models.Model):
         return f'{self.name}'
 
 
-class RealClinic(models.Model):
+class RealClinic(NormalizedFieldsMixin, models.Model):
     name = models.CharField(max_length=200, help_text='نام کلینیک')
     description = models.TextField(blank=True, help_text='توضیحات')
     address = models.CharField(max_length=600, blank=True, help_text='آدرس کلینیک')
@@ -281,6 +322,9 @@ class RealClinic(models.Model):
     long = models.DecimalField(max_digits=9, null=True, blank=True, decimal_places=6, help_text='مختصات عرض جغرافیایی')
     lat = models.DecimalField(max_digits=9, null=True, blank=True, decimal_places=6, help_text='مختصات طول جغرافیاییک')
     created_on = models.DateTimeField(auto_now_add=True)
+    name_normalized = normalized_field(200)
+
+    normalized_fields = ('name',)
 
     def save(self, *args, **kwargs):
         if not self.icon:
@@ -458,12 +502,45 @@ class ClinicCheckup(models.Model):
     approvers = models.CharField(max_length=400, blank=True, help_text='تایید کننده چکاپ')
     starting_question = models.ForeignKey(to=QuestionShare, related_name='clinicCheckups_questionShare',
                                           on_delete=models.CASCADE, help_text='کلینیک')
+    reachable_count = models.PositiveSmallIntegerField(
+        null=True, editable=False, help_text='تعداد سوالات قابل دسترس از سوال شروع')
+    longest_path = models.PositiveSmallIntegerField(
+        null=True, editable=False, help_text='بیشترین تعداد سوال در یک مسیر چکاپ، خالی در صورت وجود دور')
+    expected_question_count = models.FloatField(
+        null=True, editable=False, help_text='امید ریاضی تعداد سوالات پاسخ داده شده با انتخاب یکنواخت گزینه ها')
+    graph_issues = models.JSONField(default=dict, editable=False,
+                                    help_text='دورها، اتصالات نامعتبر و سوالات غیر قابل دسترس گراف سوالات')
+    analyzed_on = models.DateTimeField(null=True, editable=False)
     created_on = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
         return f'{self.title} در کلینیک {self.clinic}'
 
 
+class ClinicCheckupVersion(models.Model):
+    """
+    Immutable published snapshot of the question graph of a ClinicCheckup, the brotli compressed
+    JSON document of Core.questionGraph.bundle.
+    """
+    clinic_checkup = models.ForeignKey(to=ClinicCheckup, related_name='clinicCheckupVersions_clinicCheckup',
+                                       on_delete=models.CASCADE, help_text='چکاپ کلینیک')
+    number = models.PositiveIntegerField(help_text='شماره نسخه')
+    etag = models.CharField(max_length=64, help_text='درهم سازی محتوای نسخه')
+    blob = models.BinaryField(help_text='سند فشرده گراف سوالات')
+    created_on = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = [('clinic_checkup', 'number')]
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise SValidationError({"version": "نسخه منتشر شده قابل ویرایش نیست"})
+        super(ClinicCheckupVersion, self).save(*args, **kwargs)
+
+    def __str__(self):
+        return f'نسخه {self.number} از {self.clinic_checkup}'
+
+
 class CheckupFlowchart(models.Model):
     text = models.TextField(help_text='متن فلوچارت در اپلیکیشن')
     title = models.CharField(max_length=100, help_text='نام فلوچارت')
@@ -520,6 +597,9 @@ class Checkup(models.Model):
     clinic = models.ForeignKey(to=Clinic, related_name='checkups_clinic', on_delete=models.CASCADE, help_text='کلینیک')
     clinic_checkup = models.ForeignKey(to=ClinicCheckup, null=True, blank=True, related_name='checkups_clinicCheckup', on_delete=models.CASCADE,
                                        help_text='چکاپ کلینیک')
+    graph_version = models.ForeignKey(to=ClinicCheckupVersion, null=True, blank=True, editable=False,
+                                      related_name='checkups_clinicCheckupVersion', on_delete=models.RESTRICT,
+                                      help_text='نسخه منتشر شده گراف سوالات در زمان شروع چکاپ')
     title = models.CharField(max_length=250, null=True, blank=True, help_text='عنوان چکاپ')
     description = models.TextField(null=True, blank=True, help_text='توضیح چکاپ')
     executionDate = models.DateTimeField(auto_now=timezone.now())
@@ -532,6 +612,8 @@ class Checkup(models.Model):
                 self.title = f' چکاپ {self.clinic_checkup.title} توسط {self.patientProfile.user.get_full_name()} در کلینیک {self.clinic.title} '
             else:
                 self.title = f' چکاپ {self.clinic_checkup.title} توسط {self.patientProfile.user.phone_number} در کلینیک {self.clinic.title} '
+            if self._state.adding and self.graph_version_id is None:
+                self.graph_version = self.clinic_checkup.clinicCheckupVersions_clinicCheckup.order_by('-number').first()
         super(Checkup, self).save(*args, **kwargs)
 
     def __str__(self):
@@ -550,6 +632,117 @@ class QuestionAnswer(models.Model):
                                        on_delete=models.CASCADE, help_text='انتخاب جواب')
 
 
+class CheckupResult(models.Model):
+    """
+    Materialized result of a checkup, kept up to date as its answers are created, changed or deleted.
+
+    ``answers`` maps each QuestionAnswer id to what its option contributes:
+    [interpretation, alert id, suggested doctor id, suggested clinic id].
+    """
+    checkup = models.OneToOneField(Checkup, related_name='checkupResult_checkup', on_delete=models.CASCADE,
+                                   help_text='چکاپ')
+    answers = models.JSONField(default=dict, help_text='سهم هر پاسخ در نتیجه چکاپ')
+    interpretations = models.JSONField(default=list, help_text='تفسیرها')
+    alerts = models.JSONField(default=list, help_text='هشدارها')
+    suggestedDoctors = models.JSONField(default=list, help_text='پزشکان پیشنهادی')
+    suggestedClinics = models.JSONField(default=list, help_text='کلینیک های پیشنهادی')
+    updated_on = models.DateTimeField(auto_now=True)
+
+    # QuestionOption fields an answer contributes, in the order of its ``answers`` entry.
+    OPTION_FIELDS = ('interpretation', 'alert_id', 'suggestedDoctor_id', 'suggestedClinic_id')
+    BATCH_SIZE = 500
+
+    @classmethod
+    def contributions(cls, answers):
+        """
+        Contribution of each (answer id, option id) pair, read with one query.
+        """
+        options = dict((row[0], list(row[1:])) for row in QuestionOption.objects.filter(
+            pk__in={option_id for _answer_id, option_id in answers}
+        ).values_list('id', *cls.OPTION_FIELDS))
+        return {str(answer_id): options[option_id] for answer_id, option_id in answers if option_id in options}
+
+    def summarize(self):
+        self.interpretations, self.alerts, self.suggestedDoctors, self.suggestedClinics = [], [], [], []
+        for answer_id in sorted(self.answers, key=int):
+            interpretation, alert, doctor, clinic = self.answers[answer_id]
+            if interpretation:
+                self.interpretations.append(interpretation)
+            if alert:
+                self.alerts.append(alert)
+            if doctor:
+                self.suggestedDoctors.append(doctor)
+            if clinic:
+                self.suggestedClinics.append(clinic)
+
+    @classmethod
+    def update_answers(cls, checkup_id, changed=(), removed=(), create=True):
+        """
+        Applies changed (answer id, option id) pairs and removed answer ids to the result of a checkup.
+        A checkup without a result yet, answered before results were materialized, is rebuilt from
+        all of its answers.
+        """
+        contributions = cls.contributions(changed)
+        with transaction.atomic():
+            result = cls.objects.select_for_update().filter(checkup_id=checkup_id).first()
+            if result is None:
+                if not create:
+                    return None
+                return cls.rebuild(checkup_id)
+            for answer_id in removed:
+                result.answers.pop(str(answer_id), None)
+            result.answers.update(contributions)
+            result.summarize()
+            result.save()
+        return result
+
+    @classmethod
+    def update_option(cls, option_id):
+        """
+        Writes the current contribution of a QuestionOption into the results of the checkups that
+        chose it, a batch of results per query, skipping the results already up to date.
+        """
+        contribution = QuestionOption.objects.filter(pk=option_id).values_list(*cls.OPTION_FIELDS).first()
+        if contribution is None:
+            return
+        contribution = list(contribution)
+        answers = {}
+        for answer_id, checkup_id in QuestionAnswer.objects.filter(
+            questionOption_id=option_id
+        ).values_list('id', 'checkup_id').iterator():
+            answers.setdefault(checkup_id, []).append(str(answer_id))
+        checkup_ids = list(answers)
+        for start in range(0, len(checkup_ids), cls.BATCH_SIZE):
+            with transaction.atomic():
+                changed = []
+                for result in cls.objects.select_for_update().filter(
+                    checkup_id__in=checkup_ids[start:start + cls.BATCH_SIZE]
+                ):
+                    answer_ids = answers[result.checkup_id]
+                    if all(result.answers.get(answer_id) == contribution for answer_id in answer_ids):
+                        continue
+                    result.answers.update(dict.fromkeys(answer_ids, contribution))
+                    result.summarize()
+                    result.updated_on = timezone.now()
+                    changed.append(result)
+                cls.objects.bulk_update(changed, [
+                    'answers', 'interpretations', 'alerts', 'suggestedDoctors', 'suggestedClinics', 'updated_on'
+                ])
+
+    @classmethod
+    def rebuild(cls, checkup_id):
+        answers = QuestionAnswer.objects.filter(checkup_id=checkup_id).values_list('id', 'questionOption_id')
+        contributions = cls.contributions(list(answers))
+        result, created = cls.objects.get_or_create(checkup_id=checkup_id)
+        result.answers = contributions
+        result.summarize()
+        result.save()
+        return result
+
+    def __str__(self):
+        return f'نتیجه {self.checkup}'
+
+
 BLOOD_TYPE_CHOICES = (
     ('A+', "A+"),
     ('A-', "A-"),
@@ -614,15 +807,21 @@ class Job(models.Model):
         return self.title
 
 
-class Illness(models.Model):
+class Illness(NormalizedFieldsMixin, models.Model):
     title = models.CharField(max_length=200, help_text='نام بیماری')
+    title_normalized = normalized_field(200)
+
+    normalized_fields = ('title',)
 
     def __str__(self):
         return self.title
 
 
-class Drug(models.Model):
+class Drug(NormalizedFieldsMixin, models.Model):
     title = models.CharField(max_length=200, help_text='نام دارو')
+    title_normalized = normalized_field(200)
+
+    normalized_fields = ('title',)
 
     def __str__(self):
         return self.title
@@ -719,6 +918,33 @@ class MedicalRecord(models.Model):
     def __str__(self):
         return f'{self.patient.user}'
 
+
+class SearchDocument(models.Model):
+    """
+    The normalized text of one searchable field of one object, see Core.search.ngrams.
+    """
+    model = models.CharField(max_length=100)
+    field = models.CharField(max_length=100)
+    object_id = models.BigIntegerField()
+    text = models.TextField()
+
+    class Meta:
+        unique_together = [('model', 'object_id', 'field')]
+
+    def __str__(self):
+        return f'{self.model}.{self.field} of {self.object_id}'
+
+
+class SearchTrigram(models.Model):
+    document = models.ForeignKey(to=SearchDocument, related_name='trigrams', on_delete=models.CASCADE)
+    trigram = models.CharField(max_length=3)
+
+    class Meta:
+        unique_together = [('trigram', 'document')]
+
+    def __str__(self):
+        return f'{self.trigram} of {self.document}'
+
 # class QuestionDefultItem(models.Model):
 #     question = models.ForeignKey(to=Question, related_name='questionDefultItems', on_delete=models.CASCADE, help_text='سوال')
 #     value = models.CharField(max_length=500, help_text='مقدار')
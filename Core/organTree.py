@@ -0,0 +1,112 @@
+import threading
+
+from Core import models
+from Core.caching import get_version
+
+ORGAN_TREE_KEY = 'organTree'
+
+
+class OrganTree:
+    """
+    The whole Organ MPTT forest in tree order (tree_id, lft), read with a single query.
+
+    The descendants of the organ at position ``i`` are the positions right after it, up to the
+    first one whose ``lft`` passes its ``rght``.
+    """
+
+    __slots__ = ('version', 'ids', 'names', 'parents', 'levels', 'trees', 'lfts', 'rghts', '_index', '_nested')
+
+    def __init__(self, rows, version=None):
+        self.version = version
+        self.ids, self.names, self.parents, self.levels, self.trees, self.lfts, self.rghts = (
+            [list(column) for column in zip(*rows)] if rows else [[] for _ in range(7)]
+        )
+        self._index = {organ_id: i for i, organ_id in enumerate(self.ids)}
+        self._nested = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, organ_id):
+        return organ_id in self._index
+
+    def _node(self, i):
+        return {'id': self.ids[i], 'name': self.names[i], 'parent': self.parents[i], 'level': self.levels[i]}
+
+    def _span(self, i):
+        """
+        Positions of the organ at ``i`` and all its descendants.
+        """
+        tree, rght = self.trees[i], self.rghts[i]
+        end = i + 1
+        while end < len(self.ids) and self.trees[end] == tree and self.lfts[end] < rght:
+            end += 1
+        return range(i, end)
+
+    def _nest(self, positions):
+        roots = []
+        stack = []
+        for i in positions:
+            node = self._node(i)
+            node['children'] = []
+            while stack and stack[-1][0] >= self.levels[i]:
+                stack.pop()
+            (stack[-1][1]['children'] if stack else roots).append(node)
+            stack.append((self.levels[i], node))
+        return roots
+
+    def nested(self):
+        """
+        Every root organ with its nested "children", built once per tree version.
+        """
+        if self._nested is None:
+            self._nested = self._nest(range(len(self.ids)))
+        return self._nested
+
+    def subtree(self, organ_id):
+        """
+        The organ with its nested descendants.
+        """
+        return self._nest(self._span(self._index[organ_id]))[0]
+
+    def descendant_ids(self, organ_id):
+        return [self.ids[i] for i in self._span(self._index[organ_id])]
+
+    def ancestors(self, organ_id):
+        """
+        The path from the root down to the organ, the organ included.
+        """
+        path = []
+        i = self._index[organ_id]
+        while True:
+            path.append(self._node(i))
+            if self.parents[i] is None:
+                break
+            i = self._index[self.parents[i]]
+        return path[::-1]
+
+
+def build_organ_tree(version=None):
+    rows = models.Organ.objects.order_by('tree_id', 'lft').values_list(
+        'id', 'name', 'parent_id', 'level', 'tree_id', 'lft', 'rght'
+    )
+    return OrganTree(list(rows), version)
+
+
+_tree = None
+_tree_lock = threading.Lock()
+
+
+def get_organ_tree():
+    """
+    Returns the per-process OrganTree, rebuilt after any Organ write.
+    """
+    global _tree
+    version = get_version(ORGAN_TREE_KEY)
+    tree = _tree
+    if tree is not None and tree.version == version:
+        return tree
+    tree = build_organ_tree(version)
+    with _tree_lock:
+        _tree = tree
+    return tree
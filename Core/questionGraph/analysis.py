@@ -0,0 +1,147 @@
+from collections import namedtuple
+
+from django.utils import timezone
+
+from Core import models
+from Core.questionGraph.engine import compile_graph, load_clinic_rows
+from Core.representations import bump_representations
+
+ANALYSIS_FIELDS = ['reachable_count', 'longest_path', 'expected_question_count', 'graph_issues', 'analyzed_on']
+
+# longest_path and expected_question_count are None when the graph has a cycle.
+GraphAnalysis = namedtuple('GraphAnalysis', [
+    'reachable_count', 'longest_path', 'expected_question_count', 'cycles', 'dangling',
+])
+
+
+def _strongly_connected(successors):
+    """
+    Iterative Tarjan over question positions. Components are returned in reverse topological
+    order, every component comes after all the components it can reach.
+    """
+    n = len(successors)
+    index = [-1] * n
+    low = [0] * n
+    on_stack = [False] * n
+    stack = []
+    components = []
+    counter = 0
+    for root in range(n):
+        if index[root] >= 0:
+            continue
+        index[root] = low[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack[root] = True
+        work = [(root, 0)]
+        while work:
+            v, i = work[-1]
+            if i < len(successors[v]):
+                work[-1] = (v, i + 1)
+                w = successors[v][i]
+                if index[w] < 0:
+                    index[w] = low[w] = counter
+                    counter += 1
+                    stack.append(w)
+                    on_stack[w] = True
+                    work.append((w, 0))
+                elif on_stack[w]:
+                    low[v] = min(low[v], index[w])
+                continue
+            work.pop()
+            if work:
+                parent = work[-1][0]
+                low[parent] = min(low[parent], low[v])
+            if low[v] == index[v]:
+                component = []
+                while True:
+                    w = stack.pop()
+                    on_stack[w] = False
+                    component.append(w)
+                    if w == v:
+                        break
+                components.append(component)
+    return components
+
+
+def _branch_targets(graph, position):
+    """
+    The question position each option of ``position`` leads to, -1 when the checkup ends there.
+    A question without options has a single branch, its own "next" link.
+    """
+    fallback = graph.question_next[position]
+    start, end = graph.option_offsets[position], graph.option_offsets[position + 1]
+    if start == end:
+        return [fallback]
+    return [target if target >= 0 else fallback for target in graph.option_next[start:end]]
+
+
+def analyze_graph(graph):
+    """
+    Cycles, dangling links and path statistics of a CompiledGraph in O(questions + options).
+
+    ``expected_question_count`` assumes every option of a question is chosen with the same probability.
+    """
+    successors = [sorted(graph.successors(position)) for position in range(len(graph))]
+    cycles = []
+    longest = [0] * len(graph)
+    expected = [0.0] * len(graph)
+    for component in _strongly_connected(successors):
+        v = component[0]
+        if len(component) > 1 or v in successors[v]:
+            cycles.append(sorted(graph.question_ids[position] for position in component))
+            continue
+        if cycles:
+            continue
+        longest[v] = 1 + max((longest[w] for w in successors[v]), default=0)
+        branches = _branch_targets(graph, v)
+        expected[v] = 1 + sum(expected[w] for w in branches if w >= 0) / len(branches)
+
+    acyclic = not cycles and len(graph) > 0
+    return GraphAnalysis(
+        reachable_count=len(graph),
+        longest_path=longest[0] if acyclic else None,
+        expected_question_count=round(expected[0], 4) if acyclic else None,
+        cycles=cycles,
+        dangling=[
+            {'question': question_id, 'option': option_id, 'target': target}
+            for question_id, option_id, target in graph.dangling
+        ],
+    )
+
+
+def analyze_clinic(clinic_id):
+    """
+    Analyzes the question graph of every ClinicCheckup of a clinic and stores the results on them.
+
+    Questions of the clinic that no checkup reaches are reported as ``unreachable`` on every checkup.
+    Returns a dict of ClinicCheckup id to GraphAnalysis.
+    """
+    rows = load_clinic_rows(clinic_id)
+    clinic_checkups = list(
+        models.ClinicCheckup.objects.filter(clinic_id=clinic_id).only('id', 'clinic_id', 'starting_question_id')
+    )
+    reached = set()
+    analyses = {}
+    for clinic_checkup in clinic_checkups:
+        graph = compile_graph(clinic_checkup, rows=rows)
+        reached.update(graph.question_ids)
+        analyses[clinic_checkup.pk] = analyze_graph(graph)
+    unreachable = sorted(set(rows[0]) - reached)
+
+    analyzed_on = timezone.now()
+    for clinic_checkup in clinic_checkups:
+        analysis = analyses[clinic_checkup.pk]
+        clinic_checkup.reachable_count = analysis.reachable_count
+        clinic_checkup.longest_path = analysis.longest_path
+        clinic_checkup.expected_question_count = analysis.expected_question_count
+        clinic_checkup.graph_issues = {
+            'invalid_start': clinic_checkup.starting_question_id not in rows[0],
+            'cycles': analysis.cycles,
+            'dangling': analysis.dangling,
+            'unreachable': unreachable,
+        }
+        clinic_checkup.analyzed_on = analyzed_on
+    models.ClinicCheckup.objects.bulk_update(clinic_checkups, ANALYSIS_FIELDS)
+    bump_representations(models.ClinicCheckup, [clinic_checkup.pk for clinic_checkup in clinic_checkups])
+    return analyses
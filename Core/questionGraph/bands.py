@@ -0,0 +1,130 @@
+import logging
+import math
+import threading
+from bisect import bisect_right
+
+from Core import models
+from Core.caching import get_version
+from Core.questionGraph.engine import clinic_graph_key
+
+logger = logging.getLogger(__name__)
+
+BAND_MODELS = {
+    'number': models.QuestionOptionNumber,
+    'date': models.QuestionOptionDate,
+    'equation': models.QuestionOptionEquation,
+}
+
+
+class BandIndex:
+    """
+    Sorted, non overlapping segments of the option bands of one question and band kind.
+
+    Bands are inclusive on both ends and a missing bound is open ended. When bands overlap the
+    band with the smallest lower bound wins the shared range, the overlap is kept in ``overlaps``
+    and uncovered ranges between bands in ``gaps``.
+    """
+
+    __slots__ = ('question_id', 'kind', 'version', 'lowers', 'lower_inclusive', 'uppers', 'options',
+                 'overlaps', 'gaps', 'inverted')
+
+    def __init__(self, question_id, kind, bands, version=None):
+        self.question_id = question_id
+        self.kind = kind
+        self.version = version
+        self.lowers = []
+        self.lower_inclusive = []
+        self.uppers = []
+        self.options = []
+        self.overlaps = []
+        self.gaps = []
+        self.inverted = []
+
+        intervals = []
+        for option_id, lower, upper in bands:
+            lower = -math.inf if lower is None else lower
+            upper = math.inf if upper is None else upper
+            if lower > upper:
+                self.inverted.append(option_id)
+                continue
+            intervals.append((lower, upper, option_id))
+        intervals.sort()
+
+        reach = None
+        reach_option = None
+        for lower, upper, option_id in intervals:
+            inclusive = True
+            if reach is not None:
+                if lower < reach or (lower == reach and upper == reach):
+                    self.overlaps.append((reach_option, option_id, lower, min(upper, reach)))
+                if upper <= reach:
+                    continue
+                if lower > reach:
+                    self.gaps.append((reach, lower))
+                elif lower <= reach:
+                    lower, inclusive = reach, False
+            self.lowers.append(lower)
+            self.lower_inclusive.append(inclusive)
+            self.uppers.append(upper)
+            self.options.append(option_id)
+            reach, reach_option = upper, option_id
+
+        if self.overlaps or self.gaps or self.inverted:
+            logger.warning(
+                'Question %s has inconsistent %s bands: overlaps=%s gaps=%s inverted=%s',
+                question_id, kind, self.overlaps, self.gaps, self.inverted,
+            )
+
+    def __len__(self):
+        return len(self.options)
+
+    def resolve(self, value):
+        """
+        Returns the id of the QuestionOption whose band contains ``value`` or None.
+        """
+        i = bisect_right(self.lowers, value) - 1
+        if i >= 0 and value == self.lowers[i] and not self.lower_inclusive[i]:
+            i -= 1
+        if i >= 0 and value <= self.uppers[i]:
+            return self.options[i]
+        return None
+
+    def resolve_many(self, values):
+        return [self.resolve(value) for value in values]
+
+    def report(self):
+        return {
+            'overlaps': [
+                {'options': [first, second], 'lower_band': lower, 'upper_band': upper}
+                for first, second, lower, upper in self.overlaps
+            ],
+            'gaps': [{'lower_band': lower, 'upper_band': upper} for lower, upper in self.gaps],
+            'inverted': self.inverted,
+        }
+
+
+def build_band_index(question_id, kind, version=None):
+    bands = BAND_MODELS[kind].objects.filter(
+        questionOption__questionShare_id=question_id
+    ).values_list('questionOption_id', 'lower_band', 'upper_band')
+    return BandIndex(question_id, kind, bands, version)
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_band_index(question, kind):
+    """
+    Returns the per-process BandIndex of ``question``, rebuilt when the questions of its clinic change.
+    """
+    if kind not in BAND_MODELS:
+        raise KeyError(f'Unknown band kind {kind!r}')
+    version = get_version(clinic_graph_key(question.clinic_id))
+    index = _indexes.get((question.pk, kind))
+    if index is not None and index.version == version:
+        return index
+    index = build_band_index(question.pk, kind, version)
+    with _indexes_lock:
+        _indexes[(question.pk, kind)] = index
+    return index
@@ -0,0 +1,131 @@
+import gzip
+import hashlib
+import json
+from collections import namedtuple
+
+import brotli
+from django.core.cache import cache
+from django.db.models import Prefetch
+
+from Core import models
+from Core.caching import get_versions
+from Core.questionGraph.engine import clinic_graph_key, get_compiled_graph
+
+BUNDLE_TIMEOUT = 60 * 60 * 24
+# Version of the names and titles bundles copy from alerts, doctors, clinics, organs and media.
+BUNDLE_NAMES_KEY = 'questionGraph:bundleNames'
+
+# content is the utf-8 JSON document, encoded maps a content coding to the precompressed body.
+Bundle = namedtuple('Bundle', ['etag', 'content', 'encoded'])
+
+QUESTION_FIELDS = [
+    'id', 'title', 'short_title', 'is_starter', 'doctor_id', 'clinic_id', 'expert_level', 'question_type',
+    'prority_type', 'is_date', 'is_date_limit', 'date_limit_num', 'date_type', 'is_show_chart', 'is_equation',
+    'equation', 'is_multiple_choice',
+]
+OPTION_FIELDS = [
+    'id', 'is_branch', 'title', 'weight', 'interpretation', 'tutorial', 'alert_id', 'suggestedDoctor_id',
+    'suggestedClinic_id',
+]
+
+
+def _bands(rows):
+    return [[row.lower_band, row.upper_band] for row in rows]
+
+
+def _full_name(doctor):
+    return doctor.user.get_full_name() if doctor else ""
+
+
+def _option_document(option):
+    document = {field.replace('_id', ''): getattr(option, field) for field in OPTION_FIELDS}
+    document.update({
+        'alertTitle': option.alert.title if option.alert else "",
+        'suggestedDoctorName': _full_name(option.suggestedDoctor),
+        'suggestedClinicName': option.suggestedClinic.title if option.suggestedClinic else "",
+        'next': option.chart_connectQstId_id,
+        'equations': _bands(option.questionOptionEquations.all()),
+        'numbers': _bands(option.questionOptionNumbers.all()),
+        'dates': _bands(option.questionOptionDates.all()),
+    })
+    return document
+
+
+def _question_document(question):
+    document = {field.replace('_id', ''): getattr(question, field) for field in QUESTION_FIELDS}
+    document.update({
+        'doctorName': _full_name(question.doctor),
+        'clinicName': question.clinic.title,
+        'next': question.chart_connectQstId_id,
+        'organs': [
+            {'id': organ.organ_id, 'name': organ.organ.name}
+            for organ in question.questionOrgans_questionShare.all()
+        ],
+        'media': [
+            {
+                'id': media.media_id,
+                'name': media.media.name,
+                'type': media.media.type_id,
+                'category': media.media.category_id,
+                'source': media.media.source.url if media.media.source else None,
+            }
+            for media in question.QuestionShareMedia_questionShares.all()
+        ],
+        'options': [_option_document(option) for option in question.questionOptions_questionShare.all()],
+    })
+    return document
+
+
+def build_document(clinic_checkup, graph):
+    """
+    The whole reachable question graph of a ClinicCheckup as one JSON serializable document.
+    """
+    options = models.QuestionOption.objects.select_related(
+        'alert', 'suggestedDoctor__user', 'suggestedClinic'
+    ).prefetch_related(
+        'questionOptionEquations', 'questionOptionNumbers', 'questionOptionDates'
+    ).order_by('id')
+    questions = models.QuestionShare.objects.filter(
+        id__in=list(graph.question_ids)
+    ).select_related('doctor__user', 'clinic').prefetch_related(
+        Prefetch('questionOptions_questionShare', queryset=options),
+        Prefetch('questionOrgans_questionShare', queryset=models.QuestionOrgan.objects.select_related('organ')),
+        Prefetch('QuestionShareMedia_questionShares',
+                 queryset=models.QuestionShareMedia.objects.select_related('media')),
+    ).in_bulk()
+    return {
+        'id': clinic_checkup.id,
+        'title': clinic_checkup.title,
+        'clinic': clinic_checkup.clinic_id,
+        'start': graph.start if graph.start in graph else None,
+        'reachable_count': clinic_checkup.reachable_count,
+        'longest_path': clinic_checkup.longest_path,
+        'expected_question_count': clinic_checkup.expected_question_count,
+        'questions': [_question_document(questions[question_id]) for question_id in graph.question_ids],
+    }
+
+
+def build_bundle(document):
+    content = json.dumps(document, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    etag = hashlib.sha256(content).hexdigest()[:32]
+    encoded = {
+        'br': brotli.compress(content),
+        'gzip': gzip.compress(content, compresslevel=9, mtime=0),
+    }
+    return Bundle(etag, content, encoded)
+
+
+def get_bundle(clinic_checkup):
+    """
+    Returns the precompressed bundle of ``clinic_checkup``, built only once per clinic graph version
+    and version of the names it copies.
+    """
+    graph_key = clinic_graph_key(clinic_checkup.clinic_id)
+    versions = get_versions([graph_key, BUNDLE_NAMES_KEY])
+    key = f'questionGraph:bundle:{clinic_checkup.pk}:{versions[graph_key]}:{versions[BUNDLE_NAMES_KEY]}'
+    bundle = cache.get(key)
+    if bundle is None:
+        graph = get_compiled_graph(clinic_checkup)
+        bundle = build_bundle(build_document(clinic_checkup, graph))
+        cache.set(key, bundle, BUNDLE_TIMEOUT)
+    return bundle
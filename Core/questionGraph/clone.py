@@ -0,0 +1,142 @@
+import re
+
+from django.db import connection, transaction
+from django.db.models import Max
+
+from Core import models
+from Core.questionGraph.engine import compile_graph
+
+EQUATION_VARIABLE = re.compile(r'\bq(\d+)\b')
+BAND_MODELS = [models.QuestionOptionNumber, models.QuestionOptionDate, models.QuestionOptionEquation]
+
+
+class CloneError(Exception):
+    """
+    Raised when the rows created by a clone could not be matched back to their sources.
+    """
+
+
+def _copy(instance, **changes):
+    """
+    Unsaved copy of ``instance`` with every concrete field but the primary key.
+    """
+    values = {
+        field.attname: getattr(instance, field.attname)
+        for field in instance._meta.concrete_fields if not field.primary_key
+    }
+    values.update(changes)
+    return type(instance)(**values)
+
+
+def _bulk_create(objs, created):
+    """
+    bulk_create ``objs`` and make sure every object has its primary key.
+
+    Backends that cannot return ids from a bulk insert (MySQL, SQLite before Django 4) get them from
+    ``created``, a queryset of exactly the new rows, which are numbered in insertion order.
+    """
+    model = type(objs[0]) if objs else None
+    if model is None:
+        return objs
+    model.objects.bulk_create(objs)
+    if objs[0].pk is None:
+        ids = list(created.order_by('id').values_list('id', flat=True))
+        if len(ids) != len(objs):
+            raise CloneError(f'Expected {len(objs)} new {model.__name__} rows, found {len(ids)}')
+        for obj, pk in zip(objs, ids):
+            obj.pk = pk
+    return objs
+
+
+def _remap_equation(equation, mapping):
+    """
+    Points the q<id> variables of a copied equation at the copied questions.
+    """
+    def remap(match):
+        question_id = int(match.group(1))
+        return f'q{mapping.get(question_id, question_id)}'
+    return EQUATION_VARIABLE.sub(remap, equation)
+
+
+def clone_clinic_checkup(clinic_checkup, clinic=None, title=None):
+    """
+    Copies ``clinic_checkup`` and every question reachable from its starting question, with their
+    options, option bands, organs and media, into ``clinic`` (the same clinic by default). The copied
+    questions belong to the agent of that clinic.
+
+    Ids are remapped in memory and every table is written with a single bulk_create, so the number of
+    queries does not depend on the size of the graph. Links leaving the reachable graph are dropped.
+    Returns the new ClinicCheckup.
+    """
+    if clinic is None:
+        clinic = clinic_checkup.clinic
+    clinic_id = clinic.pk
+    graph = compile_graph(clinic_checkup)
+    source_ids = list(graph.question_ids)
+    if not source_ids:
+        raise CloneError(f'{clinic_checkup} has no questions to clone')
+    questions = models.QuestionShare.objects.in_bulk(source_ids)
+    options = list(models.QuestionOption.objects.filter(questionShare_id__in=source_ids).order_by('id'))
+    bands = {
+        model: list(model.objects.filter(questionOption__questionShare_id__in=source_ids).order_by('id'))
+        for model in BAND_MODELS
+    }
+    organs = list(models.QuestionOrgan.objects.filter(questionShare_id__in=source_ids).order_by('id'))
+    media = list(models.QuestionShareMedia.objects.filter(questionShare_id__in=source_ids).order_by('id'))
+
+    returns_ids = connection.features.can_return_rows_from_bulk_insert
+    with transaction.atomic():
+        last_id = 0 if returns_ids else models.QuestionShare.objects.aggregate(last=Max('id'))['last'] or 0
+        new_questions = _bulk_create(
+            [_copy(questions[question_id], clinic_id=clinic_id, doctor_id=clinic.agent_id, chart_connectQstId_id=None)
+             for question_id in source_ids],
+            models.QuestionShare.objects.filter(clinic_id=clinic_id, id__gt=last_id),
+        )
+        for source_id, question in zip(source_ids, new_questions):
+            if questions[source_id].title != question.title:
+                raise CloneError(f'Question {question.pk} is not the copy of question {source_id}')
+        question_map = {source_id: question.pk for source_id, question in zip(source_ids, new_questions)}
+
+        changed = []
+        for source_id, question in zip(source_ids, new_questions):
+            source = questions[source_id]
+            question.chart_connectQstId_id = question_map.get(source.chart_connectQstId_id)
+            if source.equation:
+                question.equation = _remap_equation(source.equation, question_map)
+            if question.chart_connectQstId_id is not None or question.equation != source.equation:
+                changed.append(question)
+        models.QuestionShare.objects.bulk_update(changed, ['chart_connectQstId', 'equation'])
+
+        new_question_ids = list(question_map.values())
+        new_options = _bulk_create(
+            [_copy(option, questionShare_id=question_map[option.questionShare_id],
+                   chart_connectQstId_id=question_map.get(option.chart_connectQstId_id))
+             for option in options],
+            models.QuestionOption.objects.filter(questionShare_id__in=new_question_ids),
+        )
+        option_map = {option.pk: new_option.pk for option, new_option in zip(options, new_options)}
+
+        for model, rows in bands.items():
+            if rows:
+                model.objects.bulk_create(
+                    [_copy(row, questionOption_id=option_map[row.questionOption_id]) for row in rows]
+                )
+        if organs:
+            models.QuestionOrgan.objects.bulk_create(
+                [_copy(organ, questionShare_id=question_map[organ.questionShare_id]) for organ in organs]
+            )
+        if media:
+            models.QuestionShareMedia.objects.bulk_create(
+                [_copy(item, questionShare_id=question_map[item.questionShare_id]) for item in media]
+            )
+
+        clone = _copy(
+            clinic_checkup,
+            clinic_id=clinic_id,
+            title=title or clinic_checkup.title,
+            starting_question_id=question_map.get(clinic_checkup.starting_question_id),
+            reachable_count=None, longest_path=None, expected_question_count=None, graph_issues={},
+            analyzed_on=None,
+        )
+        clone.save()
+    return clone
@@ -0,0 +1,173 @@
+import threading
+from array import array
+from collections import deque
+
+from Core import models
+from Core.caching import get_version
+
+
+class UnknownNode(LookupError):
+    """
+    Raised when a question or option is not part of the compiled checkup graph.
+    """
+
+
+def clinic_graph_key(clinic_id):
+    return f'questionGraph:clinic:{clinic_id}'
+
+
+class CompiledGraph:
+    """
+    Compact adjacency form of the questions reachable from a ClinicCheckup starting question.
+
+    Questions and options are addressed by their position in ``question_ids`` / ``option_ids``.
+    The options of question ``i`` are ``option_offsets[i]:option_offsets[i + 1]`` and every
+    "next" array holds a question position or -1 when the branch ends there.
+    """
+
+    __slots__ = (
+        'clinic_checkup_id', 'clinic_id', 'version', 'start',
+        'question_ids', 'question_next', 'option_offsets', 'option_ids', 'option_next',
+        'dangling', '_question_index', '_option_index',
+    )
+
+    def __init__(self, clinic_checkup_id, clinic_id, version, start, questions, options, dangling):
+        self.clinic_checkup_id = clinic_checkup_id
+        self.clinic_id = clinic_id
+        self.version = version
+        self.start = start
+        self.dangling = dangling
+
+        self.question_ids = array('q', (question_id for question_id, _next in questions))
+        self._question_index = {question_id: i for i, question_id in enumerate(self.question_ids)}
+        self.question_next = array('q', (self._position(next_id) for _id, next_id in questions))
+
+        self.option_offsets = array('q', [0])
+        self.option_ids = array('q')
+        self.option_next = array('q')
+        for question_id in self.question_ids:
+            for option_id, next_id in options.get(question_id, ()):
+                self.option_ids.append(option_id)
+                self.option_next.append(self._position(next_id))
+            self.option_offsets.append(len(self.option_ids))
+        self._option_index = {option_id: i for i, option_id in enumerate(self.option_ids)}
+
+    def _position(self, question_id):
+        if question_id is None:
+            return -1
+        return self._question_index.get(question_id, -1)
+
+    def __len__(self):
+        return len(self.question_ids)
+
+    def __contains__(self, question_id):
+        return question_id in self._question_index
+
+    def index_of(self, question_id):
+        try:
+            return self._question_index[question_id]
+        except KeyError:
+            raise UnknownNode(f'Question {question_id} is not part of this checkup')
+
+    def options_of(self, question_id):
+        i = self.index_of(question_id)
+        return self.option_ids[self.option_offsets[i]:self.option_offsets[i + 1]]
+
+    def successors(self, position):
+        """
+        Positions of the questions that can follow the question at ``position``.
+        """
+        targets = set()
+        start, end = self.option_offsets[position], self.option_offsets[position + 1]
+        fallback = self.question_next[position]
+        for target in self.option_next[start:end]:
+            target = target if target >= 0 else fallback
+            if target >= 0:
+                targets.add(target)
+        if start == end and fallback >= 0:
+            targets.add(fallback)
+        return targets
+
+    def next_question(self, question_id, option_id=None):
+        """
+        Returns the id of the question that follows ``question_id`` when ``option_id`` is chosen,
+        or None when the checkup ends there.
+        """
+        i = self.index_of(question_id)
+        if option_id is not None:
+            o = self._option_index.get(option_id)
+            if o is None or not self.option_offsets[i] <= o < self.option_offsets[i + 1]:
+                raise UnknownNode(f'Option {option_id} does not belong to question {question_id}')
+            target = self.option_next[o]
+            if target >= 0:
+                return self.question_ids[target]
+        target = self.question_next[i]
+        return self.question_ids[target] if target >= 0 else None
+
+
+def load_clinic_rows(clinic_id):
+    """
+    The "next" links of every question of a clinic and its options, one query per table.
+    """
+    question_next = dict(
+        models.QuestionShare.objects.filter(clinic_id=clinic_id).values_list('id', 'chart_connectQstId_id')
+    )
+    question_options = {}
+    option_rows = models.QuestionOption.objects.filter(
+        questionShare__clinic_id=clinic_id
+    ).order_by('id').values_list('id', 'questionShare_id', 'chart_connectQstId_id')
+    for option_id, question_id, next_id in option_rows:
+        question_options.setdefault(question_id, []).append((option_id, next_id))
+    return question_next, question_options
+
+
+def compile_graph(clinic_checkup, version=None, rows=None):
+    """
+    Builds the CompiledGraph of ``clinic_checkup`` with two queries, one per table, or from the
+    already loaded ``load_clinic_rows`` of its clinic.
+    """
+    clinic_id = clinic_checkup.clinic_id
+    start = clinic_checkup.starting_question_id
+    question_next, question_options = rows if rows is not None else load_clinic_rows(clinic_id)
+
+    questions = []
+    options = {}
+    dangling = []
+    if start in question_next:
+        seen = {start}
+        queue = deque([start])
+        while queue:
+            question_id = queue.popleft()
+            next_id = question_next[question_id]
+            questions.append((question_id, next_id))
+            options[question_id] = question_options.get(question_id, [])
+            targets = [(None, next_id)] + options[question_id]
+            for option_id, target in targets:
+                if target is None:
+                    continue
+                if target not in question_next:
+                    dangling.append((question_id, option_id, target))
+                elif target not in seen:
+                    seen.add(target)
+                    queue.append(target)
+
+    return CompiledGraph(clinic_checkup.pk, clinic_id, version, start, questions, options, dangling)
+
+
+_compiled = {}
+_compiled_lock = threading.Lock()
+
+
+def get_compiled_graph(clinic_checkup):
+    """
+    Returns the per-process compiled graph of ``clinic_checkup``, recompiling it only when
+    the questions of its clinic changed since it was built.
+    """
+    version = get_version(clinic_graph_key(clinic_checkup.clinic_id))
+    graph = _compiled.get(clinic_checkup.pk)
+    if graph is not None and graph.version == version and graph.start == clinic_checkup.starting_question_id:
+        return graph
+    graph = compile_graph(clinic_checkup, version)
+    with _compiled_lock:
+        _compiled[clinic_checkup.pk] = graph
+    return graph
@@ -0,0 +1,221 @@
+import ast
+import hashlib
+import math
+import operator
+import re
+import threading
+from collections import OrderedDict
+
+from Core import models
+
+
+class EquationError(ValueError):
+    """
+    Raised when a QuestionShare.equation can not be compiled or evaluated.
+    """
+
+
+# Variables name the answer of a previous question: q12 is the answer of QuestionShare 12.
+VARIABLE_PATTERN = re.compile(r'^q(\d+)$')
+MAX_EXPONENT = 64
+# Longest text of a value quoted in an error message.
+MAX_QUOTED = 40
+
+_BINARY_OPERATORS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+    ast.Pow: pow,
+}
+
+_UNARY_OPERATORS = {
+    ast.UAdd: operator.pos,
+    ast.USub: operator.neg,
+}
+
+_FUNCTIONS = {
+    'abs': abs,
+    'min': min,
+    'max': max,
+    'round': round,
+    'sqrt': math.sqrt,
+    'log': math.log,
+    'log10': math.log10,
+    'exp': math.exp,
+}
+
+
+def _quote(value):
+    text = repr(value)
+    return text if len(text) <= MAX_QUOTED else text[:MAX_QUOTED] + '...'
+
+
+def _power(base, exponent):
+    if abs(exponent) > MAX_EXPONENT:
+        raise EquationError(f'Exponent {_quote(exponent)} is too large')
+    return pow(base, exponent)
+
+
+def _compile_node(node, variables):
+    """
+    Turns a whitelisted AST node into a closure taking the variables mapping.
+    """
+    if isinstance(node, ast.Expression):
+        return _compile_node(node.body, variables)
+
+    if isinstance(node, ast.Constant):
+        if isinstance(node.value, bool) or not isinstance(node.value, (int, float)):
+            raise EquationError(f'Unsupported constant {_quote(node.value)}')
+        value = float(node.value)
+        return lambda env: value
+
+    if isinstance(node, ast.Name):
+        name = node.id
+        if not VARIABLE_PATTERN.match(name):
+            raise EquationError(f'Unknown variable {_quote(name)}, variables are written as q<question id>')
+        variables.add(name)
+
+        def load(env):
+            try:
+                return env[name]
+            except KeyError:
+                raise EquationError(f'Question {name[1:]} has not been answered')
+        return load
+
+    if isinstance(node, ast.BinOp) and type(node.op) in _BINARY_OPERATORS:
+        left = _compile_node(node.left, variables)
+        right = _compile_node(node.right, variables)
+        op = _BINARY_OPERATORS[type(node.op)]
+        if op is pow:
+            return lambda env: _power(left(env), right(env))
+        return lambda env: op(left(env), right(env))
+
+    if isinstance(node, ast.UnaryOp) and type(node.op) in _UNARY_OPERATORS:
+        operand = _compile_node(node.operand, variables)
+        op = _UNARY_OPERATORS[type(node.op)]
+        return lambda env: op(operand(env))
+
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and not node.keywords:
+        function = _FUNCTIONS.get(node.func.id)
+        if function is None:
+            raise EquationError(f'Unknown function {_quote(node.func.id)}')
+        arguments = [_compile_node(argument, variables) for argument in node.args]
+        return lambda env: function(*[argument(env) for argument in arguments])
+
+    raise EquationError(f'Unsupported expression {type(node).__name__}')
+
+
+class CompiledEquation:
+    """
+    A validated equation ready to be evaluated against the answers of a checkup.
+    """
+
+    __slots__ = ('text', 'variables', '_evaluate')
+
+    def __init__(self, text):
+        try:
+            # Doctors write powers as h^2, so ^ is a power and not a bitwise xor.
+            tree = ast.parse(text.strip().replace('^', '**'), mode='eval')
+        except SyntaxError as e:
+            raise EquationError(f'Invalid equation: {e.msg}')
+        except (RecursionError, ValueError, MemoryError):
+            raise EquationError('Invalid equation: too long or too deeply nested')
+        variables = set()
+        try:
+            self._evaluate = _compile_node(tree, variables)
+        except OverflowError:
+            raise EquationError('Invalid equation: a number is too large')
+        except RecursionError:
+            raise EquationError('Invalid equation: too deeply nested')
+        except ValueError as e:
+            if isinstance(e, EquationError):
+                raise
+            raise EquationError('Invalid equation: a number can not be read')
+        self.text = text
+        self.variables = frozenset(variables)
+
+    def __call__(self, variables):
+        try:
+            return float(self._evaluate(variables))
+        except (ArithmeticError, ValueError, TypeError) as e:
+            if isinstance(e, EquationError):
+                raise
+            message = str(e)
+            if len(message) > MAX_QUOTED:
+                message = message[:MAX_QUOTED] + '...'
+            raise EquationError(f'Equation can not be evaluated: {message}')
+
+
+def compile_equation(text):
+    return CompiledEquation(text)
+
+
+class _CompiledEquationCache:
+    """
+    LRU of compiled equations keyed by question id and the hash of the equation text.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, question_id, text):
+        key = (question_id, hashlib.sha1(text.encode('utf-8')).hexdigest())
+        with self._lock:
+            equation = self._entries.get(key)
+            if equation is not None:
+                self._entries.move_to_end(key)
+                return equation
+        equation = CompiledEquation(text)
+        with self._lock:
+            self._entries[key] = equation
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return equation
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+compiled_equations = _CompiledEquationCache()
+
+
+def answer_variables(checkup_id):
+    """
+    Variables of the answers given in a checkup, the weight of the chosen option of each question.
+    """
+    answers = models.QuestionAnswer.objects.filter(
+        checkup_id=checkup_id
+    ).values_list('questionShare_id', 'questionOption__weight')
+    return {f'q{question_id}': float(weight) for question_id, weight in answers if weight is not None}
+
+
+def parse_variables(data):
+    """
+    Variables posted by a client, {"q<question id>": number}, as floats.
+    """
+    if not isinstance(data, dict):
+        raise EquationError('Variables must be an object of q<question id> to a number')
+    variables = {}
+    for name, value in data.items():
+        if not isinstance(name, str) or not VARIABLE_PATTERN.match(name):
+            raise EquationError(f'Unknown variable {_quote(name)}, variables are written as q<question id>')
+        try:
+            if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+                raise TypeError
+            number = float(value)
+        except (TypeError, ValueError, OverflowError):
+            number = math.nan
+        if not math.isfinite(number):
+            raise EquationError(f'Variable {name} is not a number: {_quote(value)}')
+        variables[name] = number
+    return variables
+
+
+def evaluate_question_equation(question_id, text, variables):
+    return compiled_equations.get(question_id, text)(variables)
@@ -0,0 +1,134 @@
+from django.db import transaction
+from rest_framework import serializers
+
+from Core import models
+
+QUESTION_SHARE_FIELDS = {
+    'chart_is_visible': serializers.BooleanField(),
+    'chart_global_src_x': serializers.FloatField(allow_null=True),
+    'chart_global_src_y': serializers.FloatField(allow_null=True),
+    'chart_global_des_x': serializers.FloatField(allow_null=True),
+    'chart_global_des_y': serializers.FloatField(allow_null=True),
+    'is_starter': serializers.BooleanField(),
+    'chart_branchCount': serializers.IntegerField(min_value=-32768, max_value=32767),
+}
+QUESTION_OPTION_FIELDS = {
+    'chart_global_x': serializers.FloatField(allow_null=True),
+    'chart_global_y': serializers.FloatField(allow_null=True),
+}
+OPTIONS_KEY = 'questionOptions_questionShare'
+
+
+def _id(value):
+    if isinstance(value, bool):
+        raise ValueError(value)
+    return int(value)
+
+
+def _connect_id(value):
+    """
+    Target of a chart_connectQstId, None when the editor sent no connection.
+    """
+    if value is None or value == "null" or value == "":
+        return None
+    return _id(value)
+
+
+def _convert(fields, data):
+    values = {}
+    for name, field in fields.items():
+        if name in data:
+            value = data[name]
+            values[name] = None if value is None and field.allow_null else field.to_internal_value(value)
+    return values
+
+
+class LayoutSaveError(Exception):
+
+    def __init__(self, errors):
+        super().__init__(errors)
+        self.errors = errors
+
+
+def save_layout(nodes):
+    """
+    Saves the chart fields of a flowchart diagram: a list of QuestionShare nodes each with its
+    "questionOptions_questionShare". Every model is fetched with one in_bulk and written with one
+    bulk_update restricted to the chart fields. Nothing is written when any node is invalid, the
+    per-node errors are raised in a LayoutSaveError instead.
+
+    Returns the ids of the clinics whose question graph changed.
+    """
+    if not isinstance(nodes, list):
+        raise LayoutSaveError([{'error': 'A list of question nodes is required'}])
+
+    errors = []
+    question_ids, option_ids, target_ids = set(), set(), set()
+    parsed = []
+    for i, node in enumerate(nodes):
+        try:
+            question_id = _id(node['id'])
+            question_values = _convert(QUESTION_SHARE_FIELDS, node)
+            connect = _connect_id(node.get('chart_connectQstId'))
+            options = []
+            for option in node.get(OPTIONS_KEY) or []:
+                options.append((_id(option['id']), _convert(QUESTION_OPTION_FIELDS, option),
+                                _connect_id(option.get('chart_connectQstId'))))
+        except (TypeError, KeyError, ValueError, serializers.ValidationError) as e:
+            detail = e.detail if isinstance(e, serializers.ValidationError) else f'Invalid node: {e!r}'
+            errors.append({'index': i, 'id': node.get('id') if isinstance(node, dict) else None, 'error': detail})
+            continue
+        question_ids.add(question_id)
+        target_ids.update(target for target in [connect] + [option[2] for option in options] if target)
+        option_ids.update(option[0] for option in options)
+        parsed.append((i, question_id, question_values, connect, options))
+
+    questions = models.QuestionShare.objects.only(
+        'id', 'clinic_id', 'chart_connectQstId', *QUESTION_SHARE_FIELDS
+    ).in_bulk(question_ids | target_ids)
+    question_options = models.QuestionOption.objects.only(
+        'id', 'questionShare_id', 'chart_connectQstId', *QUESTION_OPTION_FIELDS
+    ).in_bulk(option_ids)
+
+    changed_questions, changed_options = [], []
+    for i, question_id, question_values, connect, options in parsed:
+        node_errors = []
+        question = questions.get(question_id)
+        if question is None:
+            node_errors.append(f'Question {question_id} does not exist')
+        if connect and connect not in questions:
+            node_errors.append(f'Connected question {connect} does not exist')
+        for option_id, _values, option_connect in options:
+            option = question_options.get(option_id)
+            if option is None or option.questionShare_id != question_id:
+                node_errors.append(f'Option {option_id} does not belong to question {question_id}')
+            if option_connect and option_connect not in questions:
+                node_errors.append(f'Connected question {option_connect} of option {option_id} does not exist')
+        if node_errors:
+            errors.append({'index': i, 'id': question_id, 'error': node_errors})
+            continue
+
+        for name, value in question_values.items():
+            setattr(question, name, value)
+        if connect:
+            question.chart_connectQstId_id = connect
+        changed_questions.append(question)
+        for option_id, values, option_connect in options:
+            option = question_options[option_id]
+            for name, value in values.items():
+                setattr(option, name, value)
+            if option_connect:
+                option.chart_connectQstId_id = option_connect
+            changed_options.append(option)
+
+    if errors:
+        raise LayoutSaveError(errors)
+
+    with transaction.atomic():
+        models.QuestionShare.objects.bulk_update(
+            changed_questions, list(QUESTION_SHARE_FIELDS) + ['chart_connectQstId'], batch_size=500
+        )
+        models.QuestionOption.objects.bulk_update(
+            changed_options, list(QUESTION_OPTION_FIELDS) + ['chart_connectQstId'], batch_size=500
+        )
+    return {question.clinic_id for question in changed_questions}
@@ -0,0 +1,79 @@
+import gzip
+import hashlib
+import json
+from functools import lru_cache
+
+import brotli
+from django.db import transaction
+
+from Core import models
+from Core.questionGraph.bundle import Bundle, build_document
+from Core.questionGraph.engine import CompiledGraph, compile_graph, get_compiled_graph
+
+
+def publish_version(clinic_checkup):
+    """
+    Snapshots the current question graph of ``clinic_checkup`` as a new ClinicCheckupVersion.
+
+    Returns ``(version, created)``, the latest version is returned unchanged when the graph did not
+    change since it was published.
+    """
+    with transaction.atomic():
+        models.ClinicCheckup.objects.select_for_update().only('id').get(pk=clinic_checkup.pk)
+        document = build_document(clinic_checkup, compile_graph(clinic_checkup))
+        content = json.dumps(document, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        etag = hashlib.sha256(content).hexdigest()[:32]
+        latest = models.ClinicCheckupVersion.objects.filter(
+            clinic_checkup=clinic_checkup
+        ).order_by('-number').only('id', 'number', 'etag', 'clinic_checkup_id').first()
+        if latest is not None and latest.etag == etag:
+            return latest, False
+        version = models.ClinicCheckupVersion.objects.create(
+            clinic_checkup=clinic_checkup,
+            number=latest.number + 1 if latest else 1,
+            etag=etag,
+            blob=brotli.compress(content),
+        )
+    return version, True
+
+
+@lru_cache(maxsize=256)
+def get_version_bundle(version_id):
+    """
+    The Bundle of a published version. Versions never change so it is loaded once per process.
+    """
+    etag, blob = models.ClinicCheckupVersion.objects.values_list('etag', 'blob').get(pk=version_id)
+    blob = bytes(blob)
+    content = brotli.decompress(blob)
+    return Bundle(etag, content, {'br': blob, 'gzip': gzip.compress(content, compresslevel=9, mtime=0)})
+
+
+@lru_cache(maxsize=256)
+def get_version_graph(version_id):
+    """
+    The CompiledGraph of a published version, built from its document without touching the
+    editable question tables.
+    """
+    document = json.loads(get_version_bundle(version_id).content)
+    known = {question['id'] for question in document['questions']}
+    questions = []
+    options = {}
+    dangling = []
+    for question in document['questions']:
+        questions.append((question['id'], question['next']))
+        options[question['id']] = [(option['id'], option['next']) for option in question['options']]
+        for option_id, target in [(None, question['next'])] + options[question['id']]:
+            if target is not None and target not in known:
+                dangling.append((question['id'], option_id, target))
+    return CompiledGraph(document['id'], document['clinic'], version_id, document['start'], questions, options,
+                         dangling)
+
+
+def get_checkup_graph(checkup):
+    """
+    The question graph a Checkup is answered against: the version pinned when it started, or the
+    live graph of its ClinicCheckup when nothing was published yet.
+    """
+    if checkup.graph_version_id is not None:
+        return get_version_graph(checkup.graph_version_id)
+    return get_compiled_graph(checkup.clinic_checkup)
@@ -0,0 +1,81 @@
+from functools import lru_cache
+
+from Core import models
+from Core.caching import bump_version
+
+REPRESENTATION_TIMEOUT = 60 * 60 * 24
+
+# Models whose serialized representations are cached, see RepresentationCacheMixin.
+CACHED_MODELS = (models.Doctor, models.Clinic, models.RealClinic, models.RealDoctor, models.ClinicCheckup)
+
+# model: (cached model, lookup of the written row) for every representation the model is rendered in,
+# expansions aside, see dependencies.
+DEPENDENCIES = {
+    models.User: [
+        (models.Doctor, 'user'),
+        (models.Clinic, 'agent__user'),
+        (models.ClinicCheckup, 'clinic__agent__user'),
+    ],
+    models.Doctor: [(models.Clinic, 'agent'), (models.ClinicCheckup, 'clinic__agent')],
+    models.ClinicGroup: [(models.Clinic, 'clinicGroup')],
+    models.Clinic: [(models.ClinicCheckup, 'clinic')],
+    models.QuestionShare: [(models.ClinicCheckup, 'starting_question')],
+}
+
+
+def representation_version_key(model, pk):
+    return f'representation:{model._meta.label_lower}:{pk}'
+
+
+def bump_representations(model, pks):
+    for pk in pks:
+        bump_version(representation_version_key(model, pk))
+
+
+def _expansions(serializer_class, prefix='', seen=()):
+    """
+    (written model, lookup) of everything ``serializer_class`` renders through its ``Meta.expandable``
+    fields, nested expansions included.
+    """
+    from Core.api import serializer
+
+    for field, name in getattr(serializer_class.Meta, 'expandable', {}).items():
+        expanded = getattr(serializer, name)
+        model = expanded.Meta.model
+        if model in seen:
+            continue
+        lookup = f'{prefix}{field}'
+        yield model, lookup
+        for written, dependencies in DEPENDENCIES.items():
+            for cached, written_lookup in dependencies:
+                if cached is model:
+                    yield written, f'{lookup}__{written_lookup}'
+        yield from _expansions(expanded, f'{lookup}__', seen + (serializer_class.Meta.model,))
+
+
+@lru_cache(maxsize=None)
+def dependencies(model):
+    """
+    DEPENDENCIES of ``model`` and the cached representations it is embedded in by ?expand=.
+    """
+    from Core.api import serializer
+
+    found = list(DEPENDENCIES.get(model, ()))
+    for serializer_class in vars(serializer).values():
+        if (isinstance(serializer_class, type) and issubclass(serializer_class, serializer.RepresentationCacheMixin)
+                and serializer_class is not serializer.RepresentationCacheMixin):
+            cached = serializer_class.Meta.model
+            for written, lookup in _expansions(serializer_class, seen=(cached,)):
+                if written is model and (cached, lookup) not in found:
+                    found.append((cached, lookup))
+    return found
+
+
+def representation_changed(instance):
+    """
+    Invalidates the cached representations of ``instance`` and of the objects rendering it.
+    """
+    if isinstance(instance, CACHED_MODELS):
+        bump_representations(type(instance), [instance.pk])
+    for model, lookup in dependencies(type(instance)):
+        bump_representations(model, model.objects.filter(**{lookup: instance.pk}).values_list('pk', flat=True))
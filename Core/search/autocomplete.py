@@ -0,0 +1,130 @@
+import threading
+
+from Core import models
+from Core.caching import get_version
+from Core.search.normalize import normalize
+
+# catalog: model whose titles it completes
+CATALOGS = {
+    'drug': models.Drug,
+    'illness': models.Illness,
+    'job': models.Job,
+    'drugAmount': models.DrugAmount,
+    'drugInstruction': models.DrugInstruction,
+}
+# Completions kept per trie node, the most a lookup returns.
+TOP_K = 10
+
+
+def catalog_key(catalog):
+    return f'catalogTrie:{catalog}'
+
+
+class _Node:
+    __slots__ = ('edges', 'top')
+
+    def __init__(self, top=()):
+        # first character: (label, child)
+        self.edges = {}
+        # the best TOP_K (id, title) below the node
+        self.top = list(top)
+
+    def add(self, entry):
+        if len(self.top) < TOP_K and entry not in self.top:
+            self.top.append(entry)
+
+
+class CatalogTrie:
+    """
+    Compressed (radix) trie of the normalized titles of one catalog and of their suffixes from each
+    later word, so "نوع" completes "دیابت نوع 2". Every node keeps the best TOP_K titles below it,
+    and a lookup is a walk down the prefix without visiting the subtree.
+
+    Titles rank by whether the prefix starts the title rather than a later word, then by length and
+    then alphabetically. Inserting the keys in that order lets each node keep the first TOP_K titles
+    reaching it.
+    """
+
+    __slots__ = ('version', 'root', 'size')
+
+    def __init__(self, rows, version=None):
+        self.version = version
+        self.root = _Node()
+        self.size = 0
+        keys = []
+        for object_id, title in rows:
+            self.size += 1
+            text = normalize(title)
+            words = text.split(' ')
+            for i in range(len(words)):
+                key = ' '.join(words[i:])
+                keys.append(((i > 0, len(text), text, object_id), key, (object_id, title)))
+        keys.sort(key=lambda key: key[0])
+        for _, key, entry in keys:
+            self._insert(key, entry)
+
+    def __len__(self):
+        return self.size
+
+    def _insert(self, key, entry):
+        node = self.root
+        node.add(entry)
+        while key:
+            edge = node.edges.get(key[0])
+            if edge is None:
+                child = _Node()
+                child.add(entry)
+                node.edges[key[0]] = (key, child)
+                return
+            label, child = edge
+            common = 0
+            while common < len(label) and common < len(key) and label[common] == key[common]:
+                common += 1
+            if common < len(label):
+                # split the edge, the new node reaching everything its child did
+                middle = _Node(child.top)
+                middle.edges[label[common]] = (label[common:], child)
+                node.edges[key[0]] = (label[:common], middle)
+                child = middle
+            child.add(entry)
+            node, key = child, key[common:]
+
+    def complete(self, prefix, limit=TOP_K):
+        """
+        The best ``limit`` (id, title) whose title, or a word of it onwards, starts with ``prefix``.
+        """
+        key = normalize(prefix)
+        if not key:
+            return []
+        node = self.root
+        while key:
+            edge = node.edges.get(key[0])
+            if edge is None:
+                return []
+            label, node = edge
+            if not (key.startswith(label) or label.startswith(key)):
+                return []
+            key = key[len(label):]
+        return node.top[:limit]
+
+
+def build_catalog_trie(catalog, version=None):
+    return CatalogTrie(CATALOGS[catalog].objects.values_list('id', 'title').iterator(), version)
+
+
+_tries = {}
+_tries_lock = threading.Lock()
+
+
+def get_catalog_trie(catalog):
+    """
+    Returns the per-process CatalogTrie of ``catalog``, rebuilt after a write to its model.
+    """
+    version = get_version(catalog_key(catalog))
+    trie = _tries.get(catalog)
+    if trie is not None and trie.version == version:
+        return trie
+    trie = build_catalog_trie(catalog, version)
+    with _tries_lock:
+        _tries[catalog] = trie
+    return trie
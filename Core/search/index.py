@@ -0,0 +1,269 @@
+import bisect
+import heapq
+import math
+import re
+import threading
+
+from django.core.cache import cache
+
+from Core import models
+from Core.caching import bump_version, get_version
+from Core.search.normalize import normalize
+
+SEARCH_INDEX_KEY = 'searchIndex'
+SEARCH_INDEX_TIMEOUT = 60 * 60 * 24
+# Most document changes a process applies to its index instead of loading a new one.
+MAX_CHANGES = 200
+
+# Weight of a term found in each field of a document.
+FIELD_WEIGHTS = {'name': 3.0, 'title': 3.0, 'specialty': 1.0}
+# Score factor of a term matched as the prefix of a longer token.
+PREFIX_FACTOR = 0.5
+MIN_PREFIX_LENGTH = 2
+
+TOKEN = re.compile(r'\w+')
+
+
+def tokenize(text):
+    return TOKEN.findall(normalize(text))
+
+
+def load_documents(ids=None):
+    """
+    Every searchable document, or those of ``ids`` {kind: ids}, as (kind, id, [(field, text), ...]),
+    one query per kind.
+    """
+    doctors, clinics = models.Doctor.objects.all(), models.Clinic.objects.all()
+    if ids is not None:
+        doctors = doctors.filter(pk__in=ids.get('doctor', ()))
+        clinics = clinics.filter(pk__in=ids.get('clinic', ()))
+    for doctor_id, first_name, last_name, specialty in doctors.values_list(
+        'id', 'user__first_name', 'user__last_name', 'specialyTitle'
+    ):
+        yield 'doctor', doctor_id, [('name', first_name), ('name', last_name), ('specialty', specialty)]
+    for clinic_id, title in clinics.values_list('id', 'title'):
+        yield 'clinic', clinic_id, [('title', title)]
+
+
+class SearchIndex:
+    """
+    Inverted index of the searchable documents: for every kind, each token maps to the ids of the
+    documents containing it with the summed weight of the fields it appears in.
+
+    A query matches the documents containing all its terms, each term either as a token or, from
+    MIN_PREFIX_LENGTH characters, as the prefix of one. Documents are ranked by the sum, over the
+    terms, of the weight of their best match times the inverse frequency of the documents the term
+    matches.
+
+    ``update`` replaces documents in place for the writes of other processes. It swaps in new postings
+    and token lists rather than changing the ones a concurrent search may be reading.
+    """
+
+    __slots__ = ('version', 'postings', 'tokens', 'sizes', 'documents')
+
+    def __init__(self, documents, version=None):
+        self.version = version
+        self.postings = {}
+        self.sizes = {}
+        # kind: {document id: {token: weight}}, what to take out when a document changes
+        self.documents = {}
+        for kind, document_id, fields in documents:
+            weights = self._weights(fields)
+            self.documents.setdefault(kind, {})[document_id] = weights
+            self.sizes[kind] = self.sizes.get(kind, 0) + 1
+            kind_postings = self.postings.setdefault(kind, {})
+            for token, weight in weights.items():
+                kind_postings.setdefault(token, {})[document_id] = weight
+        self.tokens = {kind: sorted(kind_postings) for kind, kind_postings in self.postings.items()}
+
+    def __len__(self):
+        return sum(self.sizes.values())
+
+    @staticmethod
+    def _weights(fields):
+        weights = {}
+        for field, text in fields:
+            for token in tokenize(text):
+                weights[token] = weights.get(token, 0.0) + FIELD_WEIGHTS[field]
+        return weights
+
+    def update(self, changed, documents, version):
+        """
+        Replaces the documents of ``changed`` {kind: ids} by ``documents``, those of them that still
+        exist, as load_documents gives them.
+        """
+        postings = {}
+        for kind, ids in changed.items():
+            kind_documents = self.documents.setdefault(kind, {})
+            kind_postings = self.postings.setdefault(kind, {})
+            for document_id in ids:
+                weights = kind_documents.pop(document_id, None)
+                if weights is None:
+                    continue
+                self.sizes[kind] -= 1
+                for token in weights:
+                    key = (kind, token)
+                    if key not in postings:
+                        postings[key] = dict(kind_postings[token])
+                    del postings[key][document_id]
+        for kind, document_id, fields in documents:
+            weights = self._weights(fields)
+            self.documents.setdefault(kind, {})[document_id] = weights
+            self.sizes[kind] = self.sizes.get(kind, 0) + 1
+            kind_postings = self.postings.setdefault(kind, {})
+            for token, weight in weights.items():
+                key = (kind, token)
+                if key not in postings:
+                    postings[key] = dict(kind_postings.get(token, ()))
+                postings[key][document_id] = weight
+        retokenized = set()
+        for (kind, token), token_postings in postings.items():
+            kind_postings = self.postings[kind]
+            if not token_postings:
+                del kind_postings[token]
+                retokenized.add(kind)
+            else:
+                if token not in kind_postings:
+                    retokenized.add(kind)
+                kind_postings[token] = token_postings
+        for kind in retokenized:
+            self.tokens[kind] = sorted(self.postings[kind])
+        self.version = version
+
+    def _matches(self, term, kind):
+        """
+        The postings of the tokens a query term matches with their score factor.
+        """
+        postings = self.postings.get(kind, {})
+        if len(term) < MIN_PREFIX_LENGTH:
+            return [(postings[term], 1.0)] if term in postings else []
+        tokens = self.tokens.get(kind, [])
+        matches = []
+        for i in range(bisect.bisect_left(tokens, term), len(tokens)):
+            token = tokens[i]
+            if not token.startswith(term):
+                break
+            # None for a token an update has just taken out
+            token_postings = postings.get(token)
+            if token_postings is not None:
+                matches.append((token_postings, 1.0 if token == term else PREFIX_FACTOR))
+        return matches
+
+    def _term_scores(self, term, kind):
+        matches = self._matches(term, kind)
+        if len(matches) == 1 and matches[0][1] == 1.0:
+            scores = matches[0][0]
+        else:
+            scores = {}
+            for postings, factor in matches:
+                for document_id, weight in postings.items():
+                    if weight * factor > scores.get(document_id, 0.0):
+                        scores[document_id] = weight * factor
+        idf = math.log(1 + self.sizes[kind] / len(scores)) if scores else 0.0
+        return scores, idf
+
+    def search(self, query, kind, limit=None):
+        """
+        The number of documents of ``kind`` matching ``query`` and the ids of the best ``limit`` of
+        them, best first.
+        """
+        terms = [self._term_scores(term, kind) for term in dict.fromkeys(tokenize(query))]
+        if not terms or not all(scores for scores, _ in terms):
+            return 0, []
+        # intersect from the rarest term
+        terms.sort(key=lambda term: len(term[0]))
+        (rarest, idf), others = terms[0], terms[1:]
+        totals = {}
+        for document_id, weight in rarest.items():
+            total = weight * idf
+            for scores, term_idf in others:
+                weight = scores.get(document_id)
+                if weight is None:
+                    break
+                total += weight * term_idf
+            else:
+                totals[document_id] = total
+        key = lambda item: (-item[1], item[0])  # noqa: E731
+        ranked = heapq.nsmallest(limit, totals.items(), key=key) if limit else sorted(totals.items(), key=key)
+        return len(totals), [document_id for document_id, _ in ranked]
+
+
+def _snapshot_key(version):
+    return f'{SEARCH_INDEX_KEY}:{version}'
+
+
+def _change_key(version):
+    return f'{SEARCH_INDEX_KEY}:change:{version}'
+
+
+def document_changed(kind, document_id):
+    """
+    Records a write to one document under a new index version, for every process to apply.
+    """
+    version = bump_version(SEARCH_INDEX_KEY)
+    cache.set(_change_key(version), (kind, document_id), SEARCH_INDEX_TIMEOUT)
+
+
+def build_search_index(version=None):
+    return SearchIndex(load_documents(), version)
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def _install(index):
+    global _index
+    with _index_lock:
+        _index = index
+    return index
+
+
+def _apply_changes(index, version):
+    """
+    Brings ``index`` to ``version`` by reloading the documents written since its own, False when
+    the changes are too many or no longer all in the cache.
+    """
+    with _index_lock:
+        if index.version == version:
+            return True
+        versions = range(index.version + 1, version + 1)
+        if not 0 < len(versions) <= MAX_CHANGES:
+            return False
+        changes = cache.get_many([_change_key(v) for v in versions])
+        if len(changes) != len(versions):
+            return False
+        changed = {}
+        for kind, document_id in changes.values():
+            changed.setdefault(kind, set()).add(document_id)
+        index.update(changed, load_documents(changed), version)
+        return True
+
+
+def get_search_index():
+    """
+    Returns the per-process SearchIndex, kept up to date with the Doctor, Clinic and doctor User
+    writes recorded by document_changed. A process too far behind loads the index of the current
+    version, built by the first process to see it and shared through the cache.
+    """
+    version = get_version(SEARCH_INDEX_KEY)
+    index = _index
+    if index is not None and index.version == version:
+        return index
+    if index is not None and _apply_changes(index, version):
+        return index
+    index = cache.get(_snapshot_key(version))
+    if index is None:
+        index = build_search_index(version)
+        cache.set(_snapshot_key(version), index, SEARCH_INDEX_TIMEOUT)
+    return _install(index)
+
+
+def rebuild_search_index():
+    """
+    Builds a new index from the database and makes every process load it.
+    """
+    version = bump_version(SEARCH_INDEX_KEY)
+    index = build_search_index(version)
+    cache.set(_snapshot_key(version), index, SEARCH_INDEX_TIMEOUT)
+    return _install(index)
@@ -0,0 +1,236 @@
+from functools import lru_cache, partial
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Q
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+from Core import models
+from Core.search.normalize import normalize
+
+TRIGRAM_BACKEND = 'Core.search.ngrams.TrigramBackend'
+MYSQL_BACKEND = 'Core.search.ngrams.MySQLNgramBackend'
+BATCH_SIZE = 1000
+
+# model: searchable fields of its own, filled by register.
+SEARCH_FIELDS = {}
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _label(model):
+    return model._meta.label_lower
+
+
+def resolve(model, paths):
+    """
+    Groups lookups like "title" or "clinic__title" into [(relation, model, fields)], relation being
+    the forward relation path, empty for the model's own fields.
+    """
+    targets = {}
+    for path in paths:
+        *relations, field = path.split('__')
+        target = model
+        for name in relations:
+            target = target._meta.get_field(name).related_model
+        target._meta.get_field(field)
+        targets.setdefault('__'.join(relations), (target, []))[1].append(field)
+    return [(relation, target, fields) for relation, (target, fields) in targets.items()]
+
+
+def register(model, paths):
+    """
+    Indexes the fields ``paths`` reach, on ``model`` or the models it references.
+    """
+    for _, target, fields in resolve(model, paths):
+        SEARCH_FIELDS[target] = tuple(dict.fromkeys(SEARCH_FIELDS.get(target, ()) + tuple(fields)))
+
+
+class TrigramBackend:
+    """
+    Keeps a SearchDocument row with the normalized text of every indexed field and a SearchTrigram
+    row for each of its distinct trigrams. A search asks the (trigram, document) index for the
+    documents having every trigram of the query words, and checks the words against their text.
+    """
+
+    def is_ready(self):
+        return True
+
+    def setup(self):
+        pass
+
+    def store(self, documents):
+        models.SearchTrigram.objects.bulk_create([
+            models.SearchTrigram(document=document, trigram=trigram)
+            for document in documents for trigram in trigrams(document.text)
+        ], batch_size=BATCH_SIZE)
+
+    def clear(self, documents):
+        models.SearchTrigram.objects.filter(document__in=documents).delete()
+
+    def candidates(self, documents, words):
+        grams = set().union(*map(trigrams, words))
+        if not grams:
+            return documents
+        return documents.filter(pk__in=models.SearchTrigram.objects.filter(
+            trigram__in=grams
+        ).values('document').annotate(matched=Count('trigram')).filter(matched=len(grams)).values('document'))
+
+    def matching(self, model, fields, words):
+        """
+        Ids of the ``model`` objects with all of ``words`` in one of ``fields``, as a subquery.
+        """
+        documents = models.SearchDocument.objects.filter(model=_label(model), field__in=fields)
+        for word in words:
+            documents = documents.filter(text__contains=word)
+        return self.candidates(documents, words).values('object_id')
+
+    @transaction.atomic
+    def index(self, model, object_id, texts, created=False):
+        """
+        Writes the normalized ``texts`` {field: text} of one object where they changed.
+        """
+        existing = {} if created else {
+            document.field: document
+            for document in models.SearchDocument.objects.filter(model=_label(model), object_id=object_id)
+        }
+        new, updated = [], []
+        for field, text in texts.items():
+            document = existing.get(field)
+            if document is None:
+                new.append(models.SearchDocument.objects.create(
+                    model=_label(model), field=field, object_id=object_id, text=text
+                ))
+            elif document.text != text:
+                document.text = text
+                document.save(update_fields=['text'])
+                updated.append(document)
+        if updated:
+            self.clear(updated)
+        if new or updated:
+            self.store(new + updated)
+
+    def delete(self, model, object_id):
+        documents = models.SearchDocument.objects.filter(model=_label(model), object_id=object_id)
+        self.clear(documents)
+        documents.delete()
+
+    @transaction.atomic
+    def rebuild(self, model, fields):
+        """
+        Reindexes every object of ``model``, returning how many there are.
+        """
+        documents = models.SearchDocument.objects.filter(model=_label(model))
+        self.clear(documents)
+        documents.delete()
+        count = 0
+        rows = model._default_manager.values_list('pk', *fields).iterator(chunk_size=BATCH_SIZE)
+        while True:
+            batch = [row for _, row in zip(range(BATCH_SIZE), rows)]
+            if not batch:
+                return count
+            count += len(batch)
+            documents = [
+                models.SearchDocument(model=_label(model), field=field, object_id=row[0], text=normalize(text))
+                for row in batch for field, text in zip(fields, row[1:])
+            ]
+            models.SearchDocument.objects.bulk_create(documents)
+            if not all(document.pk for document in documents):
+                documents = list(models.SearchDocument.objects.filter(
+                    model=_label(model), object_id__in=[row[0] for row in batch]
+                ))
+            self.store(documents)
+
+
+class MySQLNgramBackend(TrigramBackend):
+    """
+    TrigramBackend on a MySQL FULLTEXT index with the ngram parser over the document text, which
+    takes the place of the trigram rows. ``setup`` creates the index.
+    """
+    index_name = 'searchdocument_text_ngram'
+
+    def is_ready(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SHOW INDEX FROM {models.SearchDocument._meta.db_table} WHERE Key_name = %s', [self.index_name]
+            )
+            return cursor.fetchone() is not None
+
+    def setup(self):
+        if self.is_ready():
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE FULLTEXT INDEX {self.index_name} ON {models.SearchDocument._meta.db_table} '
+                f'(text) WITH PARSER ngram'
+            )
+        _default_backend.cache_clear()
+
+    def store(self, documents):
+        pass
+
+    def clear(self, documents):
+        pass
+
+    def candidates(self, documents, words):
+        # shorter words than the ngram_token_size of 2 are left to the contains lookups
+        phrases = ' '.join(f'+"{word}"' for word in (word.replace('"', '') for word in words) if len(word) > 1)
+        if not phrases:
+            return documents
+        return documents.annotate(
+            relevance=RawSQL('MATCH (text) AGAINST (%s IN BOOLEAN MODE)', [phrases])
+        ).filter(relevance__gt=0)
+
+
+@lru_cache(maxsize=None)
+def _backend(path):
+    return import_string(path)()
+
+
+@lru_cache(maxsize=None)
+def _default_backend(vendor):
+    if vendor == 'mysql' and _backend(MYSQL_BACKEND).is_ready():
+        return _backend(MYSQL_BACKEND)
+    return _backend(TRIGRAM_BACKEND)
+
+
+def get_search_backend():
+    """
+    The backend of the SEARCH_BACKEND setting, by default MySQLNgramBackend on MySQL once
+    ``rebuild_ngram_index --setup`` has created its FULLTEXT index, and TrigramBackend otherwise.
+    """
+    path = getattr(settings, 'SEARCH_BACKEND', None)
+    if path:
+        return _backend(path)
+    return _default_backend(connection.vendor)
+
+
+def search_filter(model, paths, query):
+    """
+    Matches the ``model`` objects with every word of ``query`` in one of the indexed fields ``paths``,
+    through one subquery on the index per model the paths reach.
+    """
+    words = normalize(query).split()
+    if not words:
+        return Q()
+    backend = get_search_backend()
+    lookup = Q()
+    for relation, target, fields in resolve(model, paths):
+        lookup |= Q(**{f'{relation}__in' if relation else 'pk__in': backend.matching(target, fields, words)})
+    return lookup
+
+
+def index_object(obj, created=False):
+    """
+    Indexes the searchable fields of ``obj`` as they are now, once the transaction commits.
+    """
+    model = type(obj)
+    texts = {field: normalize(getattr(obj, field)) for field in SEARCH_FIELDS[model]}
+    transaction.on_commit(partial(get_search_backend().index, model, obj.pk, texts, created))
+
+
+def delete_object(obj):
+    transaction.on_commit(partial(get_search_backend().delete, type(obj), obj.pk))
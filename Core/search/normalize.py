@@ -0,0 +1,35 @@
+import re
+
+# Arabic letters typed by Arabic keyboards and fonts for their Persian counterparts.
+CHARACTERS = {
+    'ي': 'ی', 'ى': 'ی', 'ئ': 'ی',
+    'ك': 'ک',
+    'ة': 'ه', 'ۀ': 'ه',
+    'أ': 'ا', 'إ': 'ا', 'ٱ': 'ا',
+    'ؤ': 'و',
+}
+# Persian and Arabic-Indic digits.
+CHARACTERS.update({chr(0x06F0 + digit): str(digit) for digit in range(10)})
+CHARACTERS.update({chr(0x0660 + digit): str(digit) for digit in range(10)})
+# Zero-width non-joiner and joiner, typed interchangeably with a space.
+CHARACTERS.update({'\u200c': ' ', '\u200d': ' '})
+
+TRANSLATION = str.maketrans(CHARACTERS)
+# Harakat, tanwin, superscript alef and tatweel.
+DIACRITICS = re.compile('[\u064b-\u065f\u0670\u0640]')
+SPACES = re.compile(r'\s+')
+
+
+def normalize(text):
+    """
+    The form names and titles are stored and looked up in: Persian letters, ASCII digits, lower case,
+    no diacritics and single spaces.
+    """
+    if not text:
+        return ''
+    text = DIACRITICS.sub('', text.translate(TRANSLATION)).lower()
+    return SPACES.sub(' ', text).strip()
+
+
+def normalized_column(field):
+    return f'{field}_normalized'
@@ -0,0 +1,265 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_save
+from django.dispatch import receiver
+from mptt.signals import node_moved
+
+from Core import displayNames, models
+from Core.caching import bump_version
+from Core.organTree import ORGAN_TREE_KEY
+from Core.questionGraph.analysis import analyze_clinic
+from Core.questionGraph.bundle import BUNDLE_NAMES_KEY
+from Core.questionGraph.engine import clinic_graph_key
+from Core.representations import representation_changed
+from Core.search import ngrams
+from Core.search.autocomplete import CATALOGS, catalog_key
+from Core.search import index as search_index
+
+
+def _clinic_of_question(question_id):
+    return models.QuestionShare.objects.filter(pk=question_id).values_list('clinic_id', flat=True).first()
+
+
+class _AnalyzeClinic:
+    """
+    on_commit callback of analyze_clinic, equal for the same clinic so a transaction runs it once.
+    """
+
+    def __init__(self, clinic_id):
+        self.clinic_id = clinic_id
+
+    def __eq__(self, other):
+        return isinstance(other, _AnalyzeClinic) and other.clinic_id == self.clinic_id
+
+    def __call__(self):
+        analyze_clinic(self.clinic_id)
+
+
+class _UpdateOptionResults:
+    """
+    on_commit callback of CheckupResult.update_option, equal for the same option.
+    """
+
+    def __init__(self, option_id):
+        self.option_id = option_id
+
+    def __eq__(self, other):
+        return isinstance(other, _UpdateOptionResults) and other.option_id == self.option_id
+
+    def __call__(self):
+        models.CheckupResult.update_option(self.option_id)
+
+
+def _on_commit_once(task):
+    connection = transaction.get_connection()
+    if any(entry[1] == task for entry in connection.run_on_commit):
+        return
+    transaction.on_commit(task)
+
+
+def schedule_clinic_analysis(clinic_id):
+    _on_commit_once(_AnalyzeClinic(clinic_id))
+
+
+def bump_clinic_graph(clinic_id):
+    if clinic_id is not None:
+        bump_version(clinic_graph_key(clinic_id))
+        schedule_clinic_analysis(clinic_id)
+
+
+@receiver([post_save, post_delete], sender=models.QuestionShare)
+@receiver([post_save, post_delete], sender=models.ClinicCheckup)
+def question_graph_changed(sender, instance, **kwargs):
+    bump_clinic_graph(instance.clinic_id)
+
+
+@receiver([post_save, post_delete], sender=models.QuestionOption)
+@receiver([post_save, post_delete], sender=models.QuestionOrgan)
+@receiver([post_save, post_delete], sender=models.QuestionShareMedia)
+def question_option_changed(sender, instance, **kwargs):
+    bump_clinic_graph(_clinic_of_question(instance.questionShare_id))
+
+
+@receiver([post_save, post_delete], sender=models.QuestionOptionNumber)
+@receiver([post_save, post_delete], sender=models.QuestionOptionDate)
+@receiver([post_save, post_delete], sender=models.QuestionOptionEquation)
+def question_option_band_changed(sender, instance, **kwargs):
+    clinic_id = models.QuestionOption.objects.filter(
+        pk=instance.questionOption_id
+    ).values_list('questionShare__clinic_id', flat=True).first()
+    bump_clinic_graph(clinic_id)
+
+
+@receiver([post_save, post_delete, node_moved], sender=models.Organ)
+def organ_tree_changed(sender, **kwargs):
+    bump_version(ORGAN_TREE_KEY)
+
+
+DISPLAY_NAME_KINDS = {
+    models.Doctor: 'doctor',
+    models.PatientProfile: 'patient',
+    models.Supervisor: 'supervisor',
+    models.Clinic: 'clinic',
+    models.ClinicGroup: 'clinicGroup',
+}
+
+
+# User fields the display names are made of, and those representations render as well.
+USER_NAME_FIELDS = {'first_name', 'last_name'}
+USER_REPRESENTED_FIELDS = USER_NAME_FIELDS | {'picture'}
+
+
+def _touches(update_fields, fields):
+    """
+    Whether a save with ``update_fields`` may have changed any of ``fields``.
+    """
+    return update_fields is None or not fields.isdisjoint(update_fields)
+
+
+@receiver([post_save, post_delete], sender=models.User)
+def user_display_name_changed(sender, instance, update_fields=None, **kwargs):
+    if _touches(update_fields, USER_NAME_FIELDS):
+        displayNames.invalidate_user(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=models.Doctor)
+@receiver([post_save, post_delete], sender=models.PatientProfile)
+@receiver([post_save, post_delete], sender=models.Supervisor)
+@receiver([post_save, post_delete], sender=models.Clinic)
+@receiver([post_save, post_delete], sender=models.ClinicGroup)
+def display_name_changed(sender, instance, **kwargs):
+    displayNames.invalidate(DISPLAY_NAME_KINDS[sender], [instance.pk])
+
+
+@receiver([post_save, post_delete], sender=models.User)
+@receiver([post_save, post_delete], sender=models.Doctor)
+@receiver([post_save, post_delete], sender=models.ClinicGroup)
+@receiver([post_save, post_delete], sender=models.Clinic)
+@receiver([post_save, post_delete], sender=models.ClinicCheckup)
+@receiver([post_save, post_delete], sender=models.QuestionShare)
+@receiver([post_save, post_delete], sender=models.RealClinic)
+@receiver([post_save, post_delete], sender=models.RealDoctor)
+def cached_representation_changed(sender, instance, update_fields=None, **kwargs):
+    if sender is models.User and not _touches(update_fields, USER_REPRESENTED_FIELDS):
+        return
+    representation_changed(instance)
+
+
+# model: (kind of its search documents, fields they are made of)
+SEARCH_DOCUMENT_FIELDS = {
+    models.Doctor: ('doctor', {'user', 'user_id', 'specialyTitle'}),
+    models.Clinic: ('clinic', {'title'}),
+}
+
+
+def _search_document_changed(kind, document_id):
+    transaction.on_commit(partial(search_index.document_changed, kind, document_id))
+
+
+@receiver([post_save, post_delete], sender=models.Doctor)
+@receiver([post_save, post_delete], sender=models.Clinic)
+def search_document_changed(sender, instance, update_fields=None, **kwargs):
+    kind, fields = SEARCH_DOCUMENT_FIELDS[sender]
+    if update_fields is None or fields & set(update_fields):
+        _search_document_changed(kind, instance.pk)
+
+
+@receiver([post_save, post_delete], sender=models.User)
+def doctor_name_changed(sender, instance, update_fields=None, **kwargs):
+    if not _touches(update_fields, USER_NAME_FIELDS):
+        return
+    doctor_id = models.Doctor.objects.filter(user_id=instance.pk).values_list('id', flat=True).first()
+    if doctor_id is not None:
+        _search_document_changed('doctor', doctor_id)
+        bump_version(BUNDLE_NAMES_KEY)
+
+
+@receiver([post_save, post_delete], sender=models.Alert)
+@receiver([post_save, post_delete], sender=models.Doctor)
+@receiver([post_save, post_delete], sender=models.Clinic)
+@receiver([post_save, post_delete], sender=models.Organ)
+@receiver([post_save, post_delete], sender=models.Media)
+def bundle_names_changed(sender, **kwargs):
+    bump_version(BUNDLE_NAMES_KEY)
+
+
+CATALOG_OF_MODEL = {model: catalog for catalog, model in CATALOGS.items()}
+
+
+@receiver([post_save, post_delete], sender=models.Drug)
+@receiver([post_save, post_delete], sender=models.Illness)
+@receiver([post_save, post_delete], sender=models.Job)
+@receiver([post_save, post_delete], sender=models.DrugAmount)
+@receiver([post_save, post_delete], sender=models.DrugInstruction)
+def catalog_changed(sender, **kwargs):
+    bump_version(catalog_key(CATALOG_OF_MODEL[sender]))
+
+
+@receiver(post_save)
+def ngram_document_saved(sender, instance, created, **kwargs):
+    if sender in ngrams.SEARCH_FIELDS:
+        ngrams.index_object(instance, created)
+
+
+@receiver(post_delete)
+def ngram_document_deleted(sender, instance, **kwargs):
+    if sender in ngrams.SEARCH_FIELDS:
+        ngrams.delete_object(instance)
+
+
+_checkup_results_suspended = ContextVar('checkup_results_suspended', default=False)
+
+
+@contextmanager
+def checkup_results_suspended():
+    """
+    Skips per-answer CheckupResult updates for batch writes that rebuild the result once at the end.
+    """
+    token = _checkup_results_suspended.set(True)
+    try:
+        yield
+    finally:
+        _checkup_results_suspended.reset(token)
+
+
+@receiver(post_save, sender=models.QuestionAnswer)
+def question_answer_saved(sender, instance, **kwargs):
+    if _checkup_results_suspended.get():
+        return
+    models.CheckupResult.update_answers(instance.checkup_id, changed=[(instance.id, instance.questionOption_id)])
+
+
+@receiver(post_delete, sender=models.QuestionAnswer)
+def question_answer_deleted(sender, instance, **kwargs):
+    if _checkup_results_suspended.get():
+        return
+    models.CheckupResult.update_answers(instance.checkup_id, removed=[instance.id], create=False)
+
+
+_RESULT_OPTION_FIELDS = {
+    name for field in models.CheckupResult.OPTION_FIELDS
+    for name in (field, models.QuestionOption._meta.get_field(field).name)
+}
+
+
+@receiver(pre_save, sender=models.QuestionOption)
+def question_option_result_saving(sender, instance, update_fields=None, **kwargs):
+    """
+    Notes whether the save changes what the option contributes to the results of its answers.
+    """
+    instance._result_changed = False
+    if instance.pk is None or (update_fields is not None and not _RESULT_OPTION_FIELDS & set(update_fields)):
+        return
+    stored = sender.objects.filter(pk=instance.pk).values_list(*models.CheckupResult.OPTION_FIELDS).first()
+    instance._result_changed = stored is not None and list(stored) != [
+        getattr(instance, field) for field in models.CheckupResult.OPTION_FIELDS
+    ]
+
+
+@receiver(post_save, sender=models.QuestionOption)
+def question_option_result_changed(sender, instance, created, **kwargs):
+    if not created and getattr(instance, '_result_changed', False):
+        _on_commit_once(_UpdateOptionResults(instance.pk))
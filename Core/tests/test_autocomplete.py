@@ -0,0 +1,56 @@
+from django.core.cache import cache
+from django.urls import reverse
+from rest_framework.test import APIClient
+from Core import models
+from Core.search.autocomplete import TOP_K, CatalogTrie, get_catalog_trie
+import pytest
+
+
+def test_complete():
+    trie = CatalogTrie([
+        (1, 'ديابت نوع 2'),
+        (2, 'دیابت'),
+        (3, 'فشار خون'),
+        (4, 'کم خونی'),
+        (5, 'دیسک کمر'),
+    ])
+    # the title start before a later word, then shorter titles
+    assert trie.complete('دی') == [(2, 'دیابت'), (5, 'دیسک کمر'), (1, 'ديابت نوع 2')]
+    assert trie.complete('ديابت ن') == [(1, 'ديابت نوع 2')]
+    assert trie.complete('نوع') == [(1, 'ديابت نوع 2')]
+    assert trie.complete('خون') == [(4, 'کم خونی'), (3, 'فشار خون')]
+    assert trie.complete('خونی') == [(4, 'کم خونی')]
+    assert trie.complete('دی', limit=1) == [(2, 'دیابت')]
+    assert trie.complete('دیابتی') == []
+    assert trie.complete('') == []
+
+
+def test_top_k():
+    trie = CatalogTrie([(i, f'قرص {i:02}') for i in range(TOP_K * 2)])
+    assert trie.complete('قرص') == [(i, f'قرص {i:02}') for i in range(TOP_K)]
+    assert trie.complete('قرص 1') == [(i, f'قرص {i:02}') for i in range(10, 10 + TOP_K)]
+
+
+@pytest.mark.django_db
+class TestAutocompleteEndpoint:
+    def complete(self, **params):
+        return APIClient().get(reverse('autocomplete'), params)
+
+    def test_endpoint(self, django_assert_num_queries):
+        cache.clear()
+        drug = models.Drug.objects.create(title='استامینوفن')
+        models.Drug.objects.create(title='آسپرین')
+        models.Job.objects.create(title='استاد دانشگاه')
+        assert self.complete(catalog='drug', q='است').json() == {'resp': [{'id': drug.id, 'title': 'استامینوفن'}]}
+        with django_assert_num_queries(0):
+            self.complete(catalog='drug', q='آس')
+        drug.title = 'ایبوپروفن'
+        drug.save()
+        assert self.complete(catalog='drug', q='است').json() == {'resp': []}
+        assert self.complete(catalog='job', q='است').json()['resp'][0]['title'] == 'استاد دانشگاه'
+        assert get_catalog_trie('drug').complete('ای') == [(drug.id, 'ایبوپروفن')]
+
+    def test_unknown_catalog(self):
+        response = self.complete(catalog='organ', q='قلب')
+        assert response.status_code == 400
+        assert response.json() == {'catalog': 'Unknown catalog: organ'}
@@ -0,0 +1,149 @@
+from django.core.cache import cache
+from django.urls import reverse
+from rest_framework.test import APIClient
+from Core import models
+import pytest
+
+
+@pytest.mark.django_db
+class TestCheckupResult:
+    @pytest.fixture
+    def setup(self):
+        self.user = models.User.objects.create_user(phone_number="09355555555")
+        self.doctor = models.Doctor.objects.create(user=self.user, specialyTitle='دکتر قلب')
+        clinic_group = models.ClinicGroup.objects.create(title='بیمارستان رجایی')
+        self.clinic = models.Clinic.objects.create(clinicGroup=clinic_group, agent=self.doctor, title='کلینیک دیابت')
+        self.alert = models.Alert.objects.create(clinic=self.clinic, title='قند بالا', description='مراجعه کنید',
+                                                 reminder_number=1)
+        self.q1 = models.QuestionShare.objects.create(doctor=self.doctor, clinic=self.clinic, title='سوال اول')
+        self.q2 = models.QuestionShare.objects.create(doctor=self.doctor, clinic=self.clinic, title='سوال دوم')
+        self.yes = models.QuestionOption.objects.create(questionShare=self.q1, title='بله', interpretation='پرخطر',
+                                                        alert=self.alert, suggestedDoctor=self.doctor,
+                                                        chart_connectQstId=self.q2)
+        self.no = models.QuestionOption.objects.create(questionShare=self.q1, title='خیر', interpretation='کم خطر')
+        self.other = models.QuestionOption.objects.create(questionShare=self.q2, title='گاهی',
+                                                          suggestedClinic=self.clinic)
+        clinic_checkup = models.ClinicCheckup.objects.create(
+            clinic=self.clinic, title='چکاپ دیابت', required_time=5, question_count=2, starting_question=self.q1
+        )
+        patient = models.PatientProfile.objects.create(user=self.user)
+        self.checkup = models.Checkup.objects.create(patientProfile=patient, clinic=self.clinic,
+                                                     clinic_checkup=clinic_checkup)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def result(self):
+        return models.CheckupResult.objects.get(checkup=self.checkup)
+
+    def test_materialized_incrementally(self, setup, django_capture_on_commit_callbacks):
+        answer = models.QuestionAnswer.objects.create(checkup=self.checkup, questionShare=self.q1,
+                                                      questionOption=self.yes)
+        other = models.QuestionAnswer.objects.create(checkup=self.checkup, questionShare=self.q2,
+                                                     questionOption=self.other)
+        result = self.result()
+        assert result.interpretations == ['پرخطر']
+        assert result.alerts == [self.alert.id]
+        assert result.suggestedDoctors == [self.doctor.id]
+        assert result.suggestedClinics == [self.clinic.id]
+
+        answer.questionOption = self.no
+        answer.save()
+        result = self.result()
+        assert result.interpretations == ['کم خطر']
+        assert result.alerts == []
+
+        other.delete()
+        assert self.result().suggestedClinics == []
+
+        with django_capture_on_commit_callbacks(execute=True):
+            self.no.interpretation = 'بدون خطر'
+            self.no.save()
+        assert self.result().interpretations == ['بدون خطر']
+
+    def test_answers_given_before_the_result(self, setup):
+        models.QuestionAnswer.objects.create(checkup=self.checkup, questionShare=self.q1, questionOption=self.yes)
+        models.CheckupResult.objects.all().delete()
+        models.QuestionAnswer.objects.create(checkup=self.checkup, questionShare=self.q2, questionOption=self.other)
+        result = self.result()
+        assert result.interpretations == ['پرخطر']
+        assert result.suggestedClinics == [self.clinic.id]
+        assert len(result.answers) == 2
+
+    def test_option_saves(self, setup, django_capture_on_commit_callbacks, django_assert_max_num_queries):
+        checkups = [self.checkup] + [
+            models.Checkup.objects.create(patientProfile=self.checkup.patientProfile, clinic=self.clinic,
+                                          clinic_checkup=self.checkup.clinic_checkup)
+            for _ in range(5)
+        ]
+        for checkup in checkups:
+            models.QuestionAnswer.objects.create(checkup=checkup, questionShare=self.q1, questionOption=self.yes)
+        # fields the results do not use leave them alone
+        with django_capture_on_commit_callbacks(execute=True) as callbacks:
+            self.yes.title = 'آری'
+            self.yes.save()
+            self.yes.save(update_fields=['title'])
+        assert callbacks == []
+        # the others rewrite every result in one pass once the transaction commits
+        with django_capture_on_commit_callbacks(execute=True) as callbacks:
+            self.yes.interpretation = 'خطر متوسط'
+            self.yes.save()
+            self.yes.alert = None
+            self.yes.save(update_fields=['alert'])
+        assert len(callbacks) == 1
+        with django_assert_max_num_queries(8):
+            callbacks[0]()
+        for checkup in checkups:
+            result = models.CheckupResult.objects.get(checkup=checkup)
+            assert result.interpretations == ['خطر متوسط'] and result.alerts == []
+
+    def test_endpoint(self, setup, django_assert_max_num_queries):
+        models.QuestionAnswer.objects.create(checkup=self.checkup, questionShare=self.q1, questionOption=self.yes)
+        models.QuestionAnswer.objects.create(checkup=self.checkup, questionShare=self.q2, questionOption=self.other)
+        url = reverse('checkup_result')
+        cache.clear()
+        with django_assert_max_num_queries(6):
+            self.client.get(url, {'q': self.checkup.id})
+        # doctor and clinic group names come from the display name cache once warm
+        with django_assert_max_num_queries(4):
+            response = self.client.get(url, {'q': self.checkup.id})
+        results = response.json()['resp']
+        assert results['interpretations'] == ['پرخطر']
+        assert [alert['id'] for alert in results['alerts']] == [self.alert.id]
+        assert [doctor['id'] for doctor in results['suggestedDoctors']] == [self.doctor.id]
+        assert [clinic['id'] for clinic in results['suggestedClinics']] == [self.clinic.id]
+
+    def test_endpoint_rebuilds_missing_result(self, setup):
+        models.QuestionAnswer.objects.create(checkup=self.checkup, questionShare=self.q1, questionOption=self.no)
+        models.CheckupResult.objects.all().delete()
+        response = self.client.get(reverse('checkup_result'), {'q': self.checkup.id})
+        assert response.json()['resp']['interpretations'] == ['کم خطر']
+
+    def test_bulk_answers(self, setup, django_assert_max_num_queries):
+        models.QuestionAnswer.objects.create(checkup=self.checkup, questionShare=self.q1, questionOption=self.no)
+        url = reverse('checkups-answers', kwargs={'pk': self.checkup.id})
+        data = {'answers': [
+            {'questionShare': self.q1.id, 'questionOption': self.yes.id},
+            {'questionShare': self.q2.id, 'questionOption': self.other.id},
+        ]}
+        with django_assert_max_num_queries(25):
+            response = self.client.post(url, data, format='json')
+        assert response.status_code == 201
+        assert response.json()['result']['interpretations'] == ['پرخطر']
+        assert models.QuestionAnswer.objects.filter(checkup=self.checkup).count() == 2
+        assert self.result().suggestedClinics == [self.clinic.id]
+
+    def test_bulk_answers_validated_against_graph(self, setup):
+        url = reverse('checkups-answers', kwargs={'pk': self.checkup.id})
+        data = {'answers': [
+            {'questionShare': self.q1.id, 'questionOption': self.other.id},
+            {'questionShare': self.q1.id, 'questionOption': self.yes.id},
+            {'questionShare': self.q1.id, 'questionOption': self.yes.id},
+            {'questionShare': self.q1.id},
+        ]}
+        response = self.client.post(url, data, format='json')
+        assert response.status_code == 400
+        assert set(response.json()['answers']) == {'3'}
+        data['answers'].pop()
+        response = self.client.post(url, data, format='json')
+        assert set(response.json()['answers']) == {'0', '2'}
+        assert not models.QuestionAnswer.objects.filter(checkup=self.checkup).exists()
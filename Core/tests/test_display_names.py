@@ -0,0 +1,58 @@
+from django.core.cache import cache
+from django.urls import reverse
+from rest_framework.test import APIClient
+from Core import models
+from Core.displayNames import resolve
+import pytest
+
+
+@pytest.mark.django_db
+class TestDisplayNames:
+    @pytest.fixture
+    def setup(self):
+        cache.clear()
+        self.clinic_group = models.ClinicGroup.objects.create(title='بیمارستان رجایی')
+        self.client = APIClient()
+
+    def clinic(self, i):
+        user = models.User.objects.create_user(phone_number=f"0935555555{i}", first_name='دکتر', last_name=str(i))
+        doctor = models.Doctor.objects.create(user=user, specialyTitle='دکتر قلب')
+        return models.Clinic.objects.create(clinicGroup=self.clinic_group, agent=doctor, title=f'کلینیک {i}')
+
+    def test_batched_lookup(self, setup, django_assert_num_queries):
+        clinics = [self.clinic(i) for i in range(3)]
+        keys = [('clinic', clinic.id) for clinic in clinics] + [('doctor', clinic.agent_id) for clinic in clinics]
+        with django_assert_num_queries(2):
+            names = resolve(keys + [('clinicGroup', None)])
+        assert names[('doctor', clinics[1].agent_id)] == 'دکتر 1'
+        assert names[('clinic', clinics[2].id)] == 'کلینیک 2'
+        with django_assert_num_queries(0):
+            assert resolve(keys) == names
+        assert resolve([('clinic', 0)]) == {('clinic', 0): ''}
+
+    def test_login_saves_invalidate_nothing(self, setup, django_assert_num_queries):
+        user = self.clinic(0).agent.user
+        with django_assert_num_queries(1):
+            user.save(update_fields=['last_login'])
+
+    def test_invalidated_on_rename(self, setup):
+        clinic = self.clinic(0)
+        assert resolve([('doctor', clinic.agent_id)])[('doctor', clinic.agent_id)] == 'دکتر 0'
+        user = clinic.agent.user
+        user.last_name = 'رضایی'
+        user.save()
+        assert resolve([('doctor', clinic.agent_id)])[('doctor', clinic.agent_id)] == 'دکتر رضایی'
+        self.clinic_group.title = 'بیمارستان مسیح'
+        self.clinic_group.save()
+        response = self.client.get(reverse('clinics-list'))
+        assert response.json()['results'][0]['clinicGroupName'] == 'بیمارستان مسیح'
+        assert response.json()['results'][0]['agentName'] == 'دکتر رضایی'
+
+    def test_list_resolves_names_once(self, setup, django_assert_max_num_queries):
+        for i in range(5):
+            self.clinic(i)
+        url = reverse('clinics-list')
+        self.client.get(url)
+        with django_assert_max_num_queries(2):
+            response = self.client.get(url)
+        assert [clinic['agentName'] for clinic in response.json()['results']] == [f'دکتر {i}' for i in reversed(range(5))]
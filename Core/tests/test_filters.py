@@ -0,0 +1,68 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+from Core import models
+from Core.api.filters import relation_filter
+import pytest
+
+
+def test_relation_filter():
+    query = str(models.QuestionShare.objects.filter(
+        relation_filter(models.QuestionShare, 'questionOrgans_questionShare__organ__name__in', ['قلب'])
+    ).query)
+    assert 'EXISTS' in query and 'JOIN "Core_organ"' in query
+    query = str(models.Clinic.objects.filter(
+        relation_filter(models.Clinic, 'questionShares_clinic__questionOrgans_questionShare__organ__name__in', ['قلب'])
+    ).query)
+    assert query.count('EXISTS') == 2
+    # single-valued relations stay joins
+    query = str(models.ClinicMedia.objects.filter(
+        relation_filter(models.ClinicMedia, 'clinic__agent__id__exact', 1)
+    ).query)
+    assert 'EXISTS' not in query and 'JOIN "Core_clinic"' in query
+
+
+@pytest.mark.django_db
+class TestRelationFilters:
+    @pytest.fixture
+    def setup(self):
+        self.user = models.User.objects.create_user(phone_number="09355555555")
+        doctor = models.Doctor.objects.create(user=self.user)
+        clinic_group = models.ClinicGroup.objects.create(title='بیمارستان رجایی')
+        self.clinic = models.Clinic.objects.create(clinicGroup=clinic_group, agent=doctor, title='کلینیک قلب')
+        models.Clinic.objects.create(clinicGroup=clinic_group, agent=doctor, title='کلینیک ریه')
+        heart = models.Organ.objects.create(name='قلب')
+        valve = models.Organ.objects.create(name='دریچه', parent=heart)
+        lung = models.Organ.objects.create(name='ریه')
+        for i, organs in enumerate([[heart, valve], [heart], [lung]]):
+            question = models.QuestionShare.objects.create(doctor=doctor, clinic=self.clinic, title=f'سوال {i}')
+            for organ in organs:
+                models.QuestionOrgan.objects.create(organ=organ, questionShare=question)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def get(self, url_name, params):
+        """
+        Results of the list request and the EXPLAIN QUERY PLAN of its page query.
+        """
+        with CaptureQueriesContext(connection) as queries:
+            results = self.client.get(reverse(url_name), params).json()['results']
+        page = next(query['sql'] for query in queries if 'EXISTS' in query['sql'] and 'COUNT' not in query['sql'])
+        assert 'DISTINCT' not in page
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {page}')
+            plan = ' '.join(str(row[-1]) for row in cursor.fetchall())
+        return results, plan
+
+    @pytest.mark.parametrize('url_name', ['questionShares-list', 'compressedQuestionShares-list'])
+    def test_question_organs(self, setup, url_name):
+        results, plan = self.get(url_name, {'organs': 'قلب دریچه', 'clinic': self.clinic.id})
+        # the question with both organs is listed once
+        assert [question['title'] for question in results] == ['سوال 1', 'سوال 0']
+        assert 'TEMP B-TREE' not in plan and 'CORRELATED SCALAR SUBQUERY' in plan
+
+    def test_clinic_organs(self, setup):
+        results, plan = self.get('clinics-list', {'organsClinic': 'قلب ریه'})
+        assert [clinic['title'] for clinic in results] == ['کلینیک قلب']
+        assert 'TEMP B-TREE' not in plan and 'CORRELATED SCALAR SUBQUERY' in plan
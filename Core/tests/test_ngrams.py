@@ -0,0 +1,96 @@
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+from Core import models
+from Core.search.ngrams import MySQLNgramBackend, SEARCH_FIELDS, TrigramBackend, _default_backend, trigrams
+import pytest
+
+
+def test_trigrams():
+    assert trigrams('قلب') == {'قلب'}
+    assert trigrams('abcab') == {'abc', 'bca', 'cab'}
+    assert trigrams('ab') == set()
+
+
+def test_registered_by_the_viewsets():
+    assert SEARCH_FIELDS[models.Clinic] == ('title',)
+    assert SEARCH_FIELDS[models.ClinicGroup] == ('title',)
+    assert SEARCH_FIELDS[models.RealDoctor] == ('name', 'specialyTitle', 'description', 'address')
+
+
+@pytest.mark.django_db
+class TestNgramSearch:
+    @pytest.fixture
+    def client(self):
+        return APIClient()
+
+    def jobs(self, client, q):
+        return [job['title'] for job in client.get(reverse('job-list'), {'q': q}).json()['results']]
+
+    def test_q(self, client, django_capture_on_commit_callbacks):
+        with django_capture_on_commit_callbacks(execute=True):
+            models.Job.objects.create(title='مهندس نرم افزار')
+            models.Job.objects.create(title='معلم ریاضي')
+        assert self.jobs(client, 'افزار') == ['مهندس نرم افزار']
+        assert self.jobs(client, 'ریاضی') == ['معلم ریاضي']
+        # every word, in any order, words too short for a trigram included
+        assert self.jobs(client, 'افزار مهندس') == ['مهندس نرم افزار']
+        assert self.jobs(client, 'نرم ریاضی') == []
+        assert self.jobs(client, 'م') == ['معلم ریاضي', 'مهندس نرم افزار']
+        assert self.jobs(client, 'مهندسی') == []
+
+    def test_kept_up_to_date(self, client, django_capture_on_commit_callbacks):
+        with django_capture_on_commit_callbacks(execute=True):
+            job = models.Job.objects.create(title='مهندس')
+        with django_capture_on_commit_callbacks(execute=True):
+            job.title = 'پزشک'
+            job.save()
+        assert self.jobs(client, 'مهندس') == []
+        assert self.jobs(client, 'پزشک') == ['پزشک']
+        assert set(models.SearchTrigram.objects.values_list('trigram', flat=True)) == {'پزش', 'زشک'}
+        with django_capture_on_commit_callbacks(execute=True):
+            job.delete()
+        assert not models.SearchDocument.objects.exists()
+        assert not models.SearchTrigram.objects.exists()
+
+    def test_related_fields(self, client, django_capture_on_commit_callbacks):
+        with django_capture_on_commit_callbacks(execute=True):
+            user = models.User.objects.create_user(phone_number='09355555550')
+            doctor = models.Doctor.objects.create(user=user)
+            group = models.ClinicGroup.objects.create(title='بیمارستان رجایی')
+            models.Clinic.objects.create(clinicGroup=group, agent=doctor, title='کلینیک قلب')
+            models.Clinic.objects.create(
+                clinicGroup=models.ClinicGroup.objects.create(title='بیمارستان مسیح'), agent=doctor, title='کلینیک ریه'
+            )
+        url = reverse('clinics-list')
+        with CaptureQueriesContext(connection) as queries:
+            clinics = client.get(url, {'q': 'رجایی'}).json()['results']
+        assert [clinic['title'] for clinic in clinics] == ['کلینیک قلب']
+        # the search is subqueries on the index within the page query, without a DISTINCT
+        query = next(query['sql'] for query in queries if 'Core_searchtrigram' in query['sql'])
+        assert 'Core_clinic' in query and 'DISTINCT' not in query
+        assert [clinic['title'] for clinic in client.get(url, {'q': 'کلینیک'}).json()['results']] == [
+            'کلینیک ریه', 'کلینیک قلب'
+        ]
+
+    def test_rebuild_command(self, client, capsys):
+        models.Job.objects.create(title='مهندس')
+        assert self.jobs(client, 'مهندس') == []
+        call_command('rebuild_ngram_index')
+        assert 'Rebuilt the n-gram index' in capsys.readouterr().out
+        assert self.jobs(client, 'مهندس') == ['مهندس']
+        models.Job.objects.create(title='پزشک')
+        call_command('rebuild_ngram_index', '--if-empty')
+        assert 'not rebuilt' in capsys.readouterr().out
+        assert self.jobs(client, 'پزشک') == []
+
+    def test_mysql_falls_back_until_set_up(self, monkeypatch):
+        monkeypatch.setattr(MySQLNgramBackend, 'is_ready', lambda self: False)
+        _default_backend.cache_clear()
+        assert type(_default_backend('mysql')) is TrigramBackend
+        monkeypatch.setattr(MySQLNgramBackend, 'is_ready', lambda self: True)
+        _default_backend.cache_clear()
+        assert type(_default_backend('mysql')) is MySQLNgramBackend
+        _default_backend.cache_clear()
@@ -0,0 +1,63 @@
+from django.core.management import call_command
+from django.urls import reverse
+from rest_framework.test import APIClient
+from Core import models
+from Core.search.normalize import normalize
+import pytest
+
+
+def test_normalize():
+    assert normalize(' علي  كريمي‌زاده ') == 'علی کریمی زاده'
+    assert normalize('مُحَمَّد') == 'محمد'
+    assert normalize('۰۹۱۲ ٤٥') == '0912 45'
+    assert normalize('Dr. ALI') == 'dr. ali'
+    assert normalize(None) == ''
+
+
+@pytest.mark.django_db
+class TestNormalizedColumns:
+    def test_kept_in_step(self):
+        illness = models.Illness.objects.create(title='ديابت')
+        assert illness.title_normalized == 'دیابت'
+        illness.title = 'فشار خون بالا'
+        illness.save(update_fields=['title'])
+        illness.refresh_from_db()
+        assert illness.title_normalized == 'فشار خون بالا'
+
+    def test_q_filters(self):
+        client = APIClient()
+        models.Illness.objects.create(title='ديابت نوع يك')
+        models.Illness.objects.create(title='کم خونی')
+        user = models.User.objects.create_user(phone_number='09355555550', first_name='علی', last_name='كريمي')
+        models.Doctor.objects.create(user=user, specialyTitle='قلب')
+
+        def titles(q):
+            return [illness['title'] for illness in client.get(reverse('illness-list'), {'q': q}).json()['results']]
+
+        # Persian letters find the Arabic ones and the other way around, by prefix or by whole word
+        assert titles('دیابت') == ['ديابت نوع يك']
+        assert titles('دیابت نوع یک') == ['ديابت نوع يك']
+        assert titles('خون') == []
+        assert titles('كم خوني') == ['کم خونی']
+        assert titles('کم') == ['کم خونی']
+
+        def doctors(q):
+            return [doctor['user'] for doctor in client.get(reverse('doctors-list'), {'q': q}).json()['results']]
+
+        assert doctors('علی کریمی') == [user.id]
+        assert doctors('۰۹۳۵۵۵۵۵۵۵۰') == [user.id]
+        assert doctors('رضا') == []
+
+    def test_backfill_command(self, capsys):
+        illness = models.Illness.objects.create(title='ديابت')
+        models.Illness.objects.filter(pk=illness.pk).update(title_normalized='')
+        call_command('normalize_search_columns')
+        assert 'Normalized search columns' in capsys.readouterr().out
+        illness.refresh_from_db()
+        assert illness.title_normalized == 'دیابت'
+        models.Illness.objects.create(title='فشار خون')
+        models.Illness.objects.filter(pk=illness.pk).update(title_normalized='')
+        call_command('normalize_search_columns', '--missing')
+        assert 'drugs: 0\nillnesss: 1' in capsys.readouterr().out
+        illness.refresh_from_db()
+        assert illness.title_normalized == 'دیابت'
@@ -0,0 +1,46 @@
+from django.urls import reverse
+from rest_framework.test import APIClient
+from Core import models
+from Core.organTree import get_organ_tree
+import pytest
+
+
+@pytest.mark.django_db
+class TestOrganTree:
+    @pytest.fixture
+    def setup(self):
+        self.heart = models.Organ.objects.create(name='قلب')
+        self.valve = models.Organ.objects.create(name='دریچه', parent=self.heart)
+        self.mitral = models.Organ.objects.create(name='میترال', parent=self.valve)
+        self.artery = models.Organ.objects.create(name='رگ', parent=self.heart)
+        self.lung = models.Organ.objects.create(name='ریه')
+        self.client = APIClient()
+
+    def names(self, nodes):
+        return [(node['name'], self.names(node['children'])) for node in nodes]
+
+    def test_whole_tree(self, setup, django_assert_num_queries):
+        get_organ_tree()
+        with django_assert_num_queries(0):
+            response = self.client.get(reverse('organs-tree'))
+        assert self.names(response.json()) == [
+            ('ریه', []),
+            ('قلب', [('دریچه', [('میترال', [])]), ('رگ', [])]),
+        ]
+
+    def test_subtree_and_ancestors(self, setup):
+        response = self.client.get(reverse('organs-tree'), {'root': self.valve.id})
+        assert self.names([response.json()]) == [('دریچه', [('میترال', [])])]
+        response = self.client.get(reverse('organs-ancestors', kwargs={'pk': self.mitral.id}))
+        assert [node['id'] for node in response.json()] == [self.heart.id, self.valve.id, self.mitral.id]
+        assert get_organ_tree().descendant_ids(self.heart.id) == [self.heart.id, self.valve.id, self.mitral.id,
+                                                                   self.artery.id]
+        assert self.client.get(reverse('organs-tree'), {'root': 0}).status_code == 404
+
+    def test_invalidated_on_write(self, setup):
+        tree = get_organ_tree()
+        models.Organ.objects.create(name='آئورت', parent=self.artery)
+        assert get_organ_tree() is not tree
+        assert len(get_organ_tree()) == 6
+        self.mitral.delete()
+        assert self.mitral.id not in get_organ_tree()
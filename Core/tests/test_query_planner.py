@@ -0,0 +1,266 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import permissions
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework.request import Request
+from Core import models
+from Core.api import serializer, views
+from Core.api.planner import plan_serializer, QueryPlanMixin
+from Core.api.urls import router
+import pytest
+
+
+@pytest.mark.django_db
+class TestQueryPlanner:
+    @pytest.fixture
+    def setup(self):
+        self.clinic_group = models.ClinicGroup.objects.create(title='بیمارستان رجایی')
+        self.client = APIClient()
+
+    def clinic(self, i):
+        user = models.User.objects.create_user(phone_number=f"0935555555{i}", first_name='دکتر', last_name=str(i))
+        doctor = models.Doctor.objects.create(user=user, specialyTitle='دکتر قلب')
+        return models.Clinic.objects.create(clinicGroup=self.clinic_group, agent=doctor, title=f'کلینیک {i}')
+
+    def test_paths_read_from_method_fields(self):
+        plan = plan_serializer(serializer.CheckupSerializer())
+        assert plan.select == {'clinic', 'clinic_checkup'}
+        plan = plan_serializer(serializer.PatientProfileSerializer())
+        assert plan.select == {'supervisor_patient__user', 'supervisor_patient__relativeType'}
+
+    def test_nested_serializers_prefetched(self):
+        plan = plan_serializer(serializer.QuestionShareSerializer())
+        assert plan.select == {'doctor__user', 'clinic'}
+        options = plan.prefetch['questionOptions_questionShare']
+        assert options.select == {'alert', 'suggestedClinic', 'suggestedDoctor__user'}
+        assert set(options.prefetch) == {'questionOptionDates', 'questionOptionEquations', 'questionOptionNumbers'}
+        assert plan.prefetch['QuestionShareMedia_questionShares'].select == {'media'}
+
+    def test_page_query_count_constant(self, setup):
+        url = reverse('clinics-list')
+        self.clinic(0)
+        cache.clear()
+        with CaptureQueriesContext(connection) as single:
+            self.client.get(url)
+        for i in range(1, 6):
+            self.clinic(i)
+        cache.clear()
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get(url)
+        assert len(response.json()['results']) == 6
+        assert len(many) == len(single)
+
+    def test_every_plan_is_valid(self, setup):
+        request = Request(APIRequestFactory().get('/'))
+        for prefix, viewset, basename in router.registry:
+            if not issubclass(viewset, QueryPlanMixin):
+                continue
+            view = viewset(request=request, format_kwarg=None, action='list', kwargs={})
+            list(view.get_queryset()[:1])
+
+
+@pytest.mark.django_db
+class TestPatientProfileSupervisor:
+    @pytest.fixture
+    def setup(self):
+        cache.clear()
+        self.relative_type = models.RelativeType.objects.create(title='پدر')
+        self.profiles = []
+        for i in range(6):
+            user = models.User.objects.create_user(phone_number=f"0935555555{i}", first_name='بیمار', last_name=str(i))
+            self.profiles.append(models.PatientProfile.objects.create(user=user))
+        self.supervisor_user = models.User.objects.create_user(phone_number="09124444444", first_name='مراقب')
+        for profile in self.profiles[::2]:
+            models.Supervisor.objects.create(user=self.supervisor_user, relativeType=self.relative_type,
+                                             patient=profile)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.supervisor_user)
+
+    def test_page_in_one_joined_query(self, setup, django_assert_num_queries):
+        # count, page joined with supervisor, user and relative type, patient names
+        with django_assert_num_queries(3):
+            response = self.client.get(reverse('patientProfiles-list'))
+        results = {result['id']: result for result in response.json()['results']}
+        supervised, alone = results[self.profiles[0].id], results[self.profiles[1].id]
+        assert supervised['supervisor'] == self.supervisor_user.id
+        assert supervised['supervisor_full_name'] == 'مراقب'
+        assert supervised['supervisor_relativeType'] == 'پدر'
+        assert (alone['supervisor'], alone['supervisor_full_name'], alone['supervisor_relativeType']) == ('', '', '')
+        response = self.client.get(reverse('patientProfiles-detail', kwargs={'pk': self.profiles[0].id}))
+        assert response.json()['supervisor_relativeType'] == 'پدر'
+
+    def test_unplanned_instance(self, setup):
+        data = serializer.PatientProfileSerializer(models.PatientProfile.objects.get(pk=self.profiles[0].pk)).data
+        assert data['supervisor_full_name'] == 'مراقب'
+        assert serializer.PatientProfileSerializer(self.profiles[1]).data['supervisor'] == ''
+
+
+@pytest.mark.django_db
+class TestQuestionSharePrefetch:
+    @pytest.fixture
+    def setup(self):
+        self.user = models.User.objects.create_user(phone_number="09355555555", first_name='علی')
+        self.doctor = models.Doctor.objects.create(user=self.user, specialyTitle='دکتر قلب')
+        clinic_group = models.ClinicGroup.objects.create(title='بیمارستان رجایی')
+        self.clinic = models.Clinic.objects.create(clinicGroup=clinic_group, agent=self.doctor, title='کلینیک دیابت')
+        alert = models.Alert.objects.create(clinic=self.clinic, title='قند بالا', description='مراجعه کنید',
+                                            reminder_number=1)
+        organ = models.Organ.objects.create(name='قلب')
+        media = models.Media.objects.create(type=models.MediaType.objects.create(title='تصویر'),
+                                            category=models.MediaCategory.objects.create(title='آموزشی'),
+                                            name='نوار قلب', source='uploads/MediaFiles/ecg.png')
+        for i in range(12):
+            question = models.QuestionShare.objects.create(doctor=self.doctor, clinic=self.clinic, title=f'سوال {i}')
+            models.QuestionOrgan.objects.create(organ=organ, questionShare=question)
+            models.QuestionShareMedia.objects.create(media=media, questionShare=question)
+            for title in ['بله', 'خیر']:
+                option = models.QuestionOption.objects.create(questionShare=question, title=title, alert=alert,
+                                                              suggestedDoctor=self.doctor, suggestedClinic=self.clinic)
+                models.QuestionOptionNumber.objects.create(questionOption=option, lower_band=0, upper_band=10)
+                models.QuestionOptionDate.objects.create(questionOption=option, lower_band=0, upper_band=10)
+                models.QuestionOptionEquation.objects.create(questionOption=option, lower_band=0, upper_band=10)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    @pytest.mark.parametrize('url_name', ['questionShares-list', 'compressedQuestionShares-list'])
+    @pytest.mark.parametrize('page_size', [1, 12])
+    def test_page_query_count(self, setup, django_assert_num_queries, url_name, page_size):
+        # count, page, options, three band tables, organs and media
+        with django_assert_num_queries(8):
+            response = self.client.get(reverse(url_name), {'page_size': page_size})
+        results = response.json()['results']
+        assert len(results) == page_size
+        option = results[0]['questionOptions_questionShare'][0]
+        assert option['suggestedDoctorName'] == 'علی' and option['alertTitle'] == 'قند بالا'
+        assert option['questionOptionNumbers'][0]['upper_band'] == 10
+        assert results[0]['questionOrgans_questionShare'][0]['organName'] == 'قلب'
+        assert results[0]['QuestionShareMedia_questionShares'][0]['media']['name'] == 'نوار قلب'
+
+    def test_sparse_fieldset_prunes_queries(self, setup, django_assert_num_queries):
+        url = reverse('questionShares-list')
+        # count and page only, without joins or prefetches
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'fields': 'id,short_title', 'getAll': 'true'})
+        assert len(queries) == 2
+        assert 'JOIN' not in queries[1]['sql'] and '"title"' not in queries[1]['sql']
+        assert set(response.json()['results'][0]) == {'id', 'short_title'}
+        # count, page and options, without the band tables
+        with django_assert_num_queries(3):
+            response = self.client.get(url, {'fields': 'id,questionOptions_questionShare.title'})
+        assert response.json()['results'][0]['questionOptions_questionShare'] == [{'title': 'بله'}, {'title': 'خیر'}]
+        with django_assert_num_queries(4):
+            response = self.client.get(url, {'omit': 'questionOptions_questionShare,doctorName'})
+        assert 'doctorName' not in response.json()['results'][0]
+        assert response.json()['results'][0]['clinicName'] == 'کلینیک دیابت'
+
+    def test_sparse_fieldset_only_columns(self, setup):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('clinics-list'), {'fields': 'id,title,agentName'})
+        assert response.json()['results'] == [{'id': self.clinic.id, 'title': 'کلینیک دیابت', 'agentName': 'علی'}]
+        page = next(query['sql'] for query in queries if 'LIMIT' in query['sql'])
+        assert '"address"' not in page and 'JOIN' not in page
+        response = self.client.get(reverse('clinics-list'), {'fields': 'id,nope'})
+        assert response.status_code == 400
+        assert response.json() == {'fields': 'Unknown fields: nope'}
+        response = self.client.post(reverse('clinics-list') + '?fields=id', {})
+        assert response.status_code == 400 and 'title' in response.json()
+
+
+@pytest.mark.django_db
+class TestValuesListFastPath:
+    @pytest.mark.parametrize('url_name,model,serializer_class,values', [
+        ('job-list', models.Job, serializer.JobSerializer, {'title': 'برنامه نویس'}),
+        ('drug-list', models.Drug, serializer.DrugSerializer, {'title': 'متفورمین'}),
+        ('relativeTypes-list', models.RelativeType, serializer.RelativeTypeSerializer, {'title': 'پدر'}),
+        ('clinicGroups-list', models.ClinicGroup, serializer.ClinicGroupSerializer, {'title': 'بیمارستان رجایی'}),
+    ])
+    def test_same_output_as_serializer(self, url_name, model, serializer_class, values):
+        instance = model.objects.create(**values)
+        client = APIClient()
+        response = client.get(reverse(url_name))
+        assert response.json()['results'] == [serializer_class(instance).data]
+        detail = client.get(reverse(url_name.replace('-list', '-detail'), kwargs={'pk': instance.pk}))
+        assert detail.json() == serializer_class(instance).data
+        assert client.get(reverse(url_name.replace('-list', '-detail'), kwargs={'pk': 0})).status_code == 404
+        assert client.get(reverse(url_name.replace('-list', '-detail'), kwargs={'pk': 'abc'})).status_code == 404
+
+    def test_object_permissions(self, monkeypatch):
+        class DenyObjects(permissions.BasePermission):
+            def has_object_permission(self, request, view, obj):
+                return False
+
+        job = models.Job.objects.create(title='برنامه نویس')
+        monkeypatch.setattr(views.JobViewset, 'permission_classes', [DenyObjects])
+        response = APIClient().get(reverse('job-detail', kwargs={'pk': job.pk}))
+        assert response.status_code in (401, 403)
+
+    def test_sparse_fieldset(self):
+        models.Job.objects.create(title='برنامه نویس')
+        response = APIClient().get(reverse('job-list'), {'fields': 'title'})
+        assert response.json()['results'] == [{'title': 'برنامه نویس'}]
+
+    def test_organs(self):
+        heart = models.Organ.objects.create(name='قلب')
+        valve = models.Organ.objects.create(name='دریچه', parent=heart)
+        response = APIClient().get(reverse('organs-list'))
+        assert response.json()['results'] == [serializer.OrganSerializer(organ).data for organ in [valve, heart]]
+
+
+@pytest.mark.django_db
+class TestExpand:
+    @pytest.fixture
+    def setup(self):
+        self.user = models.User.objects.create_user(phone_number="09355555555", first_name='علی')
+        doctor = models.Doctor.objects.create(user=self.user, specialyTitle='دکتر قلب')
+        clinic_group = models.ClinicGroup.objects.create(title='بیمارستان رجایی')
+        self.clinic = models.Clinic.objects.create(clinicGroup=clinic_group, agent=doctor, title='کلینیک دیابت')
+        self.question = models.QuestionShare.objects.create(doctor=doctor, clinic=self.clinic, title='سوال')
+        self.option = models.QuestionOption.objects.create(questionShare=self.question, title='بله')
+        models.QuestionOptionNumber.objects.create(questionOption=self.option, lower_band=0, upper_band=10)
+        self.clinic_checkup = models.ClinicCheckup.objects.create(
+            clinic=self.clinic, title='چکاپ دیابت', required_time=5, question_count=1, starting_question=self.question
+        )
+        self.patient = models.PatientProfile.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def answer(self):
+        checkup = models.Checkup.objects.create(patientProfile=self.patient, clinic=self.clinic,
+                                                clinic_checkup=self.clinic_checkup)
+        return models.QuestionAnswer.objects.create(checkup=checkup, questionShare=self.question,
+                                                    questionOption=self.option)
+
+    def get(self, params):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('questionAnswers-list'), {'getAll': 'true', **params})
+        return response, len(queries)
+
+    def test_expanded_per_page(self, setup):
+        params = {'expand': 'questionOption,checkup.clinic'}
+        self.answer()
+        _, single = self.get(params)
+        for _ in range(5):
+            self.answer()
+        response, many = self.get(params)
+        assert many == single
+        result = response.json()['results'][0]
+        assert result['questionShare'] == self.question.id
+        assert result['questionOption']['title'] == 'بله'
+        assert result['questionOption']['questionOptionNumbers'][0]['upper_band'] == 10
+        assert result['checkup']['clinic']['title'] == 'کلینیک دیابت'
+        assert result['checkup']['clinic']['agentName'] == 'علی'
+        assert result['checkup']['clinicCheckupTitle'] == 'چکاپ دیابت'
+
+    def test_expand_with_fields(self, setup):
+        self.answer()
+        response, _ = self.get({'expand': 'checkup', 'fields': 'id,checkup.title'})
+        assert set(response.json()['results'][0]) == {'id', 'checkup'}
+        assert list(response.json()['results'][0]['checkup']) == ['title']
+        response, _ = self.get({})
+        assert response.json()['results'][0]['checkup'] == models.Checkup.objects.get().id
+        response, _ = self.get({'expand': 'id'})
+        assert response.status_code == 400
+        assert response.json() == {'expand': 'id cannot be expanded'}
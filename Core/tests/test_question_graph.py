@@ -0,0 +1,392 @@
+from django.db import transaction
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIClient
+from Core import models
+from Core.questionGraph.analysis import analyze_clinic
+from Core.questionGraph.bands import BandIndex
+from Core.questionGraph.engine import get_compiled_graph, UnknownNode
+from Core.questionGraph.equation import compile_equation, compiled_equations, EquationError, parse_variables
+from Core.questionGraph.versions import get_checkup_graph, get_version_bundle, get_version_graph
+import gzip
+import json
+import pytest
+
+
+@pytest.mark.django_db
+class TestQuestionGraphEngine:
+    @pytest.fixture
+    def setup(self):
+        self.user = models.User.objects.create_user(phone_number="09355555555")
+        self.doctor = models.Doctor.objects.create(user=self.user, specialyTitle='دکتر قلب')
+        clinic_group = models.ClinicGroup.objects.create(title='بیمارستان رجایی')
+        self.clinic = models.Clinic.objects.create(clinicGroup=clinic_group, agent=self.doctor, title='کلینیک دیابت')
+        self.q1 = self.question('سوال اول')
+        self.q2 = self.question('سوال دوم')
+        self.q3 = self.question('سوال سوم')
+        self.yes = models.QuestionOption.objects.create(questionShare=self.q1, title='بله', chart_connectQstId=self.q2)
+        self.no = models.QuestionOption.objects.create(questionShare=self.q1, title='خیر', chart_connectQstId=self.q3)
+        self.q2.chart_connectQstId = self.q3
+        self.q2.save()
+        self.clinic_checkup = models.ClinicCheckup.objects.create(
+            clinic=self.clinic, title='چکاپ دیابت', required_time=5, question_count=3, starting_question=self.q1
+        )
+
+    def question(self, title):
+        return models.QuestionShare.objects.create(doctor=self.doctor, clinic=self.clinic, title=title, short_title=title)
+
+    def test_next_question(self, setup):
+        graph = get_compiled_graph(self.clinic_checkup)
+        assert len(graph) == 3
+        assert graph.next_question(self.q1.id, self.yes.id) == self.q2.id
+        assert graph.next_question(self.q1.id, self.no.id) == self.q3.id
+        assert graph.next_question(self.q2.id) == self.q3.id
+        assert graph.next_question(self.q3.id) is None
+
+    def test_unknown_option(self, setup):
+        graph = get_compiled_graph(self.clinic_checkup)
+        with pytest.raises(UnknownNode):
+            graph.next_question(self.q2.id, self.yes.id)
+
+    def test_compiled_once(self, setup, django_assert_num_queries):
+        graph = get_compiled_graph(self.clinic_checkup)
+        with django_assert_num_queries(0):
+            assert get_compiled_graph(self.clinic_checkup) is graph
+
+    def test_invalidated_on_option_change(self, setup):
+        graph = get_compiled_graph(self.clinic_checkup)
+        self.yes.chart_connectQstId = self.q3
+        self.yes.save()
+        recompiled = get_compiled_graph(self.clinic_checkup)
+        assert recompiled is not graph
+        assert recompiled.next_question(self.q1.id, self.yes.id) == self.q3.id
+        assert self.q2.id not in recompiled
+
+    def test_graph_analysis(self, setup, django_assert_num_queries):
+        orphan = self.question('سوال جدا')
+        with django_assert_num_queries(4):
+            analysis = analyze_clinic(self.clinic.id)[self.clinic_checkup.id]
+        assert (analysis.reachable_count, analysis.longest_path, analysis.cycles) == (3, 3, [])
+        assert analysis.expected_question_count == 2.5
+        self.clinic_checkup.refresh_from_db()
+        assert self.clinic_checkup.longest_path == 3
+        assert self.clinic_checkup.graph_issues['unreachable'] == [orphan.id]
+        assert not self.clinic_checkup.graph_issues['invalid_start']
+
+    def test_next_question_endpoint(self, setup):
+        client = APIClient()
+        url = reverse('clinicCheckup-next-question', kwargs={'pk': self.clinic_checkup.id})
+        response = client.get(url)
+        assert response.json() == {'question': self.q1.id, 'end': False}
+        response = client.get(url, {'question': self.q1.id, 'option': self.no.id})
+        assert response.json() == {'question': self.q3.id, 'end': False}
+        response = client.get(url, {'question': self.q3.id})
+        assert response.json() == {'question': None, 'end': True}
+        response = client.get(url, {'question': self.q3.id, 'option': self.no.id})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_evaluate_endpoint(self, setup):
+        self.yes.weight = 80
+        self.yes.save()
+        self.q3.equation = 'q%d * 2 + q99' % self.q1.id
+        self.q3.save()
+        patient = models.PatientProfile.objects.create(user=self.user)
+        checkup = models.Checkup.objects.create(patientProfile=patient, clinic=self.clinic, clinic_checkup=self.clinic_checkup)
+        models.QuestionAnswer.objects.create(checkup=checkup, questionShare=self.q1, questionOption=self.yes)
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        url = reverse('checkups-evaluate', kwargs={'pk': checkup.id})
+        response = client.post(url, {'question': self.q3.id, 'variables': {'q99': 1}}, format='json')
+        assert response.json() == {'question': self.q3.id, 'value': 161.0, 'questionOption': None}
+        response = client.post(url, {'question': self.q3.id}, format='json')
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        for variables in [['q99'], 'q99', {'q99': 'a' * 10}, {'q99': 'inf'}, {'x': 1}, {'q99': [1]}]:
+            response = client.post(url, {'question': self.q3.id, 'variables': variables}, format='json')
+            assert response.status_code == status.HTTP_400_BAD_REQUEST
+        response = client.post(url, {'question': self.q3.id, 'variables': {'q99': '1.5'}}, format='json')
+        assert response.json()['value'] == 161.5
+        self.q3.equation = '1' + '0' * 400
+        self.q3.save()
+        response = client.post(url, {'question': self.q3.id}, format='json')
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_bands_endpoint(self, setup):
+        models.QuestionOptionNumber.objects.create(questionOption=self.yes, lower_band=0, upper_band=10)
+        models.QuestionOptionNumber.objects.create(questionOption=self.no, lower_band=10, upper_band=None)
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        url = reverse('questionShares-bands', kwargs={'pk': self.q1.id})
+        assert client.get(url, {'value': 4}).json() == {'questionOption': self.yes.id}
+        assert client.get(url, {'value': 11}).json() == {'questionOption': self.no.id}
+        response = client.post(url, {'kind': 'number', 'values': [-1, 10, 500]}, format='json')
+        assert response.json() == {'questionOptions': [None, self.yes.id, self.no.id]}
+        models.QuestionOptionNumber.objects.create(questionOption=self.no, lower_band=-5, upper_band=-1)
+        assert client.get(url, {'value': -1}).json() == {'questionOption': self.no.id}
+        assert client.get(url).json()['gaps'] == [{'lower_band': -1, 'upper_band': 0}]
+
+    def test_bundle_endpoint(self, setup):
+        client = APIClient()
+        url = reverse('clinicCheckup-bundle', kwargs={'pk': self.clinic_checkup.id})
+        response = client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+        assert response.status_code == status.HTTP_200_OK
+        assert response['Content-Encoding'] == 'gzip'
+        document = json.loads(gzip.decompress(response.content))
+        assert document['start'] == self.q1.id
+        assert [question['id'] for question in document['questions']] == [self.q1.id, self.q2.id, self.q3.id]
+        assert [option['next'] for option in document['questions'][0]['options']] == [self.q2.id, self.q3.id]
+
+        etag = response['ETag']
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+        self.q3.short_title = 'سوال آخر'
+        self.q3.save()
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == status.HTTP_200_OK
+        assert json.loads(response.content)['questions'][2]['short_title'] == 'سوال آخر'
+
+    def test_bundle_follows_names(self, setup):
+        client = APIClient()
+        url = reverse('clinicCheckup-bundle', kwargs={'pk': self.clinic_checkup.id})
+        etag = client.get(url)['ETag']
+        self.user.save(update_fields=['last_login'])
+        assert client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == status.HTTP_304_NOT_MODIFIED
+        self.user.first_name = 'علی'
+        self.user.save()
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert json.loads(response.content)['questions'][0]['doctorName'] == 'علی'
+        self.clinic.title = 'کلینیک قند'
+        self.clinic.save()
+        response = client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        assert json.loads(response.content)['questions'][0]['clinicName'] == 'کلینیک قند'
+
+    def test_published_version_pinned_by_checkup(self, setup):
+        get_version_bundle.cache_clear()
+        get_version_graph.cache_clear()
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        url = reverse('clinicCheckup-publish', kwargs={'pk': self.clinic_checkup.id})
+        response = client.post(url)
+        assert response.status_code == status.HTTP_201_CREATED
+        assert response.json()['number'] == 1
+        assert client.post(url).status_code == status.HTTP_200_OK
+
+        patient = models.PatientProfile.objects.create(user=self.user)
+        checkup = models.Checkup.objects.create(patientProfile=patient, clinic=self.clinic,
+                                                clinic_checkup=self.clinic_checkup)
+        assert checkup.graph_version.number == 1
+
+        self.yes.chart_connectQstId = self.q3
+        self.yes.save()
+        assert client.post(url).json()['number'] == 2
+        graph = get_checkup_graph(checkup)
+        assert graph.next_question(self.q1.id, self.yes.id) == self.q2.id
+        assert get_checkup_graph(checkup) is graph
+        # the patient keeps moving through the pinned version, not the live graph
+        next_url = reverse('checkups-next-question', kwargs={'pk': checkup.id})
+        response = client.get(next_url, {'question': self.q1.id, 'option': self.yes.id})
+        assert response.json() == {'question': self.q2.id, 'end': False}
+        response = client.get(reverse('clinicCheckup-next-question', kwargs={'pk': self.clinic_checkup.id}),
+                              {'question': self.q1.id, 'option': self.yes.id})
+        assert response.json() == {'question': self.q3.id, 'end': False}
+
+        response = client.get(reverse('checkups-graph', kwargs={'pk': checkup.id}))
+        assert response['Cache-Control'] == 'public, max-age=31536000, immutable'
+        assert [question['id'] for question in json.loads(response.content)['questions']] == \
+            [self.q1.id, self.q2.id, self.q3.id]
+        response = client.get(reverse('clinicCheckup-version', kwargs={'pk': self.clinic_checkup.id, 'number': 2}),
+                               HTTP_ACCEPT_ENCODING='gzip')
+        assert len(json.loads(gzip.decompress(response.content))['questions']) == 2
+
+        version = checkup.graph_version
+        version.etag = 'changed'
+        with pytest.raises(ValidationError):
+            version.save()
+
+    def test_clone(self, setup, django_assert_max_num_queries):
+        self.q1.equation = 'q%d * 2' % self.q3.id
+        self.q1.save()
+        models.QuestionOptionNumber.objects.create(questionOption=self.yes, lower_band=0, upper_band=10)
+        self.question('سوال جدا')
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        url = reverse('clinicCheckup-clone', kwargs={'pk': self.clinic_checkup.id})
+        with django_assert_max_num_queries(25):
+            response = client.post(url, {'title': 'کپی'}, format='json')
+        assert response.status_code == status.HTTP_201_CREATED
+        clone = models.ClinicCheckup.objects.get(pk=response.json()['id'])
+        assert clone.title == 'کپی'
+        assert models.QuestionShare.objects.filter(clinic=self.clinic).count() == 7
+
+        graph = get_compiled_graph(clone)
+        assert len(graph) == 3 and not set(graph.question_ids) & {self.q1.id, self.q2.id, self.q3.id}
+        start = models.QuestionShare.objects.get(pk=graph.start)
+        yes, no = graph.options_of(start.id)
+        third = graph.next_question(start.id, no)
+        assert graph.next_question(graph.next_question(start.id, yes)) == third
+        assert start.equation == 'q%d * 2' % third
+        assert models.QuestionOptionNumber.objects.get(questionOption_id=yes).upper_band == 10
+
+    def test_clone_into_another_clinic(self, setup):
+        user = models.User.objects.create_user(phone_number="09355555556")
+        doctor = models.Doctor.objects.create(user=user)
+        clinic = models.Clinic.objects.create(clinicGroup=self.clinic.clinicGroup, agent=doctor, title='کلینیک قلب')
+        client = APIClient()
+        client.force_authenticate(user=user)
+        url = reverse('clinicCheckup-clone', kwargs={'pk': self.clinic_checkup.id})
+        response = client.post(url, {'clinic': clinic.id}, format='json')
+        assert response.status_code == status.HTTP_201_CREATED
+        copies = models.QuestionShare.objects.filter(clinic=clinic)
+        assert copies.count() == 3 and {question.doctor_id for question in copies} == {doctor.id}
+        assert {question.doctor_id for question in models.QuestionShare.objects.filter(clinic=self.clinic)} == {
+            self.doctor.id
+        }
+        # the cloner owns the copies
+        question_url = reverse('questionShares-detail', kwargs={'pk': copies[0].id})
+        assert client.patch(question_url, {'title': 'سوال من'}, format='json').status_code == status.HTTP_200_OK
+
+    def test_flowchart_layout_save(self, setup, django_assert_max_num_queries):
+        graph = get_compiled_graph(self.clinic_checkup)
+        nodes = [
+            {'id': self.q1.id, 'chart_is_visible': True, 'chart_global_src_x': 10.5, 'chart_global_src_y': 2,
+             'chart_connectQstId': 'null', 'chart_branchCount': 2, 'questionOptions_questionShare': [
+                 {'id': self.yes.id, 'chart_global_x': 1, 'chart_global_y': 2, 'chart_connectQstId': self.q3.id},
+                 {'id': self.no.id, 'chart_global_x': 3, 'chart_global_y': 4, 'chart_connectQstId': ''},
+             ]},
+            {'id': self.q2.id, 'chart_global_src_x': 7, 'questionOptions_questionShare': []},
+        ]
+        client = APIClient()
+        with django_assert_max_num_queries(8):
+            response = client.post(reverse('flowchart2'), json.dumps(nodes), content_type='application/json')
+        assert response.status_code == status.HTTP_200_OK
+        self.q1.refresh_from_db()
+        self.yes.refresh_from_db()
+        self.no.refresh_from_db()
+        assert (self.q1.chart_global_src_x, self.q1.chart_branchCount, self.q1.chart_is_visible) == (10.5, 2, True)
+        assert self.yes.chart_connectQstId_id == self.q3.id
+        assert self.no.chart_connectQstId_id == self.q3.id
+        assert get_compiled_graph(self.clinic_checkup) is not graph
+
+    def test_flowchart_layout_errors(self, setup):
+        nodes = [
+            {'id': self.q1.id, 'chart_global_src_x': 'left', 'questionOptions_questionShare': []},
+            {'id': self.q2.id, 'chart_connectQstId': 999999, 'questionOptions_questionShare': [
+                {'id': self.yes.id, 'chart_global_x': 5},
+            ]},
+            {'id': self.q3.id, 'chart_global_src_x': 99},
+        ]
+        response = APIClient().post(reverse('flowchart2'), json.dumps(nodes), content_type='application/json')
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        errors = response.json()['errors']
+        assert [error['id'] for error in errors] == [self.q1.id, self.q2.id]
+        assert len(errors[1]['error']) == 2
+        self.q3.refresh_from_db()
+        assert self.q3.chart_global_src_x == 0.0
+
+
+@pytest.mark.django_db(transaction=True)
+class TestGraphAnalysisOnSave:
+    def test_cycle_detected_on_save(self):
+        user = models.User.objects.create_user(phone_number="09355555555")
+        doctor = models.Doctor.objects.create(user=user, specialyTitle='دکتر قلب')
+        clinic_group = models.ClinicGroup.objects.create(title='بیمارستان رجایی')
+        clinic = models.Clinic.objects.create(clinicGroup=clinic_group, agent=doctor, title='کلینیک دیابت')
+        q1, q2 = [models.QuestionShare.objects.create(doctor=doctor, clinic=clinic, title=title)
+                  for title in ['سوال اول', 'سوال دوم']]
+        q1.chart_connectQstId = q2
+        q1.save()
+        clinic_checkup = models.ClinicCheckup.objects.create(
+            clinic=clinic, title='چکاپ دیابت', required_time=5, question_count=2, starting_question=q1
+        )
+        clinic_checkup.refresh_from_db()
+        assert (clinic_checkup.longest_path, clinic_checkup.expected_question_count) == (2, 2.0)
+
+        with transaction.atomic():
+            q2.chart_connectQstId = q1
+            q2.save()
+            q1.save()
+            assert len(transaction.get_connection().run_on_commit) == 1
+        clinic_checkup.refresh_from_db()
+        assert clinic_checkup.reachable_count == 2
+        assert clinic_checkup.longest_path is None
+        assert clinic_checkup.expected_question_count is None
+        assert clinic_checkup.graph_issues['cycles'] == [sorted([q1.id, q2.id])]
+
+
+class TestBandIndex:
+
+    def test_resolve(self):
+        index = BandIndex(1, 'number', [(10, None, 18.5), (11, 18.5, 25), (12, 25, 30), (13, 30, None)])
+        assert index.resolve(3) == 10
+        assert index.resolve(18.5) == 10
+        assert index.resolve(18.6) == 11
+        assert index.resolve(25) == 11
+        assert index.resolve(1000) == 13
+        assert index.resolve_many([17, 26, 31]) == [10, 12, 13]
+        assert not index.overlaps and not index.gaps
+
+    def test_reports_overlaps_and_gaps(self):
+        index = BandIndex(1, 'number', [(10, 0, 10), (11, 5, 20), (12, 30, 40), (13, 50, 40)])
+        assert index.overlaps == [(10, 11, 5, 10)]
+        assert index.gaps == [(20, 30)]
+        assert index.inverted == [13]
+        assert index.resolve(7) == 10
+        assert index.resolve(15) == 11
+        assert index.resolve(25) is None
+        assert index.resolve(41) is None
+
+
+class TestEquation:
+
+    def test_evaluate(self):
+        equation = compile_equation('q1 / (q2 / 100) ^ 2')
+        assert equation.variables == {'q1', 'q2'}
+        assert equation({'q1': 81, 'q2': 180}) == pytest.approx(25.0)
+        assert compile_equation('max(q3, 10) + sqrt(16)')({'q3': 2}) == 14.0
+
+    @pytest.mark.parametrize('text', [
+        "__import__('os').system('ls')",
+        'q1.__class__',
+        'lambda: 1',
+        'weight * 2',
+        '[q1 for q1 in ()]',
+        'q1 if q1 else q2',
+    ])
+    def test_rejects_unsafe_input(self, text):
+        with pytest.raises(EquationError):
+            compile_equation(text)
+
+    def test_evaluation_errors(self):
+        with pytest.raises(EquationError):
+            compile_equation('q1 / q2')({'q1': 1, 'q2': 0})
+        with pytest.raises(EquationError):
+            compile_equation('q1 + 1')({})
+        with pytest.raises(EquationError):
+            compile_equation('9 ^ 9 ^ 9')({})
+
+    @pytest.mark.parametrize('text', ['1' + '0' * 400, '-' * 2000 + '1', '-' * 100000 + '1'])
+    def test_rejects_huge_input(self, text):
+        with pytest.raises(EquationError):
+            compile_equation(text)
+
+    def test_error_messages_are_short(self):
+        with pytest.raises(EquationError) as error:
+            compile_equation('q1 * q2')({'q1': 'a' * 10, 'q2': 10 ** 7})
+        assert len(str(error.value)) < 100
+        with pytest.raises(EquationError) as error:
+            compile_equation('q1 + ' + '9' * 1000 + 'j')
+        assert len(str(error.value)) < 100
+
+    def test_parse_variables(self):
+        assert parse_variables({'q1': 2, 'q2': '3.5'}) == {'q1': 2.0, 'q2': 3.5}
+        for data in [[1], 'q1', {'q1': 'a' * 10}, {'q1': True}, {'q1': 'nan'}, {'q1': None}, {'weight': 1}]:
+            with pytest.raises(EquationError):
+                parse_variables(data)
+
+    def test_cached_by_question_and_text(self):
+        compiled_equations.clear()
+        first = compiled_equations.get(1, 'q1 + 1')
+        assert compiled_equations.get(1, 'q1 + 1') is first
+        assert compiled_equations.get(1, 'q1 + 2') is not first
+        assert compiled_equations.get(2, 'q1 + 1') is not first
@@ -0,0 +1,84 @@
+import datetime
+import decimal
+import json
+
+import msgpack
+from django.urls import reverse
+from django.utils.translation import gettext_lazy
+from rest_framework.exceptions import ErrorDetail
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from Core import models
+from Core.api.renderers import MessagePackRenderer, OrjsonRenderer
+import pytest
+
+DOCUMENT = {
+    'id': 1,
+    'title': 'کلینیک دیابت ',
+    'lat': decimal.Decimal('35.699722'),
+    'bmi': 24.5,
+    'created_on': datetime.datetime(2021, 5, 1, 8, 30, 15, 120000, tzinfo=datetime.timezone.utc),
+    'executionDate': datetime.datetime(2021, 5, 1, 8, 30, tzinfo=datetime.timezone(datetime.timedelta(hours=3.5))),
+    'birth_date': datetime.date(1990, 1, 2),
+    'message': gettext_lazy('This field is required.'),
+    'errors': {'title': [ErrorDetail('نام الزامی است', code='required')]},
+    'counts': {1: 2},
+    'results': [None, True, False, 0.1, [], {}],
+}
+
+
+def test_orjson_matches_json_renderer():
+    assert OrjsonRenderer().render(DOCUMENT) == JSONRenderer().render(DOCUMENT)
+    assert OrjsonRenderer().render(DOCUMENT, 'application/json; indent=2') == JSONRenderer().render(
+        DOCUMENT, 'application/json; indent=2'
+    )
+    assert OrjsonRenderer().render(None) == b''
+
+
+def test_orjson_falls_back_to_json_renderer():
+    document = {'big': 2 ** 70, 'small': -2 ** 64}
+    assert OrjsonRenderer().render(document) == JSONRenderer().render(document)
+    for value in [float('nan'), float('inf'), [{'bmi': -float('inf')}], decimal.Decimal('NaN')]:
+        with pytest.raises(ValueError):
+            JSONRenderer().render({'value': value})
+        with pytest.raises(ValueError):
+            OrjsonRenderer().render({'value': value})
+    assert OrjsonRenderer().render({'value': None}) == b'{"value":null}'
+
+
+def test_orjson_non_strict(monkeypatch):
+    monkeypatch.setattr(OrjsonRenderer, 'strict', False)
+    monkeypatch.setattr(JSONRenderer, 'strict', False)
+    document = {'value': float('nan'), 'other': None}
+    assert OrjsonRenderer().render(document) == JSONRenderer().render(document) == b'{"value":NaN,"other":null}'
+
+
+def test_msgpack_matches_json():
+    document = {key: value for key, value in DOCUMENT.items() if key != 'counts'}
+    assert msgpack.unpackb(MessagePackRenderer().render(document)) == json.loads(JSONRenderer().render(document))
+
+
+@pytest.mark.django_db
+class TestNegotiation:
+    @pytest.fixture
+    def setup(self):
+        user = models.User.objects.create_user(phone_number="09355555555", first_name='علی')
+        doctor = models.Doctor.objects.create(user=user, specialyTitle='دکتر قلب')
+        clinic_group = models.ClinicGroup.objects.create(title='بیمارستان رجایی')
+        clinic = models.Clinic.objects.create(clinicGroup=clinic_group, agent=doctor, title='کلینیک دیابت',
+                                              lat=decimal.Decimal('35.699722'), long=decimal.Decimal('51.337222'))
+        for i in range(3):
+            question = models.QuestionShare.objects.create(doctor=doctor, clinic=clinic, title=f'سوال {i}')
+            option = models.QuestionOption.objects.create(questionShare=question, title='بله', chart_global_x=1.5)
+            models.QuestionOptionNumber.objects.create(questionOption=option, lower_band=0.5, upper_band=10)
+        self.client = APIClient()
+        self.client.force_authenticate(user=user)
+
+    @pytest.mark.parametrize('url_name', ['questionShares-list', 'clinics-list'])
+    def test_same_document(self, setup, url_name):
+        response = self.client.get(reverse(url_name))
+        assert response['Content-Type'] == 'application/json'
+        assert response.content == JSONRenderer().render(response.data)
+        packed = self.client.get(reverse(url_name), HTTP_ACCEPT='application/msgpack')
+        assert packed['Content-Type'] == 'application/msgpack'
+        assert msgpack.unpackb(packed.content) == json.loads(response.content)
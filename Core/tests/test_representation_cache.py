@@ -0,0 +1,82 @@
+from django.core.cache import cache
+from django.urls import reverse
+from rest_framework.test import APIClient
+from Core import models
+from Core.api import serializer
+import pytest
+
+
+@pytest.mark.django_db
+class TestRepresentationCache:
+    @pytest.fixture
+    def setup(self, monkeypatch):
+        cache.clear()
+        self.clinic_group = models.ClinicGroup.objects.create(title='بیمارستان رجایی')
+        self.client = APIClient()
+        self.serialized = []
+        serialize = serializer.RepresentationCacheMixin.serialize
+
+        def counting(obj, instance):
+            self.serialized.append(instance.pk)
+            return serialize(obj, instance)
+        monkeypatch.setattr(serializer.RepresentationCacheMixin, 'serialize', counting)
+
+    def clinic(self, i):
+        user = models.User.objects.create_user(phone_number=f"0935555555{i}", first_name='دکتر', last_name=str(i))
+        doctor = models.Doctor.objects.create(user=user, specialyTitle='دکتر قلب')
+        return models.Clinic.objects.create(clinicGroup=self.clinic_group, agent=doctor, title=f'کلینیک {i}')
+
+    def results(self, **params):
+        self.serialized = []
+        return self.client.get(reverse('clinics-list'), params).json()['results']
+
+    def test_page_assembled_from_fragments(self, setup):
+        clinics = [self.clinic(i) for i in range(3)]
+        first = self.results()
+        assert sorted(self.serialized) == [clinic.id for clinic in clinics]
+        assert self.results() == first and self.serialized == []
+        added = self.clinic(3)
+        assert self.results()[0]['title'] == 'کلینیک 3'
+        assert self.serialized == [added.id]
+        assert self.results(fields='id,title')[0] == {'id': added.id, 'title': 'کلینیک 3'}
+
+    def test_invalidated_by_dependencies(self, setup):
+        clinic = self.clinic(0)
+        self.results()
+        user = clinic.agent.user
+        user.last_name = 'رضایی'
+        user.save()
+        assert self.results()[0]['agentName'] == 'دکتر رضایی'
+        self.clinic_group.title = 'بیمارستان مسیح'
+        self.clinic_group.save()
+        assert self.results()[0]['clinicGroupName'] == 'بیمارستان مسیح'
+        clinic.title = 'کلینیک قلب'
+        clinic.save()
+        assert self.results()[0]['title'] == 'کلینیک قلب'
+        assert self.serialized == [clinic.id]
+
+    def test_single_object(self, setup):
+        clinic = self.clinic(0)
+        question = models.QuestionShare.objects.create(doctor=clinic.agent, clinic=clinic, title='سوال', short_title='س')
+        clinic_checkup = models.ClinicCheckup.objects.create(clinic=clinic, title='چکاپ', required_time=5,
+                                                             question_count=1, starting_question=question)
+        data = serializer.ClinicCheckupSerializer(clinic_checkup).data
+        assert data['question_short_title'] == 'س'
+        assert serializer.ClinicCheckupSerializer(clinic_checkup).data == data
+        question.short_title = 'سوال اول'
+        question.save()
+        assert serializer.ClinicCheckupSerializer(clinic_checkup).data['question_short_title'] == 'سوال اول'
+
+    def test_invalidated_through_expansions(self, setup):
+        clinic = self.clinic(0)
+        question = models.QuestionShare.objects.create(doctor=clinic.agent, clinic=clinic, title='سوال')
+        models.ClinicCheckup.objects.create(clinic=clinic, title='چکاپ', required_time=5, question_count=1,
+                                            starting_question=question)
+        url = reverse('clinicCheckup-list')
+        assert self.client.get(url, {'expand': 'clinic'}).json()['results'][0]['clinic']['clinicGroupName'] == \
+            'بیمارستان رجایی'
+        self.clinic_group.title = 'بیمارستان مسیح'
+        self.clinic_group.save()
+        assert self.client.get(url, {'expand': 'clinic'}).json()['results'][0]['clinic']['clinicGroupName'] == \
+            'بیمارستان مسیح'
+        assert self.results()[0]['clinicGroupName'] == 'بیمارستان مسیح'
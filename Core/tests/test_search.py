@@ -0,0 +1,112 @@
+from django.core.cache import cache
+from django.core.management import call_command
+from django.urls import reverse
+from rest_framework.test import APIClient
+from Core import models
+from Core.search import index as search_index
+from Core.search.index import SearchIndex, build_search_index, get_search_index
+import pytest
+
+
+def test_ranking():
+    index = SearchIndex([
+        ('doctor', 1, [('name', 'علی'), ('name', 'قلبی'), ('specialty', 'دکتر قلب')]),
+        ('doctor', 2, [('name', 'قلب'), ('name', 'رضایی'), ('specialty', 'دکتر پوست')]),
+        ('clinic', 1, [('title', 'کلینیک قلب')]),
+    ])
+    # the name outweighs the specialty, an exact token outweighs a prefix
+    assert index.search('قلب', 'doctor') == (2, [2, 1])
+    assert index.search('قلب دکتر', 'doctor') == (2, [2, 1])
+    assert index.search('قلب رضایی', 'doctor') == (1, [2])
+    assert index.search('قلب', 'doctor', limit=1) == (2, [2])
+    assert index.search('کلین', 'clinic') == (1, [1])
+    assert index.search('کلین', 'doctor') == (0, [])
+    assert index.search('ق', 'doctor') == (0, [])
+    assert index.search('', 'doctor') == (0, [])
+
+
+def test_update():
+    documents = [
+        ('doctor', 1, [('name', 'علی'), ('name', 'قلبی'), ('specialty', 'دکتر قلب')]),
+        ('doctor', 2, [('name', 'قلب'), ('name', 'رضایی'), ('specialty', 'دکتر پوست')]),
+        ('clinic', 1, [('title', 'کلینیک قلب')]),
+    ]
+    index = SearchIndex(documents, 1)
+    changed = [('doctor', 2, [('name', 'حسن'), ('name', 'رضایی'), ('specialty', 'دکتر پوست')]),
+               ('clinic', 2, [('title', 'کلینیک ریه')])]
+    index.update({'doctor': {1, 2}, 'clinic': {2}}, changed, 2)
+    expected = SearchIndex(changed + [documents[2]])
+    assert (index.postings, index.tokens, index.sizes) == (expected.postings, expected.tokens, expected.sizes)
+    assert index.version == 2
+    assert index.search('قلب', 'doctor') == (0, [])
+    assert index.search('کلینیک', 'clinic') == (2, [1, 2])
+
+
+@pytest.mark.django_db
+class TestSearchEndpoint:
+    @pytest.fixture
+    def setup(self):
+        cache.clear()
+        clinic_group = models.ClinicGroup.objects.create(title='بیمارستان رجایی')
+        for i in range(5):
+            user = models.User.objects.create_user(phone_number=f"0935555555{i}", first_name='علی', last_name=str(i))
+            doctor = models.Doctor.objects.create(user=user, specialyTitle='دکتر قلب')
+            models.Clinic.objects.create(clinicGroup=clinic_group, agent=doctor, title=f'کلینیک قلب {i}')
+        self.client = APIClient()
+
+    def search(self, **params):
+        return self.client.get(reverse('search'), params).json()['resp']
+
+    def test_paginated(self, setup, django_assert_max_num_queries):
+        get_search_index()
+        with django_assert_max_num_queries(4):
+            results = self.search(q='قلب', page_size=2, page=2)
+        assert results['doctors_count'] == 5 and results['clinics_count'] == 5
+        assert [clinic['title'] for clinic in results['clinics']] == ['کلینیک قلب 2', 'کلینیک قلب 3']
+        assert len(results['doctors']) == 2
+        assert self.search(q='قلب 4')['clinics'][0]['title'] == 'کلینیک قلب 4'
+        assert self.search(q='ناموجود') == {'doctors': [], 'doctors_count': 0, 'clinics': [], 'clinics_count': 0}
+
+    def test_kept_up_to_date(self, setup, django_capture_on_commit_callbacks):
+        assert self.search(q='رضا')['doctors_count'] == 0
+        index = get_search_index()
+        user = models.User.objects.get(phone_number='09355555550')
+        with django_capture_on_commit_callbacks(execute=True):
+            user.last_name = 'رضایی'
+            user.save()
+        assert self.search(q='رضا')['doctors'][0]['user'] == user.id
+        with django_capture_on_commit_callbacks(execute=True):
+            models.Clinic.objects.filter(title='کلینیک قلب 0').delete()
+        assert self.search(q='قلب')['clinics_count'] == 4
+        # the writes were applied to the index of the process rather than rebuilding it
+        assert get_search_index() is index
+        assert index.postings == build_search_index().postings
+
+    def test_unindexed_fields(self, setup, django_capture_on_commit_callbacks):
+        user = models.User.objects.get(phone_number='09355555550')
+        clinic = models.Clinic.objects.first()
+        with django_capture_on_commit_callbacks() as callbacks:
+            user.save(update_fields=['last_login'])
+            clinic.save(update_fields=['address'])
+            clinic.agent.save(update_fields=['description'])
+        assert not [callback for callback in callbacks if callback.func is search_index.document_changed]
+
+    def test_too_many_changes(self, setup, monkeypatch, django_capture_on_commit_callbacks):
+        index = get_search_index()
+        monkeypatch.setattr(search_index, 'MAX_CHANGES', 1)
+        with django_capture_on_commit_callbacks(execute=True):
+            for i, clinic in enumerate(models.Clinic.objects.all()[:2]):
+                clinic.title = f'کلینیک ریه {i}'
+                clinic.save()
+        assert get_search_index() is not index
+        assert self.search(q='ریه')['clinics_count'] == 2
+
+    def test_rebuild_command(self, setup, capsys):
+        index = get_search_index()
+        call_command('rebuild_search_index')
+        output = capsys.readouterr()
+        assert 'Indexed 10 documents' in output.out
+        # the test settings have no shared cache
+        assert 'private to this process' in output.err
+        assert get_search_index() is not index
+        assert len(get_search_index()) == 10
@@ -14,6 +14,14 @@ echo "Apply database migrations"
 python manage.py makemigrations
 python manage.py migrate
 
+# Fill the normalized name columns of rows saved before them, the q filters look names up in them
+echo "Normalize search columns"
+python manage.py normalize_search_columns --missing
+
+# Create the search index and fill it on the first deploy, the q filters of the API search through it
+echo "Build the n-gram search index"
+python manage.py rebuild_ngram_index --setup --if-empty
+
 # Start server
 echo "Starting server"
 #python manage.py runserver 0.0.0.0:8000
\ No newline at end of file